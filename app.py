@@ -1,11 +1,29 @@
 import streamlit as st
-from github import Github, GithubException
+from github import Github, GithubException, GithubRetry, UnknownObjectException, RateLimitExceededException, Auth, InputGitTreeElement
 import json
+import abc
+import inspect
 import pandas as pd
 from datetime import datetime, date, timedelta, time
 import calendar
 import pytz
 import os
+import hashlib
+import base64
+import copy
+import threading
+import atexit
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
+import requests
+import uuid
+import random
+import re
+import html
+import xml.etree.ElementTree as ElementTree
+from html.parser import HTMLParser
 
 # --- LIBRARIES FOR SCRAPING ---
 from selenium import webdriver
@@ -13,6 +31,7 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
 import time as time_lib
 
@@ -26,8 +45,40 @@ st.set_page_config(
 # --- CONSTANTES ---
 FILE_PATH = "tareas.json"
 REPO_NAME = "carlosmolina55/Proyecto-Horario"
+RAMA_REPO = "main"  # Rama donde se guardan los datos (commits de la Git Data API)
 TIMEZONE = pytz.timezone("Europe/Madrid")
-HORARIO_FILE = "horario_clases.json" # Archivo local/remoto para clases scrapeadas
+HORARIO_FILE = "horario_clases.json" # Archivo local/remoto para clases scrapeadas (horario por defecto)
+URL_PORTAL_LOYOLA = "https://portales.uloyola.es/LoyolaHorario/horario.xhtml"  # LOYOLA_URL en secrets/env
+# Horario por defecto; HORARIOS_LOYOLA en secrets/env (lista de tablas TOML o JSON) define varios
+HORARIO_LOYOLA_DEFECTO = {"curso": "2025/26", "tipo": "M", "titu": "2175", "campus": "2", "ncurso": "1", "grupo": "A"}
+CAMPOS_HORARIO_LOYOLA = ("curso", "tipo", "titu", "campus", "ncurso", "grupo")
+SEMANAS_HORARIO = 12  # Semanas que se descargan desde la actual
+HORARIO_ESTADO_FILE = "horario_clases.estado.json"  # Hash y fecha de descarga de cada semana (horario por defecto)
+SEMANAS_VOLATILES = 2  # Semanas desde la actual que se vuelven a descargar siempre (SEMANAS_VOLATILES en secrets/env)
+CADUCIDAD_SEMANA = timedelta(days=3)  # El resto se descarga de nuevo si su copia es más vieja que esto
+DESFASE_HORARIO_LOYOLA = timedelta(hours=1)  # Corrección para horas sin zona (la web las pinta una hora antes)
+# Máximo de segundos que el navegador espera cada condición (se cambian con ESPERA_<CLAVE> en secrets/env)
+ESPERAS_SCRAPER = {"carga": 15, "cambio_semana": 10, "eventos": 5, "cookies": 3, "tabla": 10}
+EVENTOS_ESTABLES_DURANTE = 0.4  # Segundos sin cambios en el número de eventos para darlos por cargados
+HORARIO_DINAMICO_FILE = "horario.json"
+CACHE_GITHUB_TTL = 30  # Segundos que se sirve la caché sin revalidar contra GitHub
+DEBOUNCE_ESCRITURA = 3.0  # Segundos sin cambios antes de subir el lote a GitHub
+MAX_REINTENTOS_ESCRITURA = 4
+TIMEOUT_GITHUB = 10  # Segundos por petición antes de darla por perdida
+SIN_RED_ESPERA = 30  # Tras un fallo de red, segundos en modo local antes de volver a intentar GitHub
+RESPALDO_SNAPSHOT_FILE = "autogestor.snapshot.json"  # Último estado bueno de cada colección
+RESPALDO_WAL_FILE = "autogestor.wal.jsonl"  # Cambios aún no confirmados en GitHub
+ESPERA_MAX_CUOTA = 10  # Segundos que PyGithub puede esperar a que se reponga la cuota; más allá falla y actúa el backoff
+MAX_FACTOR_BACKOFF = 8  # Cuánto se pueden estirar TTL y ventana de escritura cuando queda poca cuota
+UMBRAL_COMPACTACION_DIARIO = 50  # Registros en el diario antes de plegarlo en el snapshot
+
+# Colecciones persistidas: nombre -> archivo en GitHub y campo de fecha final
+ARCHIVOS_COLECCION = {"tareas": FILE_PATH, "horario": HORARIO_DINAMICO_FILE}
+CAMPO_FECHA_FIN = {"tareas": "fecha_fin", "horario": "fecha_fin_evento"}
+ARCHIVOS_DIARIO = {"tareas": "tareas.diario.jsonl", "horario": "horario.diario.jsonl"}
+CARPETA_HISTORICO = "archive"  # Tareas archivadas, un archivo por mes: archive/YYYY-MM.json
+MARCAS_FILE = "marcas.json"  # Marcas persistentes [{"id": clave, "valor": ...}] (p. ej. última limpieza)
+MARCA_LIMPIEZA = "ultima_limpieza"
 
 def get_madrid_time():
     return datetime.now(TIMEZONE)
@@ -121,16 +172,322 @@ def hex_to_rgba(hex_color, alpha=0.15):
 
 # --- FUNCIONES DE SCRAPING (LOYOLA) ---
 
-def init_driver():
-    """Inicializa y devuelve una instancia de Chrome Driver"""
-    options = webdriver.ChromeOptions()
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--window-size=1920,1080')
-    
-    service = None
+# --- HORARIO LOYOLA POR HTTP (SIN NAVEGADOR) ---
+# La página es JSF/PrimeFaces: el calendario (p:schedule, FullCalendar) pide sus eventos con un
+# POST AJAX parcial al propio .xhtml y recibe un <partial-response> con JSON dentro.
+
+class HorarioHttpError(Exception):
+    """La página o la respuesta no tienen la forma esperada."""
+
+_RE_INPUT_VIEWSTATE = re.compile(r'<input[^>]*name="((?:javax|jakarta)\.faces\.ViewState)"[^>]*>')
+_RE_VALUE = re.compile(r'\bvalue="([^"]*)"')
+_RE_WIDGET_SCHEDULE = re.compile(r'PrimeFaces\.cw\(\s*["\']Schedule["\']\s*,\s*["\'][^"\']*["\']\s*,\s*\{\s*id\s*:\s*["\']([^"\']+)["\']')
+_RE_VERSION_PRIMEFACES = re.compile(r'ln=primefaces(?:&amp;|&)v=(\d+)')
+_RE_AULA = re.compile(r'\s*Aula:\s*', re.IGNORECASE)
+
+def partir_titulo_loyola(texto):
+    """'Asignatura / Aula: X' -> ('Asignatura', 'X')."""
+    partes = texto.split("/")
+    asig = partes[0].strip()
+    aula = _RE_AULA.sub("", partes[1]).strip() if len(partes) > 1 else "Desconocido"
+    return asig, aula
+
+def _formulario_schedule(pagina, url):
+    """(url del POST, id del formulario, id del schedule, nombre y valor del ViewState, versión de PrimeFaces)."""
+    m_schedule = _RE_WIDGET_SCHEDULE.search(pagina)
+    m_viewstate = _RE_INPUT_VIEWSTATE.search(pagina)
+    if not m_schedule or not m_viewstate:
+        raise HorarioHttpError("No se encontró el calendario o el ViewState en la página")
+    id_schedule = m_schedule.group(1)
+    m_valor = _RE_VALUE.search(m_viewstate.group(0))
+    viewstate = html.unescape(m_valor.group(1)) if m_valor else ""
+
+    id_form = id_schedule.rsplit(":", 1)[0] if ":" in id_schedule else None
+    m_form = re.search(r'<form\b[^>]*\bid="%s"[^>]*>' % re.escape(id_form), pagina) if id_form else None
+    if not m_form:
+        m_form = re.search(r'<form\b[^>]*>', pagina)
+        m_id = re.search(r'\bid="([^"]*)"', m_form.group(0)) if m_form else None
+        id_form = m_id.group(1) if m_id else None
+    m_action = re.search(r'\baction="([^"]*)"', m_form.group(0)) if m_form else None
+    url_post = requests.compat.urljoin(url, html.unescape(m_action.group(1))) if m_action else url
+
+    m_version = _RE_VERSION_PRIMEFACES.search(pagina)
+    version = int(m_version.group(1)) if m_version else 10
+    return url_post, id_form, id_schedule, m_viewstate.group(1), viewstate, version
+
+def _eventos_de_respuesta(xml_texto, id_schedule=None):
+    """
+    Extrae la lista 'events' del <update> del schedule en una respuesta parcial de JSF
+    (sin id_schedule, del primer <update> que trae eventos: para capturas guardadas).
+    """
+    try:
+        raiz = ElementTree.fromstring(xml_texto)
+    except ElementTree.ParseError as e:
+        raise HorarioHttpError(f"Respuesta AJAX no válida: {e}")
+    for nodo in raiz.iter():
+        if nodo.tag == "update" and nodo.get("id") == id_schedule:
+            return json.loads(nodo.text or "{}").get("events", [])
+        if nodo.tag == "update" and id_schedule is None and (nodo.text or "").lstrip().startswith("{"):
+            try:
+                return json.loads(nodo.text)["events"]
+            except (ValueError, KeyError):
+                pass
+        if nodo.tag in ("error", "redirect"):
+            raise HorarioHttpError(f"El servidor respondió <{nodo.tag}> (¿sesión caducada?)")
+    raise HorarioHttpError("La respuesta no incluye los eventos del calendario")
+
+def _hora_loyola(valor):
+    """ISO de FullCalendar -> datetime local de Madrid. Sin zona, se aplica DESFASE_HORARIO_LOYOLA."""
+    momento = datetime.fromisoformat(valor.replace("Z", "+00:00"))
+    if momento.tzinfo is None:
+        return momento + DESFASE_HORARIO_LOYOLA
+    return momento.astimezone(TIMEZONE).replace(tzinfo=None)
+
+def clases_desde_eventos(eventos):
+    """Eventos JSON de FullCalendar -> registros de horario_clases.json."""
+    clases = []
+    for ev in eventos:
+        try:
+            inicio = _hora_loyola(ev['start'])
+            fin = _hora_loyola(ev['end']) if ev.get('end') else None
+        except (KeyError, ValueError, TypeError):
+            continue
+        asig, aula = partir_titulo_loyola(ev.get('title', ''))
+        dia_completo = bool(ev.get('allDay'))
+        clases.append({
+            "asignatura": asig,
+            "titulo": asig,
+            "aula": aula,
+            "fecha": inicio.strftime("%Y-%m-%d"),
+            "hora": None if dia_completo else f"{inicio:%H:%M} - {(fin or inicio):%H:%M}",
+            "dia_completo": dia_completo,
+        })
+    clases.sort(key=lambda c: (c['fecha'], c['hora'] or ""))
+    return clases
+
+# --- PARSER DEL HORARIO (HTML, JSON Y AJAX; SIN NAVEGADOR) ---
+# Fase de parseo separada de la descarga: las mismas funciones sirven para lo que llega en vivo,
+# para capturas guardadas (CAPTURAS_HORARIO) y para herramientas/parsear_horario.py
+
+_RE_HORAS = re.compile(r"(\d{1,2}:\d{2})\s*[-–]\s*(\d{1,2}:\d{2})")
+_RE_LINEAS = re.compile(r"\s*\n\s*")
+_ETIQUETAS_VACIAS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"))
+
+def _desplazar_horas(hora_text):
+    """'08:00 - 09:30' -> '09:00 - 10:30' (DESFASE_HORARIO_LOYOLA). Si no se entiende, se deja igual."""
+    m = _RE_HORAS.search(hora_text or "")
+    if not m:
+        return hora_text
+    inicio, fin = (datetime.strptime(h, "%H:%M") + DESFASE_HORARIO_LOYOLA for h in m.groups())
+    return f"{inicio:%H:%M} - {fin:%H:%M}"
+
+def _clase_desde_textos(fecha, hora_text, content_text, texto=""):
+    """Registro de horario_clases.json a partir de los textos de un evento pintado por FullCalendar."""
+    if hora_text is None or content_text is None:
+        lines = _RE_LINEAS.split((texto or "").strip())
+        hora_text = lines[0] if lines else ""
+        content_text = lines[1] if len(lines) > 1 else ""
+    asig, aula = partir_titulo_loyola(content_text)
+    return {
+        "asignatura": asig,
+        "titulo": asig,
+        "aula": aula,
+        "fecha": fecha,
+        "hora": _desplazar_horas(hora_text),
+        "dia_completo": False
+    }
+
+def clases_desde_dom(semana):
+    """JSON devuelto por _JS_EXTRAER_SEMANA -> registros de horario_clases.json (fecha según la columna del evento)."""
+    datos = json.loads(semana) if isinstance(semana, str) else semana
+    columnas = datos.get('columnas', [])
+    clases = []
+    for ev in datos.get('eventos', []):
+        centro = ev['x'] + ev['ancho'] / 2
+        fecha_clase = next((c['fecha'] for c in columnas if c['x'] <= centro <= c['x'] + c['ancho']), None)
+        if not fecha_clase: continue
+        clases.append(_clase_desde_textos(fecha_clase, ev.get('hora'), ev.get('titulo'), ev.get('texto')))
+    return clases
+
+class _ParserCalendarioHtml(HTMLParser):
+    """
+    Recorre el HTML ya pintado por FullCalendar. Cada .fc-event toma la fecha del data-date de la
+    columna (o celda) que lo contiene, así que no hacen falta posiciones en pantalla.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pila = []  # [(etiqueta, fecha, papel)]; papel: 'evento', 'hora', 'titulo' o None
+        self.actual = None
+        self.eventos = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _ETIQUETAS_VACIAS:
+            return
+        atributos = dict(attrs)
+        clases = (atributos.get("class") or "").split()
+        padre = self.pila[-1] if self.pila else (None, None, None)
+        fecha = atributos.get("data-date") or padre[1]
+        papel = padre[2] if padre[2] in ("hora", "titulo") else None
+        if self.actual is None and "fc-event" in clases:
+            self.actual = {"fecha": fecha, "hora": [], "titulo": [], "texto": []}
+            papel = "evento"
+        elif self.actual is not None and "fc-event-time" in clases:
+            papel = "hora"
+        elif self.actual is not None and "fc-event-title" in clases:
+            papel = "titulo"
+        self.pila.append((tag, fecha, papel))
+
+    def handle_endtag(self, tag):
+        if not any(t == tag for t, _, _ in self.pila):
+            return  # Cierre suelto: HTML mal formado
+        while self.pila:
+            etiqueta, _, papel = self.pila.pop()
+            if papel == "evento":
+                self._cerrar_evento()
+            if etiqueta == tag:
+                break
+
+    def handle_data(self, data):
+        if self.actual is None or not data.strip():
+            return
+        self.actual["texto"].append(data.strip())
+        papel = self.pila[-1][2] if self.pila else None
+        if papel in ("hora", "titulo"):
+            self.actual[papel].append(data.strip())
+
+    def _cerrar_evento(self):
+        ev, self.actual = self.actual, None
+        self.eventos.append({
+            "fecha": ev["fecha"],
+            "hora": " ".join(ev["hora"]) if ev["hora"] else None,
+            "titulo": " ".join(ev["titulo"]) if ev["titulo"] else None,
+            "texto": "\n".join(ev["texto"]),
+        })
+
+def clases_desde_html(html_texto):
+    """HTML renderizado del calendario (page_source o 'Guardar página') -> registros de horario_clases.json."""
+    parser = _ParserCalendarioHtml()
+    parser.feed(html_texto)
+    parser.close()
+    return [_clase_desde_textos(ev["fecha"], ev["hora"], ev["titulo"], ev["texto"])
+            for ev in parser.eventos if ev["fecha"]]
+
+def parsear_horario(contenido):
+    """
+    Clases de cualquier captura del horario, según su formato: respuesta AJAX de JSF,
+    JSON de FullCalendar ({'events': [...]} o lista), JSON de _JS_EXTRAER_SEMANA o HTML renderizado.
+    """
+    texto = contenido.lstrip()
+    if texto.startswith("<?xml") or texto.startswith("<partial-response"):
+        return clases_desde_eventos(_eventos_de_respuesta(texto))
+    if texto[:1] in ("{", "["):
+        datos = json.loads(texto)
+        if isinstance(datos, dict) and "columnas" in datos:
+            return clases_desde_dom(datos)
+        return clases_desde_eventos(datos.get("events", []) if isinstance(datos, dict) else datos)
+    return clases_desde_html(texto)
+
+def guardar_captura(prefijo, nombre, contenido):
+    """Guarda la respuesta en bruto en CAPTURAS_HORARIO (si está configurada) para poder re-parsearla."""
+    carpeta = obtener_config("CAPTURAS_HORARIO")
+    if not carpeta:
+        return
+    try:
+        os.makedirs(carpeta, exist_ok=True)
+        _escribir_atomico(os.path.join(carpeta, f"{prefijo}_{nombre}"), contenido)
+    except OSError:
+        pass  # Las capturas son opcionales: no deben romper la descarga
+
+def lunes_de(fecha):
+    """Lunes de la semana de una fecha (date o 'YYYY-MM-DD')."""
+    if isinstance(fecha, str):
+        fecha = date.fromisoformat(fecha)
+    return fecha - timedelta(days=fecha.weekday())
+
+def agrupar_por_semana(clases):
+    """{lunes: [clases]} según la fecha de cada clase."""
+    semanas = {}
+    for c in clases:
+        semanas.setdefault(lunes_de(c['fecha']), []).append(c)
+    return semanas
+
+def descargar_semanas_http(url, semanas, sesion=None, timeout=15, captura=None):
+    """
+    Descarga sin navegador las semanas pedidas (lista de lunes): GET de la página (cookie de sesión
+    + ViewState) y un POST AJAX por cada tramo de semanas seguidas, como hace el calendario al
+    cambiar de vista. Devuelve (id del schedule, [(desde, hasta, XML de la respuesta)]), sin parsear.
+    Con captura, guarda cada respuesta en bruto. Lanza HorarioHttpError si la página no tiene la
+    forma esperada.
+    """
+    sesion = sesion or requests.Session()
+    respuesta = sesion.get(url, timeout=timeout)
+    sumar_trafico(peticiones=1, bytes_=len(respuesta.content))
+    respuesta.raise_for_status()
+    url_post, id_form, id_schedule, campo_viewstate, viewstate, version = _formulario_schedule(respuesta.text, url)
+    cabeceras = {"Faces-Request": "partial/ajax", "X-Requested-With": "XMLHttpRequest"}
+
+    tramos = []  # [(desde, hasta)] con las semanas consecutivas juntas
+    for lunes in sorted(set(semanas)):
+        if tramos and tramos[-1][1] == lunes:
+            tramos[-1] = (tramos[-1][0], lunes + timedelta(weeks=1))
+        else:
+            tramos.append((lunes, lunes + timedelta(weeks=1)))
+
+    respuestas = []
+    for desde, hasta in tramos:
+        if version >= 10:  # PrimeFaces 10+ manda fechas ISO; antes, milisegundos desde epoch
+            inicio, fin = f"{desde}T00:00:00", f"{hasta}T00:00:00"
+        else:
+            inicio = str(int(TIMEZONE.localize(datetime.combine(desde, time.min)).timestamp() * 1000))
+            fin = str(int(TIMEZONE.localize(datetime.combine(hasta, time.min)).timestamp() * 1000))
+        datos = {
+            "javax.faces.partial.ajax": "true",
+            "javax.faces.source": id_schedule,
+            "javax.faces.partial.execute": id_schedule,
+            "javax.faces.partial.render": id_schedule,
+            id_schedule: id_schedule,
+            f"{id_schedule}_event": "true",
+            f"{id_schedule}_start": inicio,
+            f"{id_schedule}_end": fin,
+            campo_viewstate: viewstate,
+        }
+        if id_form:
+            datos[id_form] = id_form
+        respuesta = sesion.post(url_post, data=datos, headers=cabeceras, timeout=timeout)
+        sumar_trafico(peticiones=1, bytes_=len(respuesta.content))
+        respuesta.raise_for_status()
+        if captura:
+            guardar_captura(captura, f"{desde}_{hasta}.xml", respuesta.text)
+        respuestas.append((desde, hasta, respuesta.text))
+    return id_schedule, respuestas
+
+def semanas_desde_respuestas(semanas, id_schedule, respuestas):
+    """Respuestas de descargar_semanas_http -> {lunes: [clases]} con todas las semanas pedidas (vacías incluidas)."""
+    clases = [c for _, _, xml_texto in respuestas
+              for c in clases_desde_eventos(_eventos_de_respuesta(xml_texto, id_schedule))]
+    por_semana = agrupar_por_semana(clases)
+    return {lunes: por_semana.get(lunes, []) for lunes in semanas}
+
+def obtener_semanas_http(url, semanas, sesion=None, timeout=15, captura=None):
+    """
+    Descarga (descargar_semanas_http) y parsea las semanas pedidas. Devuelve {lunes: [clases]}
+    con todas las semanas pedidas (vacías incluidas). Con captura, guarda cada respuesta en bruto.
+    """
+    return semanas_desde_respuestas(semanas, *descargar_semanas_http(url, semanas, sesion, timeout, captura))
+
+def obtener_clases_http(url, desde=None, semanas=SEMANAS_HORARIO, sesion=None, timeout=15):
+    """Todas las clases de `semanas` semanas desde el lunes `desde` (por defecto, el de esta semana)."""
+    desde = lunes_de(desde or get_madrid_date())
+    por_semana = obtener_semanas_http(url, [desde + timedelta(weeks=i) for i in range(semanas)], sesion, timeout)
+    return [c for lunes in sorted(por_semana) for c in por_semana[lunes]]
+
+class NavegadorError(Exception):
+    """No se pudo arrancar Chrome para scrapear."""
+
+@st.cache_resource(show_spinner=False)
+def _rutas_chrome():
+    """(chromedriver, binario de Chromium o None). Se resuelve una vez por proceso: la descarga de webdriver-manager es lenta."""
     # Detección de entorno (Linux/Cloud vs Local)
     possible_paths = [
         "/usr/bin/chromedriver",
@@ -145,375 +502,2482 @@ def init_driver():
             break
     
     if system_driver_path:
-        service = Service(system_driver_path)
+        binario = None
         if os.path.exists("/usr/bin/chromium"):
-            options.binary_location = "/usr/bin/chromium"
+            binario = "/usr/bin/chromium"
         elif os.path.exists("/usr/bin/chromium-browser"):
-            options.binary_location = "/usr/bin/chromium-browser"
-    else:
+            binario = "/usr/bin/chromium-browser"
+        return system_driver_path, binario
+    try:
+        return ChromeDriverManager().install(), None
+    except: 
+        return None, None
+
+# Recursos que el scraper no necesita: imágenes, vídeo, fuentes, analítica y banners de cookies
+URLS_BLOQUEADAS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.m3u8", "*.mp3",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*googlesyndication.com*",
+    "*facebook.net*", "*connect.facebook*", "*hotjar.com*", "*scorecardresearch.com*", "*chartbeat*",
+    "*onetrust.com*", "*cookielaw.org*", "*cookiebot.com*", "*didomi.io*", "*adsystem*",
+]
+
+def bloqueo_recursos_activo():
+    """BLOQUEAR_RECURSOS=0 en secrets/env desactiva el bloqueo (para comparar con el perfil completo)."""
+    return str(obtener_config("BLOQUEAR_RECURSOS", "1")).lower() not in ("0", "false", "no")
+
+def init_driver():
+    """Inicializa y devuelve una instancia de Chrome Driver (perfil ligero: sin imágenes, fuentes ni rastreadores)"""
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--window-size=1920,1080')
+    # get() vuelve con el DOM listo, sin esperar a imágenes ni iframes: los scrapers esperan
+    # explícitamente a lo que necesitan (ver ESPERAS DEL NAVEGADOR)
+    options.page_load_strategy = 'eager'
+    # Registro de red para medir peticiones y bytes de cada scrape (trafico_navegador)
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    bloquear = bloqueo_recursos_activo()
+    if bloquear:
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    
+    ruta_driver, binario = _rutas_chrome()
+    if not ruta_driver:
+        return None
+    if binario:
+        options.binary_location = binario
+        
+    driver = webdriver.Chrome(service=Service(ruta_driver), options=options)
+    if bloquear:
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": URLS_BLOQUEADAS})
+        except Exception:
+            pass  # Sin CDP (otro navegador): funciona igual, solo que descarga más
+    return driver
+
+# --- MÉTRICAS DEL SCRAPER ---
+# Cada fuente se descarga en su propio hilo (actualizar_fuentes), así que se acumulan por hilo
+
+_metricas_local = threading.local()
+
+def metricas_scraper(reiniciar=False):
+    """Métricas del hilo actual desde el último reinicio: peticiones, bloqueadas, bytes (y 'cambios' si los hay)."""
+    if reiniciar or not hasattr(_metricas_local, "datos"):
+        _metricas_local.datos = {"peticiones": 0, "bloqueadas": 0, "bytes": 0}
+    return _metricas_local.datos
+
+def sumar_trafico(peticiones=0, bloqueadas=0, bytes_=0):
+    datos = metricas_scraper()
+    datos["peticiones"] += peticiones
+    datos["bloqueadas"] += bloqueadas
+    datos["bytes"] += bytes_
+
+def trafico_navegador(driver):
+    """Vacía el registro de red del navegador y devuelve (peticiones, bloqueadas, bytes descargados)."""
+    peticiones = bloqueadas = bytes_ = 0
+    try:
+        entradas = driver.get_log("performance")
+    except Exception:
+        return 0, 0, 0
+    for entrada in entradas:
         try:
-            service = Service(ChromeDriverManager().install())
+            mensaje = json.loads(entrada["message"])["message"]
+        except (KeyError, ValueError, TypeError):
+            continue
+        metodo, params = mensaje.get("method"), mensaje.get("params", {})
+        if metodo == "Network.requestWillBeSent":
+            peticiones += 1
+        elif metodo == "Network.loadingFinished":
+            bytes_ += int(params.get("encodedDataLength") or 0)
+        elif metodo == "Network.loadingFailed" and params.get("blockedReason"):
+            bloqueadas += 1
+    return peticiones, bloqueadas, bytes_
+
+# --- POOL DE NAVEGADORES ---
+# Chrome headless compartidos por todo el proceso (todas las sesiones y reruns): arrancar uno
+# cuesta segundos, así que se reutilizan entre actualizaciones y se reciclan para acotar la memoria.
+
+MAX_NAVEGADORES = 2              # Abiertos a la vez como mucho (uno por fuente en paralelo)
+USOS_MAX_NAVEGADOR = 25          # Se cierra y se abre otro tras N usos...
+MEMORIA_MAX_NAVEGADOR_MB = 700   # ...o si chromedriver + Chrome pasan de esta memoria (RSS)
+ESPERA_NAVEGADOR_LIBRE = 120     # Segundos que un scraper espera a que otro suelte un navegador
+
+def memoria_navegador_mb(driver):
+    """RSS en MB de chromedriver y todos sus procesos hijos, leída de /proc. None si no se puede medir."""
+    try:
+        raiz = driver.service.process.pid
+        hijos = {}
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit(): continue
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                hijos.setdefault(ppid, []).append(int(pid))
+            except (OSError, ValueError, IndexError): pass
+    except (AttributeError, OSError):
+        return None
+
+    total_kb, pendientes = 0, [raiz]
+    while pendientes:
+        pid = pendientes.pop()
+        pendientes.extend(hijos.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                total_kb += next((int(l.split()[1]) for l in f if l.startswith("VmRSS:")), 0)
+        except OSError: pass
+    return total_kb / 1024
+
+class PoolNavegadores:
+    """
+    Navegadores que se crean al pedirlos (nunca más de `maximo`), se comprueban antes de
+    prestarlos y se reciclan tras `usos_max` usos o si su memoria pasa de `memoria_max_mb`.
+    """
+
+    def __init__(self, crear=None, maximo=MAX_NAVEGADORES, usos_max=USOS_MAX_NAVEGADOR,
+                 memoria_max_mb=MEMORIA_MAX_NAVEGADOR_MB):
+        self.crear = crear or init_driver
+        self.maximo = maximo
+        self.usos_max = usos_max
+        self.memoria_max_mb = memoria_max_mb
+        self.cond = threading.Condition()
+        self.libres = []  # [(driver, usos)]
+        self.abiertos = 0  # Libres + prestados + arrancando
+        self.cerrado = False
+        self.creados = 0
+        self.reciclados = 0
+
+    @contextlib.contextmanager
+    def prestar(self, espera=ESPERA_NAVEGADOR_LIBRE):
+        """Presta un navegador sano para el bloque y lo devuelve (o lo recicla) al salir."""
+        driver, usos = self._tomar(espera)
+        correcto = False
+        try:
+            yield driver
+            correcto = True
+        finally:
+            self._devolver(driver, usos + 1, correcto)
+
+    def _tomar(self, espera):
+        limite = time_lib.monotonic() + espera
+        while True:
+            with self.cond:
+                while not self.libres and self.abiertos >= self.maximo and not self.cerrado:
+                    restante = limite - time_lib.monotonic()
+                    if restante <= 0:
+                        raise NavegadorError("No hay navegadores libres (todos ocupados).")
+                    self.cond.wait(restante)
+                if self.cerrado:
+                    raise NavegadorError("El pool de navegadores está cerrado.")
+                if self.libres:
+                    driver, usos = self.libres.pop()
+                else:
+                    self.abiertos += 1  # Se reserva el hueco antes de arrancar Chrome fuera del lock
+                    driver, usos = None, 0
+
+            if driver is None:
+                try:
+                    driver = self.crear()
+                except Exception:
+                    driver = None
+                if driver is None:
+                    self._descartar(None)
+                    raise NavegadorError("No se pudo iniciar el driver de Chrome.")
+                with self.cond:
+                    self.creados += 1
+                return driver, 0
+            if self._sano(driver):
+                return driver, usos
+            self._descartar(driver)  # Colgado o muerto: se cierra y se prueba con otro
+
+    def _devolver(self, driver, usos, correcto):
+        peticiones, bloqueadas, bytes_ = trafico_navegador(driver)
+        sumar_trafico(peticiones, bloqueadas, bytes_)
+        # Tras un fallo del scraper, el navegador puede haberse quedado colgado
+        reciclar = usos >= self.usos_max or not (correcto or self._sano(driver))
+        if not reciclar:
+            memoria = memoria_navegador_mb(driver)
+            reciclar = memoria is not None and memoria > self.memoria_max_mb
+        if not reciclar:
+            try:  # Sin cookies ni página de la fuente anterior
+                driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+                driver.get("about:blank")
+            except Exception:
+                reciclar = True
+        if reciclar:
+            with self.cond:
+                self.reciclados += 1
+            self._descartar(driver)
+            return
+        with self.cond:
+            if not self.cerrado:
+                self.libres.append((driver, usos))
+                self.cond.notify()
+                return
+        self._descartar(driver)
+
+    def _sano(self, driver):
+        try:
+            return driver.execute_script("return document.readyState") is not None
+        except Exception:
+            return False
+
+    def _descartar(self, driver):
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        with self.cond:
+            self.abiertos -= 1
+            self.cond.notify()
+
+    def cerrar(self):
+        """Cierra los navegadores libres; los prestados se cierran al devolverse."""
+        with self.cond:
+            self.cerrado = True
+            libres, self.libres = self.libres, []
+            self.cond.notify_all()
+        for driver, _ in libres:
+            self._descartar(driver)
+
+    def estado(self):
+        with self.cond:
+            return {"abiertos": self.abiertos, "libres": len(self.libres),
+                    "creados": self.creados, "reciclados": self.reciclados}
+
+@st.cache_resource(show_spinner=False)
+def pool_navegadores():
+    """Pool único por proceso, compartido por todas las sesiones."""
+    pool = PoolNavegadores()
+    atexit.register(pool.cerrar)
+    return pool
+
+# --- HORARIOS LOYOLA (VARIAS TITULACIONES / CURSOS / GRUPOS) ---
+
+def horarios_loyola():
+    """Horarios configurados (HORARIOS_LOYOLA), cada uno con los campos de CAMPOS_HORARIO_LOYOLA y 'nombre' opcional."""
+    config = obtener_config("HORARIOS_LOYOLA")
+    if isinstance(config, str):
+        try:
+            config = json.loads(config)
+        except ValueError:
+            config = None
+    horarios = []
+    for h in config or []:
+        try:
+            spec = {campo: str(h[campo]) for campo in CAMPOS_HORARIO_LOYOLA}
+        except (KeyError, TypeError):
+            continue  # Incompleto: se ignora
+        if h.get("nombre"):
+            spec["nombre"] = str(h["nombre"])
+        horarios.append(spec)
+    return horarios or [dict(HORARIO_LOYOLA_DEFECTO)]
+
+def id_horario(spec):
+    """Identificador estable para nombres de archivo: '2025-26_M_2175_2_1_A'."""
+    return "_".join(re.sub(r"[^A-Za-z0-9]+", "-", str(spec[campo])) for campo in CAMPOS_HORARIO_LOYOLA)
+
+def nombre_horario(spec):
+    return spec.get("nombre") or f"{spec['titu']} {spec['ncurso']}º{spec['grupo']}"
+
+def archivos_horario(spec):
+    """(datos, estado) en disco de un horario; el de por defecto conserva los nombres de siempre."""
+    if all(str(spec[c]) == HORARIO_LOYOLA_DEFECTO[c] for c in CAMPOS_HORARIO_LOYOLA):
+        return HORARIO_FILE, HORARIO_ESTADO_FILE
+    base = f"horario_clases_{id_horario(spec)}"
+    return f"{base}.json", f"{base}.estado.json"
+
+def url_horario(spec):
+    base = str(obtener_config("LOYOLA_URL", URL_PORTAL_LOYOLA)).split("?")[0]
+    return f"{base}?{requests.compat.urlencode({campo: spec[campo] for campo in CAMPOS_HORARIO_LOYOLA})}"
+
+@st.cache_resource(show_spinner=False)
+def _adaptador_http():
+    """Pool de conexiones compartido por las sesiones HTTP de todos los horarios (cada uno con sus cookies)."""
+    return requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+
+def sesion_http():
+    sesion = requests.Session()
+    adaptador = _adaptador_http()
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+def superponer_horarios(horarios):
+    """
+    Junta los horarios elegidos ([(spec, clases)]): las clases compartidas entre grupos
+    (misma fecha, hora, asignatura y aula) salen una sola vez, con 'grupos' indicando de quién son.
+    Si se superponen varios, las no compartidas por todos llevan el grupo en el título.
+    """
+    unidas = {}
+    for spec, clases in horarios:
+        for c in clases:
+            clave = (c['fecha'], c.get('hora') or "", c['asignatura'], c.get('aula'))
+            if clave not in unidas:
+                unidas[clave] = dict(c, grupos=[])
+            if nombre_horario(spec) not in unidas[clave]['grupos']:
+                unidas[clave]['grupos'].append(nombre_horario(spec))
+    if len(horarios) > 1:
+        for c in unidas.values():
+            if len(c['grupos']) < len(horarios):
+                c['titulo'] = f"{c['asignatura']} ({', '.join(c['grupos'])})"
+    return sorted(unidas.values(), key=lambda c: (c['fecha'], c.get('hora') or ""))
+
+def hash_semana(clases):
+    """Huella del contenido de una semana (no depende del orden de las clases)."""
+    texto = json.dumps(sorted(clases, key=lambda c: json.dumps(c, sort_keys=True)), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+def _clave_clase(c):
+    return (c['fecha'], c.get('hora') or "", c['asignatura'])
+
+def diferencias_horario(anteriores, nuevas):
+    """
+    Cambios entre dos listas de clases, emparejadas por (fecha, hora, asignatura):
+    {'añadidas': [...], 'eliminadas': [...], 'movidas': [(antes, después), ...]}.
+    Movida = misma clase con otra aula, o misma asignatura el mismo día a otra hora.
+    """
+    antes = {_clave_clase(c): c for c in anteriores}
+    despues = {_clave_clase(c): c for c in nuevas}
+    movidas = [(antes[k], despues[k]) for k in antes.keys() & despues.keys() if antes[k] != despues[k]]
+    eliminadas = [antes[k] for k in antes.keys() - despues.keys()]
+    añadidas = [despues[k] for k in despues.keys() - antes.keys()]
+
+    # Cambio de hora: sale de una clave y entra en otra con la misma fecha y asignatura
+    for vieja in list(eliminadas):
+        nueva = next((n for n in añadidas if (n['fecha'], n['asignatura']) == (vieja['fecha'], vieja['asignatura'])), None)
+        if nueva:
+            eliminadas.remove(vieja)
+            añadidas.remove(nueva)
+            movidas.append((vieja, nueva))
+
+    orden = lambda c: _clave_clase(c)
+    return {"añadidas": sorted(añadidas, key=orden), "eliminadas": sorted(eliminadas, key=orden),
+            "movidas": sorted(movidas, key=lambda par: orden(par[1]))}
+
+def _leer_json_local(ruta, defecto):
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return defecto
+
+def semanas_a_descargar(estado, hoy, semanas=SEMANAS_HORARIO, volatiles=SEMANAS_VOLATILES, caducidad=CADUCIDAD_SEMANA):
+    """Lunes de las semanas a pedir: las volátiles (las más cercanas), las caducadas y las que no se tienen."""
+    inicio = lunes_de(hoy)
+    ahora = datetime.now(TIMEZONE)
+    pendientes = []
+    for i in range(semanas):
+        lunes = inicio + timedelta(weeks=i)
+        info = estado.get("semanas", {}).get(str(lunes))
+        try:
+            caducada = ahora - datetime.fromisoformat(info["descargada"]) > caducidad
+        except (TypeError, KeyError, ValueError):
+            caducada = True
+        if i < volatiles or caducada:
+            pendientes.append(lunes)
+    return pendientes
+
+def actualizar_horario_clases(force=False, driver=None, completo=False, spec=None):
+    """
+    Horario de la universidad (spec; por defecto HORARIO_LOYOLA_DEFECTO) desde su archivo si se
+    comprobó hace menos de 12 horas; si no (o con force), lo actualiza con FuenteLoyola.actualizar().
+    Acepta driver opcional para reutilizar sesión en el respaldo con navegador.
+    """
+    fuente = FuenteLoyola(spec or HORARIO_LOYOLA_DEFECTO)
+
+    # 1. Chequeo de Caché
+    if not force and os.path.exists(fuente.archivo):
+        try:
+            comprobado = datetime.fromisoformat(fuente.leer_estado()["comprobado"])
+            if datetime.now(TIMEZONE) - comprobado < timedelta(hours=12):
+                return fuente.leer()
         except: pass
 
-    if not service:
-        return None
-        
-    return webdriver.Chrome(service=service, options=options)
+    return fuente.actualizar(driver=driver, completo=completo)
+
+# --- ESPERAS DEL NAVEGADOR ---
+# Condiciones para WebDriverWait: se comprueban cada poco y terminan en cuanto la página está lista
+
+def espera_scraper(clave):
+    """Timeout (segundos) de una condición de espera, configurable con ESPERA_<CLAVE>."""
+    try:
+        return float(obtener_config(f"ESPERA_{clave.upper()}", ESPERAS_SCRAPER[clave]))
+    except (TypeError, ValueError):
+        return float(ESPERAS_SCRAPER[clave])
+
+def esperar(driver, condicion, clave):
+    """Espera a que la condición sea cierta. Devuelve su valor, o None si se agota el tiempo."""
+    try:
+        return WebDriverWait(driver, espera_scraper(clave), poll_frequency=0.1).until(condicion)
+    except TimeoutException:
+        return None
+
+def titulo_cambiado(anterior):
+    """El rango de fechas del título de la barra del calendario ya no es el de antes de pulsar 'siguiente'."""
+    def condicion(driver):
+        titulo = driver.execute_script("const t = document.querySelector('.fc-toolbar-title'); return t ? t.innerText : null;")
+        return titulo if titulo and titulo != anterior else False
+    return condicion
+
+class EventosEstables:
+    """Sin peticiones AJAX de PrimeFaces en curso y el número de .fc-event sin cambiar durante un rato."""
+
+    _JS = """return [document.querySelectorAll('.fc-event').length,
+                     !(window.PrimeFaces && PrimeFaces.ajax && PrimeFaces.ajax.Queue && !PrimeFaces.ajax.Queue.isEmpty())];"""
+
+    def __init__(self, durante=EVENTOS_ESTABLES_DURANTE):
+        self.durante = durante
+        self.ultimo = None
+        self.desde = 0.0
+
+    def __call__(self, driver):
+        n, sin_ajax = driver.execute_script(self._JS)
+        ahora = time_lib.monotonic()
+        if n != self.ultimo or not sin_ajax:
+            self.ultimo, self.desde = n, ahora
+            return False
+        return ahora - self.desde >= self.durante
+
+def filas_con_fecha(driver):
+    """Filas de la tabla de partidos ya pintadas (alguna con fecha DD.MM.YYYY)."""
+    filas = driver.find_elements(By.TAG_NAME, "tr")
+    hay_fecha = driver.execute_script(
+        "return Array.from(document.querySelectorAll('tr')).some(f => /\\d{2}\\.\\d{2}\\.\\d{4}/.test(f.innerText));")
+    return filas if filas and hay_fecha else False
+
+# Extrae columnas y eventos de la semana visible en un solo viaje al navegador
+# (con find_elements, cada .rect/.text/find_element es una petición a WebDriver)
+_JS_EXTRAER_SEMANA = """
+const caja = el => { const r = el.getBoundingClientRect(); return {x: r.left, ancho: r.width}; };
+const texto = (el, clase) => { const h = el.querySelector('.' + clase); return h ? h.innerText : null; };
+return JSON.stringify({
+    columnas: Array.from(document.querySelectorAll('.fc-col-header-cell[data-date]'))
+        .map(h => Object.assign(caja(h), {fecha: h.getAttribute('data-date')})),
+    eventos: Array.from(document.querySelectorAll('.fc-event'))
+        .map(e => Object.assign(caja(e), {hora: texto(e, 'fc-event-time'), titulo: texto(e, 'fc-event-title'), texto: e.innerText}))
+});
+"""
+
+def _scrape_clases_navegador(url, driver=None, captura=None):
+    """Scrapea el calendario renderizado con Selenium (descarga + parseo). Lanza excepción si no se pudo."""
+    data_clases = []
+    for i, semana in enumerate(descargar_semanas_navegador(url, driver)):
+        if captura:
+            guardar_captura(captura, f"semana{i:02d}.json", semana)
+        data_clases.extend(clases_desde_dom(semana))
+    return data_clases
+
+def descargar_semanas_navegador(url, driver=None):
+    """Recorre las semanas con el navegador y devuelve el JSON en bruto de cada una (_JS_EXTRAER_SEMANA)."""
+    if not driver:
+        with pool_navegadores().prestar() as driver:
+            return descargar_semanas_navegador(url, driver)
+    
+    semanas = []
+    
+    driver.get(url)
+    
+    # Esperar carga inicial
+    wait = WebDriverWait(driver, espera_scraper("carga"))
+    wait.until(EC.presence_of_element_located((By.CLASS_NAME, "fc-view-harness")))
+    
+    # Iterar 12 semanas (3 meses aprox)
+    weeks_to_scrape = SEMANAS_HORARIO
+    
+    for _ in range(weeks_to_scrape):
+        try:
+            # Semana sin clases: se lee igual cuando se agota la espera
+            esperar(driver, EventosEstables(), "eventos")
+
+            # Una sola llamada al navegador por semana; el parseo es Python puro
+            semanas.append(driver.execute_script(_JS_EXTRAER_SEMANA))
+            
+            try:
+                titulo = titulo_cambiado(None)(driver)
+                btn_next = driver.find_element(By.CLASS_NAME, "fc-next-button")
+                btn_next.click()
+                if not esperar(driver, titulo_cambiado(titulo), "cambio_semana"): break
+            except: break 
+               
+        except Exception as e: break
+        
+    return semanas
+
+# --- FUENTES DE EVENTOS (PLUGINS) ---
+# Cada fuente externa (horarios de Loyola, partidos del Sevilla FC...) es una subclase de
+# FuenteScraping registrada con @registrar_fuente. El orquestador, el refresco en segundo plano
+# y las vistas solo hablan con esta interfaz: añadir un feed nuevo no toca nada más.
+
+TTL_FUENTE_POR_DEFECTO = timedelta(hours=12)
+_TIPOS_FUENTE = []  # Clases registradas, en orden de registro
+
+def registrar_fuente(cls):
+    """
+    Decorador: da de alta un tipo de fuente (sus instancias las da cls.instancias()).
+    Lanza TypeError si le falta algún método abstracto: mejor al arrancar que en el hilo de refresco.
+    """
+    if inspect.isabstract(cls):
+        raise TypeError(f"La fuente {cls.__name__} no implementa: {', '.join(sorted(cls.__abstractmethods__))}")
+    _TIPOS_FUENTE.append(cls)
+    return cls
+
+def fuentes_registradas():
+    """{nombre: fuente} de todas las fuentes configuradas, en orden de registro."""
+    return {fuente.nombre: fuente for cls in _TIPOS_FUENTE for fuente in cls.instancias()}
+
+class FuenteScraping(abc.ABC):
+    """
+    Fuente de eventos externa. Las subclases implementan descargar() (red o navegador) y
+    parsear() (Python puro, sin red); la caché en disco, su TTL y la presentación se configuran
+    con atributos de clase. Las que guardan algo más que una lista de registros (FuenteLoyola)
+    redefinen también actualizar().
+    """
+    nombre = ""                       # Único: clave en el informe, en las marcas y en el selector
+    archivo = None                    # Caché en disco con los registros ya parseados
+    ttl = TTL_FUENTE_POR_DEFECTO      # Cada cuánto la refresca el refresco en segundo plano
+    visible_por_defecto = True        # Si sale en el calendario sin haberla elegido
+
+    # Presentación (vistas y diálogo de detalles)
+    fuente_evento = "externo"         # Valor de Evento.fuente
+    tipo = "Evento"
+    color = "#808080"
+    icono = "📅"
+    etiqueta_lugar = "Ubicación"
+    hora_en_mes = False               # La vista mensual muestra la hora delante del título
+    aviso = None                      # Nota al pie del diálogo de detalles
+
+    @classmethod
+    def instancias(cls):
+        """Fuentes de este tipo según la configuración (por defecto, una)."""
+        return [cls()]
+
+    @abc.abstractmethod
+    def descargar(self):
+        """Lo que haya que bajar de la red, en bruto."""
+
+    @abc.abstractmethod
+    def parsear(self, bruto):
+        """Lo descargado -> registros (sin red)."""
+
+    def actualizar(self):
+        """Descarga, parsea y guarda en la caché (solo si cambió). Devuelve los registros."""
+        registros = self.parsear(self.descargar())
+        if registros != self.leer():
+            _escribir_atomico(self.archivo, json.dumps(registros, indent=4, ensure_ascii=False))
+        return registros
+
+    def leer(self):
+        """Registros de la caché en disco (lista vacía si no hay)."""
+        return _leer_json_local(self.archivo, [])
+
+    def version(self):
+        """Marca barata de la caché en disco: cambia cada vez que se reescribe (None si no existe)."""
+        try:
+            return os.stat(self.archivo).st_mtime_ns
+        except OSError:
+            return None
+
+    @classmethod
+    def combinar(cls, fuentes):
+        """Registros de varias fuentes de este tipo elegidas a la vez ([(fuente, registros)])."""
+        return [r for _, registros in fuentes for r in registros]
+
+    def a_evento(self, r):
+        """Adaptador registro -> Evento ('hora' como 'HH:MM', 'HH:MM - HH:MM' o None)."""
+        inicio = fin = None
+        partes = (r.get('hora') or "").split("-")
+        if not r.get('dia_completo'):
+            inicio = parse_minutos(partes[0])
+            fin = parse_minutos(partes[1]) if len(partes) == 2 else None
+        return Evento(
+            self.fuente_evento, r.get('titulo') or r.get('asignatura', ''), r,
+            fecha=parse_fecha(r.get('fecha')),
+            inicio=inicio, fin=fin,
+            dia_completo=inicio is None,
+            color=self.color,
+            lugar=r.get('aula') or r.get('ubicacion') or '',
+            tipo=self.tipo,
+            origen=self,
+        )
+
+@registrar_fuente
+class FuenteLoyola(FuenteScraping):
+    """Un horario de clases de Loyola (una entrada de HORARIOS_LOYOLA)."""
+    fuente_evento = "clase"
+    tipo = "Clase"
+    color = COLORES_TIPO["Clase"]
+    icono = "📖"
+    etiqueta_lugar = "Aula"
+    hora_en_mes = True
+    aviso = "ℹ️ Este evento pertenece al horario universitario oficial."
+
+    def __init__(self, spec, visible=True):
+        self.spec = spec
+        self.nombre = f"Loyola {nombre_horario(spec)}"
+        self.archivo, self.archivo_estado = archivos_horario(spec)  # Estado: huella y fecha de descarga de cada semana
+        self.visible_por_defecto = visible
+
+    @classmethod
+    def instancias(cls):
+        # Solo el primer horario se ve sin elegirlo; el resto se superpone desde la barra lateral
+        return [cls(spec, visible=i == 0) for i, spec in enumerate(horarios_loyola())]
+
+    def leer_estado(self):
+        return _leer_json_local(self.archivo_estado, {})
+
+    def semanas_pendientes(self, completo=False):
+        """Lunes a pedir según el estado: las volátiles, las caducadas y las que faltan (todas con completo)."""
+        try:
+            volatiles = int(obtener_config("SEMANAS_VOLATILES", SEMANAS_VOLATILES))
+        except (TypeError, ValueError):
+            volatiles = SEMANAS_VOLATILES
+        return semanas_a_descargar(self.leer_estado(), get_madrid_date(),
+                                   volatiles=SEMANAS_HORARIO if completo else volatiles)
+
+    def descargar(self, semanas=None):
+        """
+        Respuestas AJAX en bruto de las semanas dadas (por defecto, semanas_pendientes()), por HTTP:
+        {'semanas', 'id_schedule', 'respuestas'}. Lanza excepción si la web no tiene la forma esperada.
+        """
+        semanas = self.semanas_pendientes() if semanas is None else semanas
+        if not semanas:
+            return {"semanas": [], "id_schedule": None, "respuestas": []}
+        id_schedule, respuestas = descargar_semanas_http(url_horario(self.spec), semanas, sesion_http(),
+                                                         captura=id_horario(self.spec))
+        return {"semanas": semanas, "id_schedule": id_schedule, "respuestas": respuestas}
+
+    def descargar_navegador(self, driver=None):
+        """
+        Respaldo con Selenium: el JSON de _JS_EXTRAER_SEMANA de cada semana, {'semanas', 'dom'}.
+        Solo cuentan las semanas capturadas: si el navegador se corta antes, el resto se conserva.
+        """
+        inicio = lunes_de(get_madrid_date())
+        dom = descargar_semanas_navegador(url_horario(self.spec), driver)
+        for i, semana in enumerate(dom):
+            guardar_captura(id_horario(self.spec), f"semana{i:02d}.json", semana)
+        return {"semanas": [inicio + timedelta(weeks=i) for i in range(len(dom))], "dom": dom}
+
+    def parsear(self, bruto):
+        """Lo descargado (por HTTP o con el navegador) -> {lunes: [clases]} de cada semana pedida."""
+        if "dom" in bruto:
+            por_semana = agrupar_por_semana([c for semana in bruto["dom"] for c in clases_desde_dom(semana)])
+            return {lunes: por_semana.get(lunes, []) for lunes in bruto["semanas"]}
+        return semanas_desde_respuestas(bruto["semanas"], bruto["id_schedule"], bruto["respuestas"])
+
+    def actualizar(self, driver=None, completo=False):
+        """
+        Incremental: pide por HTTP solo las semanas pendientes (con el navegador como respaldo, que
+        recorre todas las que puede) y las fusiona semana a semana con lo guardado. Cada semana descargada se
+        compara por su huella con la guardada, solo las distintas sustituyen a las que había y el
+        archivo solo se reescribe si algo cambió. Los cambios (solo de semanas ya conocidas)
+        quedan en metricas_scraper()['cambios']. Lanza excepción si no se pudo por ninguna vía.
+        """
+        estado = self.leer_estado()
+        inicio = lunes_de(get_madrid_date())
+        try:
+            descargadas = self.parsear(self.descargar(self.semanas_pendientes(completo)))
+        except Exception:
+            descargadas = self.parsear(self.descargar_navegador(driver))  # La web cambió o no responde
+
+        # Fusión por semanas: la huella guardada de cada semana dice si cambió; las iguales no se
+        # tocan y una semana nueva no cuenta como cambio
+        anteriores = self.leer()
+        por_semana = agrupar_por_semana(anteriores)
+        info_semanas = estado.get("semanas", {}) if os.path.exists(self.archivo) else {}
+        ahora = datetime.now(TIMEZONE).isoformat(timespec="seconds")
+        antes, despues = [], []
+        reescribir = False
+        for lunes, clases in descargadas.items():
+            huella = hash_semana(clases)
+            previa = info_semanas.get(str(lunes))
+            info_semanas[str(lunes)] = {"hash": huella, "descargada": ahora}
+            if previa and previa.get("hash") == huella:
+                continue
+            if previa:
+                antes += por_semana.get(lunes, [])
+                despues += clases
+            por_semana[lunes] = clases
+            reescribir = True
+
+        fin = inicio + timedelta(weeks=SEMANAS_HORARIO)  # Fuera de la ventana no se guarda nada
+        reescribir = reescribir or any(not inicio <= lunes < fin for lunes in por_semana)
+        data_clases = sorted((c for lunes, clases in por_semana.items() if inicio <= lunes < fin for c in clases),
+                             key=lambda c: (c['fecha'], c.get('hora') or ""))
+        info_semanas = {k: v for k, v in info_semanas.items() if inicio <= date.fromisoformat(k) < fin}
+
+        metricas_scraper()["cambios"] = diferencias_horario(antes, despues)
+
+        # Guardar en JSON local (solo si alguna semana cambió o salió de la ventana)
+        if reescribir:
+            _escribir_atomico(self.archivo, json.dumps(data_clases, indent=4, ensure_ascii=False))
+        _escribir_atomico(self.archivo_estado, json.dumps({"comprobado": ahora, "semanas": info_semanas}, indent=2))
+        return data_clases
+
+    @classmethod
+    def combinar(cls, fuentes):
+        return superponer_horarios([(fuente.spec, registros) for fuente, registros in fuentes])
+
+# Una fila de la tabla de LaLiga: "... 14.09.2025 ... 21:00 ... Sevilla FC\nVS\nRival ..."
+_RE_FECHA_PARTIDO = re.compile(r"(\d{2})\.(\d{2})\.(\d{4})")
+_RE_HORA_PARTIDO = re.compile(r"(\d{2}:\d{2})")
+
+_JS_FILAS_PARTIDOS = """
+return Array.from(document.querySelectorAll('tr'))
+    .filter(f => !f.classList.contains('more-info'))
+    .map(f => f.innerText).filter(t => t);
+"""
+
+def aceptar_cookies(driver):
+    """Pulsa el botón de aceptar del banner de cookies, si lo hay (varios textos posibles)."""
+    try:
+        for b in driver.find_elements(By.TAG_NAME, "button"):
+            txt = b.text.lower()
+            if "aceptar" in txt or "accept" in txt or "consentir" in txt:
+                b.click()
+                esperar(driver, EC.invisibility_of_element(b), "cookies")
+                return True
+    except Exception:
+        pass
+    return False
+
+def partidos_en_casa(textos_filas, equipo="sevilla"):
+    """Partidos en casa del equipo a partir del texto de las filas de la tabla (Python puro)."""
+    partidos = []
+    for texto_fila in textos_filas:
+        # 1. Fecha (DD.MM.YYYY)
+        match_fecha = _RE_FECHA_PARTIDO.search(texto_fila)
+        if not match_fecha:
+            continue
+        try:
+            fecha = date(int(match_fecha.group(3)), int(match_fecha.group(2)), int(match_fecha.group(1)))
+        except ValueError:
+            continue
+
+        # 2. Hora (HH:MM o -- : -- si aún no está fijada)
+        match_hora = _RE_HORA_PARTIDO.search(texto_fila)
+        hora_txt = match_hora.group(1) if match_hora else None
+
+        # 3. En la tabla: Local VS Visitante. Solo cuenta si el equipo es el local
+        lineas = [l.strip() for l in texto_fila.split('\n') if l.strip()]
+        idx_vs = next((i for i, l in enumerate(lineas) if l.upper() == "VS"), -1)
+        if idx_vs <= 0 or equipo not in lineas[idx_vs - 1].lower():
+            continue
+
+        partidos.append({
+            "titulo": "⚽ Partido en Nervión",
+            "asignatura": "Fútbol",
+            "aula": "Nervión",
+            "fecha": str(fecha),
+            "hora": hora_txt,
+            "dia_completo": hora_txt is None,
+            "es_futbol": True
+        })
+    return partidos
+
+@registrar_fuente
+class FuenteSevillaFC(FuenteScraping):
+    """Partidos en CASA del Sevilla FC (Nervión), de la web de LaLiga."""
+    nombre = "Sevilla FC"
+    archivo = "horario_futbol.json"
+    ttl = timedelta(hours=24)
+    url = "https://www.laliga.com/clubes/sevilla-fc/proximos-partidos"
+    fuente_evento = "futbol"
+    tipo = "Futbol"
+    color = "#FF4B4B"
+    icono = "⚽"
+
+    def descargar(self, driver=None):
+        """Texto de cada fila de la tabla de próximos partidos (un navegador del pool)."""
+        if not driver:
+            with pool_navegadores().prestar() as driver:
+                return self.descargar(driver)
+        driver.get(self.url)
+        aceptar_cookies(driver)
+        esperar(driver, filas_con_fecha, "tabla")  # Esperar carga de la tabla
+        return driver.execute_script(_JS_FILAS_PARTIDOS) or []
+
+    def parsear(self, bruto):
+        return partidos_en_casa(bruto)
+
+def registros_externos(fuentes):
+    """
+    Registros en caché de las fuentes dadas, en un solo flujo [(fuente, registro)] para el
+    índice del calendario. Las del mismo tipo se juntan con su combinar().
+    """
+    por_tipo = {}
+    for fuente in fuentes:
+        por_tipo.setdefault(type(fuente), []).append((fuente, fuente.leer()))
+    return [(grupo[0][0], r) for cls, grupo in por_tipo.items() for r in cls.combinar(grupo)]
+
+# --- ORQUESTADOR DE SCRAPING ---
+
+MAX_SCRAPERS_PARALELO = 4  # Fuentes que se descargan a la vez (SCRAPERS_PARALELO en secrets/env); Chrome lo limita el pool
+
+def fuentes_scraping():
+    """
+    {nombre: función} con el actualizar() de cada fuente registrada. Cada función usa su propia
+    sesión HTTP (sobre un pool de conexiones común) o un navegador del pool, y devuelve sus
+    registros o lanza excepción.
+    """
+    return {nombre: fuente.actualizar for nombre, fuente in fuentes_registradas().items()}
+
+def actualizar_fuentes(fuentes=None, max_paralelo=None):
+    """
+    Descarga las fuentes a la vez (como mucho max_paralelo en paralelo): el total tarda lo que
+    la más lenta. Devuelve (registros de todas las fuentes, informe por fuente con
+    'eventos', 'segundos', 'error', 'peticiones', 'bloqueadas' y 'bytes'). El fallo de una
+    fuente no afecta a las demás.
+    """
+    fuentes = fuentes or fuentes_scraping()
+    if not max_paralelo:
+        try:
+            max_paralelo = int(obtener_config("SCRAPERS_PARALELO", MAX_SCRAPERS_PARALELO))
+        except (TypeError, ValueError):
+            max_paralelo = MAX_SCRAPERS_PARALELO
+
+    def ejecutar(funcion):
+        trafico = metricas_scraper(reiniciar=True)
+        inicio = time_lib.perf_counter()
+        try:
+            datos, error = funcion() or [], None
+        except Exception as e:
+            datos, error = [], str(e) or type(e).__name__
+        return datos, {"eventos": len(datos), "segundos": time_lib.perf_counter() - inicio, "error": error, **trafico}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_paralelo, len(fuentes))), thread_name_prefix="scraper") as pool:
+        futuros = {nombre: pool.submit(ejecutar, funcion) for nombre, funcion in fuentes.items()}
+        resultados = {nombre: futuro.result() for nombre, futuro in futuros.items()}
+
+    informe = {nombre: informe for nombre, (_, informe) in resultados.items()}
+    marcar_descargas([nombre for nombre, datos in informe.items() if not datos['error']])
+    registros = [r for datos, _ in resultados.values() for r in datos]
+    return registros, informe
+
+def marcar_descargas(nombres):
+    """Apunta en MARCAS_SCRAPING_FILE la hora de la última descarga correcta de cada fuente."""
+    if not nombres:
+        return
+    marcas = _leer_json_local(MARCAS_SCRAPING_FILE, {})
+    ahora = datetime.now(TIMEZONE).isoformat(timespec="seconds")
+    marcas.update({nombre: ahora for nombre in nombres})
+    _escribir_atomico(MARCAS_SCRAPING_FILE, json.dumps(marcas, indent=2, ensure_ascii=False))
+
+# --- REFRESCO EN SEGUNDO PLANO ---
+# Stale-while-revalidate: la app pinta siempre lo que hay en disco y, si una fuente ha caducado,
+# un hilo la vuelve a descargar; el siguiente rerun ya lee los archivos nuevos.
+
+MARCAS_SCRAPING_FILE = "scraping.marcas.json"  # Última descarga correcta de cada fuente
+JITTER_REFRESCO = 0.1  # ±10% del TTL, para que varios procesos no caduquen a la vez
+REINTENTO_FUENTE_FALLIDA = timedelta(minutes=15)  # Una fuente que falla no se reintenta en cada rerun
+
+class RefrescoFondo:
+    """Refresca en un hilo las fuentes caducadas; nunca hay más de un refresco a la vez por proceso."""
+
+    def __init__(self, fuentes=None, ttl=None, jitter=JITTER_REFRESCO):
+        self.fuentes = fuentes  # None: fuentes_scraping()
+        self.ttl = ttl  # {fuente: timedelta}; None: el ttl de cada fuente registrada
+        self.amplitud_jitter = jitter
+        self.jitter = {}  # {fuente: fracción del TTL}, fijada la primera vez que se mira la fuente
+        self.lock = threading.Lock()
+        self.hilo = None
+        self.fallos = {}  # {fuente: monotonic del último intento fallido}
+        # Informe acumulado por fuente del último refresco de cada una. Es del proceso, no de una
+        # sesión: las cachés que refresca son comunes, así que todas las sesiones ven el mismo
+        self.ultimo_informe = {}
+        self.hora_informe = None
+        self.en_curso = []
+
+    def _fuentes(self):
+        return self.fuentes or fuentes_scraping()
+
+    def caducadas(self, ahora=None):
+        """Fuentes cuya última descarga correcta es más vieja que su TTL (con jitter)."""
+        ahora = ahora or datetime.now(TIMEZONE)
+        marcas = _leer_json_local(MARCAS_SCRAPING_FILE, {})
+        ttls = self.ttl or {nombre: fuente.ttl for nombre, fuente in fuentes_registradas().items()}
+        caducadas = []
+        for nombre in self._fuentes():
+            jitter = self.jitter.setdefault(nombre, random.uniform(-self.amplitud_jitter, self.amplitud_jitter))
+            ttl = ttls.get(nombre, TTL_FUENTE_POR_DEFECTO) * (1 + jitter)
+            try:
+                vieja = ahora - datetime.fromisoformat(marcas[nombre]) > ttl
+            except (KeyError, TypeError, ValueError):
+                vieja = True
+            fallo = self.fallos.get(nombre)
+            if vieja and (fallo is None or time_lib.monotonic() - fallo > REINTENTO_FUENTE_FALLIDA.total_seconds()):
+                caducadas.append(nombre)
+        return caducadas
+
+    def revisar(self):
+        """Si hay fuentes caducadas y no hay otro refresco en curso, lo lanza en un hilo. No bloquea."""
+        caducadas = self.caducadas()
+        if not caducadas or not self.lock.acquire(blocking=False):
+            return False
+        self.hilo = threading.Thread(target=self._refrescar, args=(caducadas,), name="refresco-scraping", daemon=True)
+        self.hilo.start()
+        return True
+
+    def ejecutar_ahora(self, nombres=None):
+        """Refresca ya (tras esperar al refresco en curso, si lo hay) y devuelve el informe."""
+        self.lock.acquire()
+        return self._refrescar(nombres or list(self._fuentes()))
+
+    def _refrescar(self, nombres):
+        # Se llama con self.lock adquirido
+        try:
+            fuentes = self._fuentes()
+            self.en_curso = list(nombres)
+            _, informe = actualizar_fuentes({nombre: fuentes[nombre] for nombre in nombres if nombre in fuentes})
+            for nombre, datos in informe.items():
+                if datos['error']:
+                    self.fallos[nombre] = time_lib.monotonic()
+                else:
+                    self.fallos.pop(nombre, None)
+            self.ultimo_informe = {**self.ultimo_informe, **informe}
+            self.hora_informe = datetime.now(TIMEZONE)
+            return informe
+        finally:
+            self.en_curso = []
+            self.lock.release()
+
+@st.cache_resource(show_spinner=False)
+def refresco_fondo():
+    """Planificador único por proceso, compartido por todas las sesiones."""
+    return RefrescoFondo()
+
+# --- GESTIÓN DE PERSISTENCIA (GITHUB) ----
+
+def obtener_config(clave, defecto=None):
+    """Lee un valor de configuración de st.secrets o, si no está, de las variables de entorno."""
+    try:
+        if clave in st.secrets:
+            return st.secrets[clave]
+    except Exception:
+        pass  # Sin secrets.toml
+    return os.environ.get(clave, defecto)
+
+@st.cache_resource(show_spinner=False)
+def _repo_github(token, url_api=None):
+    """
+    Cliente y repo compartidos por todo el proceso (todas las sesiones de Streamlit).
+    PyGithub reutiliza su sesión HTTP, así que las conexiones se mantienen vivas (keep-alive).
+    El repo es 'lazy': no cuesta ninguna llamada hasta la primera lectura o escritura.
+    url_api permite apuntar a otra API (p. ej. herramientas/github_falso.py).
+    """
+    opciones = {"base_url": url_api} if url_api else {}
+    # Sin tope, PyGithub duerme hasta que GitHub repone la cuota (hasta una hora) bloqueando la app
+    reintentos = GithubRetry(total=3, max_rate_limit_wait=ESPERA_MAX_CUOTA)
+    g = Github(auth=Auth.Token(token), pool_size=10, lazy=True, retry=reintentos, timeout=TIMEOUT_GITHUB, **opciones)
+    return g.get_repo(REPO_NAME)
+
+def obtener_conexion_repo():
+    """Devuelve el repo de GitHub usando el token almacenado en secrets (reutilizado entre llamadas)."""
+    try:
+        token = obtener_config("GITHUB_TOKEN")
+        if not token:
+            st.error("❌ Falta el Token en Secrets (.streamlit/secrets.toml).")
+            return None
+        return _repo_github(token, obtener_config("GITHUB_API_URL"))
+    except Exception as e:
+        st.error(f"Error conectando a GitHub: {e}")
+        return None
+
+# --- MÉTRICAS Y BACKOFF (GITHUB) ---
+
+class MetricasGithub:
+    """
+    Métricas del proceso sobre la API de GitHub: latencia y bytes por llamada, errores y
+    la cuota restante (cabeceras X-RateLimit-* que PyGithub guarda tras cada respuesta).
+    factor_backoff() dice cuánto estirar el TTL de la caché y la ventana de escritura.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.llamadas = deque(maxlen=200)  # (hora, operación, ms, bytes, error o None)
+        self.total_llamadas = 0
+        self.total_errores = 0
+        self.bytes_bajada = 0
+        self.bytes_subida = 0
+        self.cuota_restante = None
+        self.cuota_limite = None
+        self.cuota_reset = 0  # epoch en que GitHub repone la cuota
+
+    def registrar(self, operacion, ms, bajada=0, subida=0, error=None, requester=None):
+        with self.lock:
+            self.llamadas.append((get_madrid_time().strftime("%H:%M:%S"), operacion, ms, bajada + subida, error))
+            self.total_llamadas += 1
+            self.total_errores += error is not None
+            self.bytes_bajada += bajada
+            self.bytes_subida += subida
+            restante, limite = getattr(requester, "rate_limiting", (-1, -1))
+            if limite > 0 and error is None:
+                self.cuota_restante, self.cuota_limite = restante, limite
+                self.cuota_reset = getattr(requester, "rate_limiting_resettime", 0)
+
+    def sin_cuota(self, e):
+        """Cuota agotada (403/429): las cabeceras del error dicen cuándo se repone."""
+        cabeceras = {k.lower(): v for k, v in (getattr(e, "headers", None) or {}).items()}
+        with self.lock:
+            self.cuota_restante = 0
+            self.cuota_limite = self.cuota_limite or int(cabeceras.get("x-ratelimit-limit", 0)) or 5000
+            reset = cabeceras.get("x-ratelimit-reset")
+            self.cuota_reset = int(reset) if reset else time_lib.time() + 60
+
+    def factor_backoff(self):
+        """1 con cuota holgada; 2, 4 u 8 según se agota. Sin cuota, hasta la hora de reposición."""
+        with self.lock:
+            if not self.cuota_limite:
+                return 1
+            fraccion = self.cuota_restante / self.cuota_limite
+            if self.cuota_restante <= 0 and self.cuota_reset > time_lib.time():
+                return max(MAX_FACTOR_BACKOFF, (self.cuota_reset - time_lib.time()) / CACHE_GITHUB_TTL)
+        if fraccion < 0.02:
+            return MAX_FACTOR_BACKOFF
+        if fraccion < 0.10:
+            return 4
+        if fraccion < 0.25:
+            return 2
+        return 1
+
+    def resumen(self):
+        with self.lock:
+            tiempos = sorted(ms for _, _, ms, _, _ in self.llamadas)
+
+            def percentil(q):
+                return tiempos[min(len(tiempos) - 1, int(q * len(tiempos)))] if tiempos else None
+
+            return {
+                "llamadas": self.total_llamadas,
+                "errores": self.total_errores,
+                "latencia_p50_ms": percentil(0.5),
+                "latencia_p95_ms": percentil(0.95),
+                "bytes_bajada": self.bytes_bajada,
+                "bytes_subida": self.bytes_subida,
+                "cuota_restante": self.cuota_restante,
+                "cuota_limite": self.cuota_limite,
+                "cuota_reset": self.cuota_reset,
+                "ultimas": list(self.llamadas)[-15:],
+            }
+
+@st.cache_resource(show_spinner=False)
+def metricas_github():
+    return MetricasGithub()
+
+@contextlib.contextmanager
+def medir_github(operacion, repo):
+    """
+    Mide una llamada a la API. El bloque puede anotar los bytes en medida['bajada'] / medida['subida'].
+    Las excepciones se registran como error y se propagan.
+    """
+    medida = {"bajada": 0, "subida": 0}
+    t0 = time_lib.perf_counter()
+    error = None
+    try:
+        yield medida
+    except UnknownObjectException:
+        raise  # Un 404 es una respuesta válida (archivo aún no creado)
+    except Exception as e:
+        error = getattr(e, "status", None) or type(e).__name__
+        if es_limite_github(e):
+            metricas_github().sin_cuota(e)
+        raise
+    finally:
+        metricas_github().registrar(operacion, (time_lib.perf_counter() - t0) * 1000, medida["bajada"],
+                                    medida["subida"], error, getattr(repo, "requester", None))
+
+def es_limite_github(e):
+    """True si GitHub rechazó la llamada por cuota agotada (403/429 de rate limit)."""
+    return isinstance(e, RateLimitExceededException) or (
+        isinstance(e, GithubException) and e.status in (403, 429) and "rate limit" in str(e).lower()
+    )
+
+def es_error_de_red(e):
+    """True si la llamada falló por la red o por un error del servidor (no por los datos enviados)."""
+    if isinstance(e, (requests.exceptions.RequestException, ConnectionError, TimeoutError)):
+        return True
+    return isinstance(e, GithubException) and (e.status or 0) >= 500
+
+def describir_error_github(e):
+    """Mensaje legible para el usuario: distingue cuota agotada de un fallo genérico."""
+    if es_limite_github(e):
+        reset = metricas_github().cuota_reset
+        hora = datetime.fromtimestamp(reset, TIMEZONE).strftime("%H:%M") if reset else "dentro de un rato"
+        return f"cuota de la API de GitHub agotada, se reintentará a las {hora}"
+    if es_error_de_red(e):
+        return f"sin conexión con GitHub, se reintentará en {SIN_RED_ESPERA} s"
+    return str(e)
+
+# --- CACHÉ DE LECTURA (GITHUB) ---
+
+class EntradaCacheGithub:
+    """Último contenido conocido de un archivo del repo junto a su SHA de blob."""
+    __slots__ = ("datos", "sha", "contenido", "ts", "lock")
+
+    def __init__(self):
+        self.datos = None
+        self.sha = None
+        self.contenido = None  # ContentFile de PyGithub (guarda el ETag para revalidar)
+        self.ts = 0.0
+        self.lock = threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def _cache_archivos_github():
+    """Caché de archivos compartida por todo el proceso: {ruta: EntradaCacheGithub}."""
+    return {}
+
+_lock_cache_github = threading.Lock()
+
+def _entrada_cache_github(path):
+    cache = _cache_archivos_github()
+    with _lock_cache_github:
+        if path not in cache:
+            cache[path] = EntradaCacheGithub()
+        return cache[path]
+
+def decodificar_json(path, texto):
+    """Los '.jsonl' (diarios) son un registro JSON por línea; el resto, un documento JSON."""
+    if path.endswith(".jsonl"):
+        return [json.loads(linea) for linea in texto.splitlines() if linea.strip()]
+    return json.loads(texto)
+
+def codificar_json(path, datos):
+    if path.endswith(".jsonl"):
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in datos)
+    return json.dumps(datos, indent=4)
+
+def leer_json_github(repo, path):
+    """
+    Lectura read-through con caché: devuelve (datos, sha); sha es None si el archivo no existe.
+    Dentro del TTL no hay red. Pasado el TTL se revalida con If-None-Match (un 304 no descarga nada).
+    """
+    entrada = _entrada_cache_github(path)
+    with entrada.lock:
+        ahora = time_lib.monotonic()
+        # Con poca cuota el TTL se estira (factor_backoff) y se sirve más tiempo desde caché
+        if entrada.datos is not None and ahora - entrada.ts < CACHE_GITHUB_TTL * metricas_github().factor_backoff():
+            return copy.deepcopy(entrada.datos), entrada.sha
+
+        try:
+            with medir_github(f"leer {path}", repo) as medida:
+                if entrada.contenido is not None:
+                    cambiado = entrada.contenido.update()
+                else:
+                    entrada.contenido = repo.get_contents(path)
+                    cambiado = True
+                if cambiado:
+                    medida['bajada'] = entrada.contenido.size or 0
+        except UnknownObjectException:
+            entrada.contenido = None
+            entrada.datos, entrada.sha = [], None
+            entrada.ts = ahora
+            return [], None
+
+        # Un 304 contra un ETag anterior a nuestras escrituras también obliga a recargar (A → B → A)
+        if cambiado or entrada.datos is None or entrada.sha != entrada.contenido.sha:
+            entrada.datos = decodificar_json(path, entrada.contenido.decoded_content.decode())
+            entrada.sha = entrada.contenido.sha
+        entrada.ts = ahora
+        return copy.deepcopy(entrada.datos), entrada.sha
+
+def registrar_escritura_github(path, datos, sha):
+    """Actualiza la caché con lo que acabamos de escribir (sin volver a descargarlo)."""
+    entrada = _entrada_cache_github(path)
+    with entrada.lock:
+        entrada.datos = copy.deepcopy(datos)
+        entrada.sha = sha
+        entrada.ts = time_lib.monotonic()
+
+def invalidar_cache_github(path):
+    """Fuerza que la próxima lectura vuelva a preguntar a GitHub."""
+    entrada = _entrada_cache_github(path)
+    with entrada.lock:
+        entrada.ts = 0.0
+
+# --- COLA DE ESCRITURA DIFERIDA (WRITE-BEHIND) ---
+
+def aplicar_operacion(datos, op):
+    """
+    Aplica una operación de registro (por 'id') sobre una lista de registros.
+    Son idempotentes: aplicar dos veces la misma operación deja el mismo resultado.
+    Los registros de la operación se copian: quien lea el resultado (índice, vistas) puede
+    modificarlos sin tocar la operación pendiente ni lo que vean otras lecturas.
+    """
+    accion = op['accion']
+    if accion == 'crear':
+        return [r for r in datos if r.get('id') != op['item']['id']] + [copy.deepcopy(op['item'])]
+    if accion == 'actualizar':
+        return [copy.deepcopy(op['item']) if r.get('id') == op['item']['id'] else r for r in datos]
+    if accion == 'borrar':
+        return [r for r in datos if r.get('id') != op['id']]
+    if accion == 'guardar_todo':
+        return copy.deepcopy(op['lista'])
+    return datos
+
+_SIN_VALOR = object()
+
+def _fusionar_campos(base, nuestro, suyo):
+    """Fusión campo a campo de un registro cambiado en los dos lados (en empate gana el nuestro)."""
+    resultado = {}
+    for k in list(suyo) + [k for k in nuestro if k not in suyo]:
+        v_base = base.get(k, _SIN_VALOR)
+        v_nuestro = nuestro.get(k, _SIN_VALOR)
+        v = v_nuestro if v_nuestro != v_base else suyo.get(k, _SIN_VALOR)
+        if v is not _SIN_VALOR:
+            resultado[k] = v
+    return resultado
+
+def fusionar_tres_vias(base, nuestros, suyos):
+    """
+    Fusión a nivel de registro (por 'id') entre la versión base, la nuestra y la remota.
+    - Cambio en un solo lado: gana ese lado. En los dos: campo a campo (en empate, el nuestro).
+    - Borrado en un lado y modificado en el otro: se conserva el modificado (no se pierden ediciones).
+    - Altas de cualquiera de los lados se conservan. El orden sigue al remoto, con nuestras altas al final.
+    """
+    por_id_base = {r.get('id'): r for r in base}
+    por_id_nuestro = {r.get('id'): r for r in nuestros}
+    ids_suyos = {r.get('id') for r in suyos}
+    resultado = []
+
+    for r in suyos:
+        rid = r.get('id')
+        r_base = por_id_base.get(rid)
+        if rid in por_id_nuestro:
+            r_nuestro = por_id_nuestro[rid]
+            if r_base is None:
+                resultado.append({**r, **r_nuestro})
+            elif r_nuestro == r_base:
+                resultado.append(r)
+            elif r == r_base:
+                resultado.append(r_nuestro)
+            else:
+                resultado.append(_fusionar_campos(r_base, r_nuestro, r))
+        elif r_base is not None and r == r_base:
+            continue  # Lo borramos nosotros y ellos no lo tocaron
+        else:
+            resultado.append(r)
+
+    for r in nuestros:
+        rid = r.get('id')
+        if rid in ids_suyos: continue
+        r_base = por_id_base.get(rid)
+        if r_base is not None and r == r_base:
+            continue  # Lo borraron ellos y nosotros no lo tocamos
+        resultado.append(r)
+
+    return resultado
+
+def es_conflicto_github(e):
+    """True si GitHub rechazó la escritura porque el SHA ya no es el último."""
+    return isinstance(e, GithubException) and e.status in (409, 422)
+
+def escribir_json_github(repo, path, transformar, mensaje, max_reintentos=MAX_REINTENTOS_ESCRITURA, al_confirmar=None):
+    """
+    Lectura-modificación-escritura de un archivo JSON del repo: datos = transformar(actuales).
+    Si otra sesión escribió antes (SHA distinto), se relee el remoto y se hace una fusión
+    a tres vías por registro antes de reintentar. Devuelve los datos escritos.
+    """
+    base, sha = leer_json_github(repo, path)
+    datos = transformar(base)
+    error = None
+
+    for intento in range(max_reintentos):
+        try:
+            contenido = codificar_json(path, datos)
+            with medir_github(f"escribir {path}", repo) as medida:
+                medida['subida'] = len(contenido.encode())
+                if sha:
+                    resultado = repo.update_file(path, mensaje, contenido, sha)
+                else:
+                    resultado = repo.create_file(path, mensaje, contenido)
+            if al_confirmar:
+                al_confirmar(datos, resultado['content'].sha)
+            else:
+                registrar_escritura_github(path, datos, resultado['content'].sha)
+            return datos
+        except Exception as e:
+            error = e
+            invalidar_cache_github(path)
+            if es_limite_github(e):
+                break  # Sin cuota no sirve reintentar: la cola espera (ventana estirada) y el usuario puede reintentar
+            if not es_conflicto_github(e):
+                time_lib.sleep(min(2 ** intento, 10))
+            try:
+                suyos, sha = leer_json_github(repo, path)
+            except Exception as e_lectura:
+                error = e_lectura
+                continue
+            datos = fusionar_tres_vias(base, datos, suyos)
+            base = suyos
+
+    raise error
+
+def sha_blob_git(contenido):
+    """SHA que git asigna a un blob: permite comparar la caché con un árbol sin descargar nada."""
+    datos = contenido.encode()
+    return hashlib.sha1(b"blob %d\0" % len(datos) + datos).hexdigest()
+
+def _leer_en_arbol(repo, path, arbol):
+    """Datos de 'path' en un árbol {ruta: sha}: de la caché si el SHA coincide, si no se descarga el blob."""
+    sha = arbol.get(path)
+    if sha is None:
+        return []
+    entrada = _entrada_cache_github(path)
+    with entrada.lock:
+        if entrada.datos is not None and entrada.sha == sha:
+            return copy.deepcopy(entrada.datos)
+    with medir_github(f"blob {path}", repo) as medida:
+        blob = repo.get_git_blob(sha)
+        contenido = base64.b64decode(blob.content)  # Con el cliente lazy, aquí es donde se descarga
+        medida['bajada'] = len(contenido)
+    datos = decodificar_json(path, contenido.decode())
+    registrar_escritura_github(path, datos, sha)
+    return datos
+
+def escribir_lote_github(repo, transformaciones, mensaje, max_reintentos=MAX_REINTENTOS_ESCRITURA, al_confirmar=None):
+    """
+    Escribe varios archivos en un único commit con la Git Data API: árbol (con el contenido
+    dentro, sin crear blobs aparte) → commit → avance de la rama. Son las mismas 6 llamadas
+    sea cual sea el número de archivos (más un blob por archivo que no esté en caché), cada una
+    medida por separado, y el cambio es atómico.
+    Si la rama avanzó mientras tanto (422, no es fast-forward), cada archivo se fusiona
+    a tres vías con la nueva cabeza y se reintenta.
+    transformaciones: {ruta: función(datos) -> datos}. Devuelve {ruta: datos escritos}.
+    """
+    bases = nuestros = None
+    error = None
+
+    for intento in range(max_reintentos):
+        try:
+            # Cada llamada en su medida; con el cliente lazy, la petición sale al leer el primer atributo
+            with medir_github("ref de la rama", repo):
+                ref = repo.get_git_ref(f"heads/{RAMA_REPO}")
+                sha_cabeza = ref.object.sha
+            with medir_github("commit de la cabeza", repo):
+                padre = repo.get_git_commit(sha_cabeza)
+                sha_arbol = padre.tree.sha
+            with medir_github("árbol de la cabeza", repo):
+                arbol = {el.path: el.sha for el in repo.get_git_tree(sha_arbol, recursive=True).tree if el.type == "blob"}
+            suyos = {path: _leer_en_arbol(repo, path, arbol) for path in transformaciones}
+            if nuestros is None:
+                nuestros = {path: f(suyos[path]) for path, f in transformaciones.items()}
+            else:
+                nuestros = {path: fusionar_tres_vias(bases[path], nuestros[path], suyos[path]) for path in transformaciones}
+            bases = suyos
+
+            contenidos = {path: codificar_json(path, datos) for path, datos in nuestros.items()}
+            elementos = [InputGitTreeElement(path, "100644", "blob", content=c) for path, c in contenidos.items()]
+            with medir_github(f"árbol de {len(contenidos)} archivos", repo) as medida:
+                medida['subida'] = sum(len(c.encode()) for c in contenidos.values())
+                nuevo_arbol = repo.create_git_tree(elementos, base_tree=padre.tree)
+            with medir_github("crear commit", repo):
+                commit = repo.create_git_commit(mensaje, nuevo_arbol, [padre])
+            with medir_github("avanzar la rama", repo):
+                ref.edit(commit.sha, force=False)
+        except Exception as e:
+            error = e
+            if es_limite_github(e):
+                break
+            if not es_conflicto_github(e):
+                time_lib.sleep(min(2 ** intento, 10))
+            continue
+
+        shas = {path: sha_blob_git(c) for path, c in contenidos.items()}
+        if al_confirmar:
+            al_confirmar(nuestros, shas)
+        else:
+            for path, datos in nuestros.items():
+                registrar_escritura_github(path, datos, shas[path])
+        return nuestros
+
+    raise error
+
+class ColaEscritura:
+    """
+    Los cambios se aplican al estado local al instante (las lecturas ven las operaciones pendientes)
+    y un hilo en segundo plano los sube a GitHub agrupados: un commit por archivo cuando pasan
+    DEBOUNCE_ESCRITURA segundos sin cambios nuevos. Los conflictos de SHA se resuelven con
+    fusionar_tres_vias en lugar de descartar la escritura.
+    """
+
+    def __init__(self, debounce=DEBOUNCE_ESCRITURA, max_reintentos=MAX_REINTENTOS_ESCRITURA):
+        self.debounce = debounce
+        self.max_reintentos = max_reintentos
+        self.pendientes = {}  # {ruta: [op, ...]} en orden de llegada
+        self.repo = None
+        self.ultimo_cambio = 0.0
+        self.ultimo_error = None
+        self.reanudar_en = None  # epoch en que el hilo reintenta solo (cuota repuesta o red recuperada)
+        self.version = 0  # Cambia cada vez que un lote llega a GitHub
+        self.cambios = 0  # Cambia con cada operación encolada
+        self.cond = threading.Condition()
+        self.lock_volcado = threading.Lock()
+        self.hilo = None
+        self.observadores = []  # Funciones (repo, ruta, datos) llamadas tras cada volcado correcto
+
+    def encolar(self, repo, path, op):
+        with self.cond:
+            self.repo = repo
+            self.pendientes.setdefault(path, []).append(op)
+            self.cambios += 1
+            self.ultimo_cambio = time_lib.monotonic()
+            if self.reanudar_en is None:  # Sin cuota o sin red, el hilo espera aunque lleguen cambios
+                self.ultimo_error = None
+            if self.hilo is None or not self.hilo.is_alive():
+                self.hilo = threading.Thread(target=self._bucle, name="cola-escritura-github", daemon=True)
+                self.hilo.start()
+            self.cond.notify_all()
+
+    def leer(self, repo, path):
+        """Lee el archivo (con caché) y le aplica las operaciones que aún no han llegado a GitHub."""
+        while True:
+            with self.cond:
+                version = self.version
+            datos, _ = leer_json_github(repo, path)
+            with self.cond:
+                # Si un lote se confirmó mientras leíamos, la caché ya incluye esas operaciones
+                if version != self.version: continue
+                for op in self.pendientes.get(path, ()):
+                    datos = aplicar_operacion(datos, op)
+                return datos
+
+    def num_pendientes(self):
+        with self.cond:
+            return sum(len(ops) for ops in self.pendientes.values())
+
+    def reintentar(self):
+        with self.cond:
+            self.ultimo_error, self.reanudar_en = None, None
+            self.ultimo_cambio = 0.0
+            self.cond.notify_all()
+
+    def vaciar(self):
+        """Sube ya todo lo pendiente (sin esperar la ventana). Se usa al cerrar el proceso."""
+        self._volcar_lote()
+
+    def _bucle(self):
+        while True:
+            with self.cond:
+                while not any(self.pendientes.values()) or self.ultimo_error:
+                    # Fallos por cuota o por red se reintentan solos; el resto espera a reintentar()
+                    restante = self.reanudar_en - time_lib.time() if self.reanudar_en else None
+                    if restante is not None and restante <= 0:
+                        self.ultimo_error, self.reanudar_en = None, None
+                        continue
+                    self.cond.wait(restante)
+                # Con poca cuota se agrupan más cambios por commit (ventana más larga)
+                espera = self.ultimo_cambio + self.debounce * metricas_github().factor_backoff() - time_lib.monotonic()
+                if espera > 0:
+                    self.cond.wait(espera)
+                    continue
+            self._volcar_lote()
+
+    def _volcar_lote(self):
+        with self.lock_volcado:  # Un solo volcado a la vez (hilo de fondo o cierre del proceso)
+            with self.cond:
+                lote = {p: list(ops) for p, ops in self.pendientes.items() if ops}
+                repo = self.repo
+            if lote:
+                self._volcar(repo, lote)
+
+    def _volcar(self, repo, lote):
+        """
+        Sube en un solo commit las operaciones de todos los archivos del lote ({ruta: [op]}).
+        Un archivo va por la Contents API (una petición); varios, por la Git Data API (atómico).
+        """
+        todas = [op for ops in lote.values() for op in ops]
+        if len(todas) == 1:
+            mensaje = todas[0]['mensaje']
+        else:
+            mensaje = f"{len(todas)} cambios\n\n" + "\n".join(f"- {op['mensaje']}" for op in todas)
+
+        def transformar(ops):
+            def aplicar(datos):
+                for op in ops:
+                    datos = aplicar_operacion(datos, op)
+                return datos
+            return aplicar
+
+        def al_confirmar(escritos, shas):
+            # Caché y pendientes cambian a la vez para que las lecturas no vean huecos ni duplicados
+            with self.cond:
+                for path, ops in lote.items():
+                    registrar_escritura_github(path, escritos[path], shas[path])
+                    del self.pendientes[path][:len(ops)]
+                self.version += 1
+
+        try:
+            if len(lote) == 1:
+                [(path, ops)] = lote.items()
+                datos = escribir_json_github(repo, path, transformar(ops), mensaje, self.max_reintentos,
+                                             lambda d, sha: al_confirmar({path: d}, {path: sha}))
+                escritos = {path: datos}
+            else:
+                transformaciones = {path: transformar(ops) for path, ops in lote.items()}
+                escritos = escribir_lote_github(repo, transformaciones, mensaje, self.max_reintentos, al_confirmar)
+        except Exception as e:
+            with self.cond:
+                self.ultimo_error = f"{', '.join(lote)}: {describir_error_github(e)}"
+                if es_limite_github(e):
+                    self.reanudar_en = metricas_github().cuota_reset
+                elif es_error_de_red(e):
+                    self.reanudar_en = time_lib.time() + SIN_RED_ESPERA
+            return False
+
+        for path, datos in escritos.items():
+            for observador in self.observadores:
+                observador(repo, path, datos)
+        return True
+
+@st.cache_resource(show_spinner=False)
+def cola_escritura():
+    """Cola de escritura única por proceso, compartida por todas las sesiones."""
+    cola = ColaEscritura()
+    atexit.register(cola.vaciar)
+    return cola
+
+# --- ALMACENAMIENTO (BACKENDS) ---
+
+def ruta_historico(mes):
+    return f"{CARPETA_HISTORICO}/{mes}.json"
+
+def agrupar_por_mes(tareas):
+    """{'YYYY-MM': [tareas]} según su deadline (o su fecha si no tiene)."""
+    por_mes = {}
+    for t in tareas:
+        mes = (t.get('fecha_fin') or t.get('fecha') or str(get_madrid_date()))[:7]
+        por_mes.setdefault(mes, []).append(t)
+    return por_mes
+
+class SinConexionError(Exception):
+    """No hay conexión con el backend (el error ya se ha mostrado al usuario)."""
+
+def _escribir_atomico(ruta, texto):
+    """Escribe en un temporal y lo renombra: nunca queda un archivo a medias."""
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(texto)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+class RespaldoLocal:
+    """
+    Copia en disco para trabajar sin conexión con GitHub:
+    - snapshot: el último estado bueno leído de cada colección.
+    - WAL (registro de escritura anticipada): cada cambio se anota aquí, con fsync, antes de
+      mandarlo a GitHub, y se borra cuando GitHub lo ha confirmado. Sobrevive a reinicios.
+    """
+
+    def __init__(self, ruta_snapshot, ruta_wal):
+        self.ruta_snapshot = ruta_snapshot
+        self.ruta_wal = ruta_wal
+        self.lock = threading.Lock()
+        self.firmas = {}
+        self.generacion = 0  # Cambia con cada snapshot nuevo o cambio en el WAL
+        try:
+            with open(ruta_snapshot, 'r', encoding='utf-8') as f:
+                self.snapshot = json.load(f)
+        except (OSError, ValueError):
+            self.snapshot = {}
+        self.entradas = []  # [{"id", "coleccion", "op"}] en orden de llegada
+        try:
+            with open(ruta_wal, 'r', encoding='utf-8') as f:
+                for linea in f:
+                    try:
+                        self.entradas.append(json.loads(linea))
+                    except ValueError:
+                        break  # Última línea cortada por un cierre brusco
+        except OSError:
+            pass
+
+    def guardar_snapshot(self, coleccion, datos):
+        firma = hashlib.sha1(json.dumps(datos, sort_keys=True).encode()).hexdigest()
+        with self.lock:
+            if self.firmas.get(coleccion) == firma:
+                return
+            self.firmas[coleccion] = firma
+            self.snapshot[coleccion] = copy.deepcopy(datos)
+            self.generacion += 1
+            _escribir_atomico(self.ruta_snapshot, json.dumps(self.snapshot, ensure_ascii=False))
+
+    def leer(self, coleccion):
+        """Snapshot más los cambios del WAL (las operaciones son idempotentes)."""
+        with self.lock:
+            datos = copy.deepcopy(self.snapshot.get(coleccion, []))
+            for entrada in self.entradas:
+                if entrada['coleccion'] == coleccion:
+                    datos = aplicar_operacion(datos, entrada['op'])
+        return datos
+
+    def anotar_lote(self, cambios):
+        """
+        Anota varios cambios [(coleccion, op, ruta)] con un solo fsync. 'ruta' es para archivos del
+        repo que no son una colección (histórico, marcas): entonces coleccion es None.
+        """
+        entradas = []
+        for coleccion, op, ruta in cambios:
+            entrada = {"id": uuid.uuid4().hex, "coleccion": coleccion, "op": op}
+            if ruta:
+                entrada["ruta"] = ruta
+            entradas.append(entrada)
+        with self.lock:
+            with open(self.ruta_wal, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entradas))
+                f.flush()
+                os.fsync(f.fileno())
+            self.entradas.extend(entradas)
+            self.generacion += 1
+        return entradas
+
+    def sin_enviar(self, enviados):
+        with self.lock:
+            return [e for e in self.entradas if e['id'] not in enviados]
+
+    def confirmar(self, ids):
+        """Quita del WAL las entradas que ya están en GitHub."""
+        with self.lock:
+            self.entradas = [e for e in self.entradas if e['id'] not in ids]
+            self.generacion += 1
+            _escribir_atomico(self.ruta_wal, "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in self.entradas))
+
+@st.cache_resource(show_spinner=False)
+def respaldo_local():
+    return RespaldoLocal(RESPALDO_SNAPSHOT_FILE, RESPALDO_WAL_FILE)
+
+class AlmacenDatos:
+    """
+    Interfaz de persistencia para las colecciones de registros ('tareas', 'horario').
+    Las operaciones son las de aplicar_operacion: crear, actualizar, borrar y guardar_todo.
+    """
+    nombre = "base"
+
+    def leer(self, coleccion):
+        raise NotImplementedError
+
+    def aplicar(self, coleccion, op):
+        raise NotImplementedError
+
+    def version(self, coleccion):
+        """
+        Marca barata que cambia siempre que lo que devolvería leer(coleccion) puede haber cambiado
+        (sin leer ni serializar los datos). None si el backend no sabe dar una.
+        """
+        return None
+
+    def consultar_rango(self, coleccion, inicio, fin, estado=None):
+        """Registros cuyo intervalo [fecha, fecha fin] se solapa con [inicio, fin] (sin rutinas)."""
+        campo_fin = CAMPO_FECHA_FIN[coleccion]
+        resultado = []
+        for r in self.leer(coleccion):
+            f_ini = parse_fecha(r.get('fecha'))
+            if not f_ini: continue
+            f_fin = parse_fecha(r.get(campo_fin)) or f_ini
+            if f_ini <= fin and f_fin >= inicio and (estado is None or r.get('estado') == estado):
+                resultado.append(r)
+        return resultado
+
+    def archivar(self, tareas):
+        """Mueve tareas al histórico mensual y las quita de la colección activa."""
+        raise NotImplementedError
+
+    def leer_archivo(self, mes):
+        """Tareas archivadas en el mes 'YYYY-MM'."""
+        return []
+
+    def meses_archivados(self):
+        return []
+
+    def leer_marca(self, clave):
+        return None
+
+    def guardar_marca(self, clave, valor):
+        pass
+
+    def estado_sincronizacion(self):
+        """(cambios pendientes de subir, último error o None)."""
+        return 0, None
+
+    def reintentar(self):
+        pass
+
+class AlmacenGitHub(AlmacenDatos):
+    """
+    Cada colección es un archivo JSON del repo (caché de lectura + cola de escritura diferida).
+    Sin conexión se sigue trabajando contra RespaldoLocal: las lecturas salen del último snapshot
+    bueno y los cambios se quedan en el WAL, que se reenvía en orden cuando vuelve la red.
+    Tras un fallo de red no se vuelve a intentar GitHub en SIN_RED_ESPERA segundos (la UI no se bloquea).
+    """
+    nombre = "github"
+
+    def __init__(self, respaldo=None):
+        self.respaldo = respaldo or respaldo_local()
+        self.lock = threading.Lock()
+        self.enviados = set()  # IDs del WAL ya encolados en este proceso
+        self.sin_red_hasta = 0.0
+        cola_escritura().observadores.append(self._confirmar_wal)
+
+    def _repo(self):
+        if time_lib.monotonic() < self.sin_red_hasta:
+            raise SinConexionError("Sin conexión con GitHub (trabajando en local)")
+        repo = obtener_conexion_repo()
+        if not repo:
+            raise SinConexionError("Sin conexión con GitHub")
+        return repo
+
+    def _leer_remoto(self, repo, coleccion):
+        return cola_escritura().leer(repo, ARCHIVOS_COLECCION[coleccion])
+
+    def _rutas(self, coleccion):
+        """Archivos del repo de los que sale la colección."""
+        return [ARCHIVOS_COLECCION[coleccion]]
+
+    def version(self, coleccion):
+        # SHA en caché de cada archivo (cambia al escribir o al recargar otro contenido),
+        # operaciones encoladas y confirmadas, y el respaldo local si se está sin red
+        cola = cola_escritura()
+        return (tuple(_entrada_cache_github(ruta).sha for ruta in self._rutas(coleccion)),
+                cola.version, cola.cambios, self.respaldo.generacion, time_lib.monotonic() < self.sin_red_hasta)
+
+    def _enviar(self, repo, coleccion, op, id_wal):
+        cola_escritura().encolar(repo, ARCHIVOS_COLECCION[coleccion], op)
+
+    def leer(self, coleccion):
+        try:
+            repo = self._repo()
+            self._reenviar(repo)
+            datos = self._leer_remoto(repo, coleccion)
+        except Exception as e:
+            if es_error_de_red(e):
+                self.sin_red_hasta = time_lib.monotonic() + SIN_RED_ESPERA
+            elif not isinstance(e, SinConexionError):
+                raise
+            return self.respaldo.leer(coleccion)
+        self.respaldo.guardar_snapshot(coleccion, datos)
+        return datos
+
+    def aplicar(self, coleccion, op):
+        self._anotar_y_enviar([(coleccion, op, None)])
+
+    def _reenviar(self, repo):
+        """Encola, en orden, las entradas del WAL que aún no se han mandado (incluidas las de otra ejecución)."""
+        with self.lock:
+            for entrada in self.respaldo.sin_enviar(self.enviados):
+                if entrada.get('ruta'):
+                    cola_escritura().encolar(repo, entrada['ruta'], entrada['op'])  # Histórico y marcas: tal cual
+                else:
+                    self._enviar(repo, entrada['coleccion'], entrada['op'], entrada['id'])
+                self.enviados.add(entrada['id'])
+
+    def _confirmar_wal(self, repo, path, datos):
+        # Con la cola vacía, todo lo encolado desde el WAL ya está en GitHub
+        with self.lock:
+            if self.enviados and cola_escritura().num_pendientes() == 0:
+                self.respaldo.confirmar(self.enviados)
+                self.enviados.clear()
+
+    def _anotar_y_enviar(self, cambios):
+        """Como aplicar(), para varios cambios [(coleccion, op, ruta)]: primero al WAL, luego a la cola."""
+        self.respaldo.anotar_lote(cambios)
+        try:
+            repo = self._repo()
+        except SinConexionError:
+            return  # Queda en el WAL hasta que vuelva la conexión
+        self._reenviar(repo)
+
+    def archivar(self, tareas):
+        # Altas en el histórico antes que los borrados, todo en el WAL a la vez: si el proceso muere
+        # a medias, al reenviar no puede quedar una tarea borrada sin archivar. En la cola van en el
+        # mismo lote: un único commit
+        cambios = [(None, {"accion": "crear", "item": t, "mensaje": f"Archivar tarea ID: {t['id']} en {mes}"},
+                    ruta_historico(mes))
+                   for mes, grupo in sorted(agrupar_por_mes(tareas).items()) for t in grupo]
+        cambios += [('tareas', {"accion": "borrar", "id": t['id'], "mensaje": f"Quitar tarea archivada ID: {t['id']}"}, None)
+                    for t in tareas]
+        self._anotar_y_enviar(cambios)
+
+    def leer_archivo(self, mes):
+        datos, _ = leer_json_github(self._repo(), ruta_historico(mes))
+        return datos
+
+    def meses_archivados(self):
+        try:
+            repo = self._repo()
+            with medir_github("listar histórico", repo):
+                contenidos = repo.get_contents(CARPETA_HISTORICO)
+        except UnknownObjectException:
+            return []
+        return sorted((c.name[:-5] for c in contenidos if c.name.endswith(".json")), reverse=True)
+
+    def leer_marca(self, clave):
+        marcas = cola_escritura().leer(self._repo(), MARCAS_FILE)
+        return next((m.get('valor') for m in marcas if m.get('id') == clave), None)
+
+    def guardar_marca(self, clave, valor):
+        self._anotar_y_enviar([(None, {
+            "accion": "crear", "item": {"id": clave, "valor": valor}, "mensaje": f"Marca {clave}: {valor}",
+        }, MARCAS_FILE)])
+
+    def estado_sincronizacion(self):
+        cola = cola_escritura()
+        locales = len(self.respaldo.sin_enviar(self.enviados))
+        if locales:
+            return cola.num_pendientes() + locales, f"sin conexión, {locales} cambio(s) guardado(s) en este equipo"
+        return cola.num_pendientes(), cola.ultimo_error
+
+    def reintentar(self):
+        self.sin_red_hasta = 0.0
+        cola_escritura().reintentar()
+
+class AlmacenDiarioGitHub(AlmacenGitHub):
+    """
+    Variante con diario: cada cambio se añade como un registro a '<colección>.diario.jsonl'
+    en lugar de reescribir el JSON completo. El estado es el snapshot (tareas.json / horario.json)
+    más el diario reproducido en orden. Cuando el diario supera UMBRAL_COMPACTACION_DIARIO
+    registros se pliega en el snapshot y se recorta.
+    """
+    nombre = "github_diario"
+
+    def __init__(self, umbral=UMBRAL_COMPACTACION_DIARIO, respaldo=None):
+        super().__init__(respaldo)
+        self.umbral = umbral
+        self.ultima_compactacion = {}  # {colección: id de la última marca de compactación vista}
+        cola_escritura().observadores.append(self._tras_volcado)
+
+    def _registros(self, repo, coleccion):
+        registros = cola_escritura().leer(repo, ARCHIVOS_DIARIO[coleccion])
+        return sorted(registros, key=lambda r: r.get('ts', 0))
+
+    def _rutas(self, coleccion):
+        return [ARCHIVOS_COLECCION[coleccion], ARCHIVOS_DIARIO[coleccion]]
+
+    def _leer_remoto(self, repo, coleccion):
+        registros = self._registros(repo, coleccion)
+        # Si otro proceso compactó, nuestro snapshot en caché puede no incluir lo que ya salió del diario
+        marcas = [r['id'] for r in registros if 'compactados' in r]
+        if marcas and self.ultima_compactacion.get(coleccion) != marcas[-1]:
+            invalidar_cache_github(ARCHIVOS_COLECCION[coleccion])
+            self.ultima_compactacion[coleccion] = marcas[-1]
+        datos, _ = leer_json_github(repo, ARCHIVOS_COLECCION[coleccion])
+        for r in registros:
+            if 'op' in r:
+                datos = aplicar_operacion(datos, r['op'])
+        return datos
+
+    def _enviar(self, repo, coleccion, op, id_wal):
+        # El id del WAL identifica el registro: reenviarlo tras un reinicio no lo duplica
+        registro = {"id": id_wal, "ts": time_lib.time(), "op": op}
+        cola_escritura().encolar(repo, ARCHIVOS_DIARIO[coleccion], {
+            "accion": "crear", "item": registro, "mensaje": op['mensaje'],
+        })
+
+    def _tras_volcado(self, repo, path, registros):
+        for coleccion, ruta in ARCHIVOS_DIARIO.items():
+            if path == ruta and len(registros) > self.umbral:
+                try:
+                    self.compactar(repo, coleccion)
+                except Exception as e:
+                    with cola_escritura().cond:
+                        cola_escritura().ultimo_error = f"Compactación de {coleccion}: {describir_error_github(e)}"
+
+    def compactar(self, repo, coleccion):
+        """Pliega el diario en el snapshot y quita del diario lo plegado, en un mismo commit."""
+        ruta_diario = ARCHIVOS_DIARIO[coleccion]
+        registros, _ = leer_json_github(repo, ruta_diario)
+        plegados = sorted((r for r in registros if 'op' in r), key=lambda r: r.get('ts', 0))
+        if not plegados:
+            return
+
+        def plegar(datos):
+            for r in plegados:
+                datos = aplicar_operacion(datos, r['op'])
+            return datos
+
+        ids = {r['id'] for r in plegados}
+        marca = {"id": f"compactacion-{uuid.uuid4().hex}", "ts": time_lib.time(), "compactados": len(ids)}
+        self.ultima_compactacion[coleccion] = marca['id']
+        # Las altas concurrentes en el diario se conservan gracias a la fusión por id
+        escribir_lote_github(repo, {
+            ARCHIVOS_COLECCION[coleccion]: plegar,
+            ruta_diario: lambda actuales: [marca] + [r for r in actuales if 'op' in r and r['id'] not in ids],
+        }, f"Compactar diario de {coleccion} ({len(plegados)} cambios)")
+
+class AlmacenSQLite(AlmacenDatos):
+    """
+    Colecciones en una base SQLite local, una tabla por colección con índices en id, fecha,
+    fecha_fin y estado. Las consultas por rango de fechas se resuelven en el motor.
+    Si se indica 'replica', cada cambio se reenvía también a ese almacén (p. ej. GitHub).
+    """
+    nombre = "sqlite"
+
+    def __init__(self, ruta, replica=None):
+        self.replica = replica
+        self.lock = threading.Lock()
+        self.cambios = 0  # Escrituras de este proceso (las de otros las delata PRAGMA data_version)
+        self.conn = sqlite3.connect(ruta, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            for tabla in ARCHIVOS_COLECCION:
+                self.conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {tabla} ("
+                    "id INTEGER PRIMARY KEY, fecha TEXT, fecha_fin TEXT, estado TEXT, datos TEXT NOT NULL)"
+                )
+                for columna in ("fecha", "fecha_fin", "estado"):
+                    self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabla}_{columna} ON {tabla}({columna})")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS historico_tareas ("
+                "mes TEXT NOT NULL, id INTEGER NOT NULL, datos TEXT NOT NULL, PRIMARY KEY (mes, id))"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS marcas (clave TEXT PRIMARY KEY, valor TEXT)")
+        if replica:
+            self._importar_si_vacia()
+
+    def _fila(self, coleccion, r):
+        return (r['id'], r.get('fecha'), r.get(CAMPO_FECHA_FIN[coleccion]), r.get('estado'), json.dumps(r, ensure_ascii=False))
+
+    def _importar_si_vacia(self):
+        """Primera ejecución con réplica: carga los datos existentes desde ella."""
+        for coleccion in ARCHIVOS_COLECCION:
+            with self.lock:
+                vacia = self.conn.execute(f"SELECT 1 FROM {coleccion} LIMIT 1").fetchone() is None
+            if not vacia: continue
+            try:
+                registros = self.replica.leer(coleccion)
+            except Exception:
+                continue
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO {coleccion} VALUES (?, ?, ?, ?, ?)",
+                    [self._fila(coleccion, r) for r in registros],
+                )
+                self.cambios += 1
+
+    def leer(self, coleccion):
+        with self.lock:
+            filas = self.conn.execute(f"SELECT datos FROM {coleccion} ORDER BY id").fetchall()
+        return [json.loads(f[0]) for f in filas]
+
+    def aplicar(self, coleccion, op):
+        accion = op['accion']
+        with self.lock, self.conn:
+            self.cambios += 1
+            if accion == 'crear':
+                self.conn.execute(f"INSERT OR REPLACE INTO {coleccion} VALUES (?, ?, ?, ?, ?)", self._fila(coleccion, op['item']))
+            elif accion == 'actualizar':
+                id_, fecha, fecha_fin, estado, datos = self._fila(coleccion, op['item'])
+                self.conn.execute(
+                    f"UPDATE {coleccion} SET fecha = ?, fecha_fin = ?, estado = ?, datos = ? WHERE id = ?",
+                    (fecha, fecha_fin, estado, datos, id_),
+                )
+            elif accion == 'borrar':
+                self.conn.execute(f"DELETE FROM {coleccion} WHERE id = ?", (op['id'],))
+            elif accion == 'guardar_todo':
+                self.conn.execute(f"DELETE FROM {coleccion}")
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO {coleccion} VALUES (?, ?, ?, ?, ?)",
+                    [self._fila(coleccion, r) for r in op['lista']],
+                )
+        if self.replica:
+            self.replica.aplicar(coleccion, op)
 
-def actualizar_horario_clases(force=False, driver=None):
-    """
-    Scrapea la web de la universidad.
-    Acepta driver opcional para reutilizar sesión.
-    """
-    # 1. Chequeo de Caché
-    if not force and os.path.exists(HORARIO_FILE):
-        try:
-            last_mod = datetime.fromtimestamp(os.path.getmtime(HORARIO_FILE))
-            if datetime.now() - last_mod < timedelta(hours=12):
-                with open(HORARIO_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except: pass
+    def version(self, coleccion):
+        with self.lock:
+            return self.cambios, self.conn.execute("PRAGMA data_version").fetchone()[0]
 
-    # 2. Configurar Selenium
-    driver_propio = False
-    if not driver:
-        driver = init_driver()
-        driver_propio = True
-        
-    if not driver:
-        st.error("No se pudo iniciar el driver de Chrome.")
-        return []
-    
-    data_clases = []
-    
-    try:
-        url = "https://portales.uloyola.es/LoyolaHorario/horario.xhtml?curso=2025%2F26&tipo=M&titu=2175&campus=2&ncurso=1&grupo=A"
-        driver.get(url)
-        
-        # Esperar carga inicial
-        wait = WebDriverWait(driver, 15)
-        wait.until(EC.presence_of_element_located((By.CLASS_NAME, "fc-view-harness")))
-        
-        # Iterar 12 semanas (3 meses aprox)
-        weeks_to_scrape = 12
-        current_year = get_madrid_date().year
-        
-        for _ in range(weeks_to_scrape):
-            try:
-                try:
-                    WebDriverWait(driver, 5).until(
-                        EC.presence_of_element_located((By.CLASS_NAME, "fc-event"))
-                    )
-                except: pass
-                
-                time_lib.sleep(1.5)
+    def consultar_rango(self, coleccion, inicio, fin, estado=None):
+        consulta = f"SELECT datos FROM {coleccion} WHERE fecha <= ? AND COALESCE(fecha_fin, fecha) >= ?"
+        parametros = [str(fin), str(inicio)]
+        if estado is not None:
+            consulta += " AND estado = ?"
+            parametros.append(estado)
+        with self.lock:
+            filas = self.conn.execute(consulta + " ORDER BY id", parametros).fetchall()
+        return [json.loads(f[0]) for f in filas]
 
-                headers = driver.find_elements(By.CLASS_NAME, "fc-col-header-cell")
-                column_map = []
-                
-                for h in headers:
-                    d_date = h.get_attribute("data-date")
-                    if d_date:
-                        rect = h.rect
-                        column_map.append({
-                            "date": d_date,
-                            "x_start": rect['x'],
-                            "x_end": rect['x'] + rect['width']
-                        })
-                
-                events = driver.find_elements(By.CLASS_NAME, "fc-event")
-                
-                for ev in events:
-                    try:
-                        ev_rect = ev.rect
-                        ev_center_x = ev_rect['x'] + (ev_rect['width'] / 2)
-                        
-                        fecha_clase = None
-                        for col in column_map:
-                            if col['x_start'] <= ev_center_x <= col['x_end']:
-                                fecha_clase = col['date']
-                                break
-                        
-                        if not fecha_clase: continue
-                        
-                        full_text = ev.text 
-                        try:
-                            hora_text = ev.find_element(By.CLASS_NAME, "fc-event-time").text
-                            content_text = ev.find_element(By.CLASS_NAME, "fc-event-title").text
-                        except:
-                            lines = full_text.split('\n')
-                            hora_text = lines[0] if lines else ""
-                            content_text = lines[1] if len(lines) > 1 else ""
-
-                        parts = content_text.split("/")
-                        asig = parts[0].strip()
-                        aula = parts[1].replace("Aula:", "").strip() if len(parts) > 1 else "Desconocido"
-                        
-                        try:
-                            h_parts = hora_text.split("-")
-                            new_times = []
-                            for hp in h_parts:
-                                t_obj = datetime.strptime(hp.strip(), "%H:%M")
-                                t_new = t_obj + timedelta(hours=1)
-                                new_times.append(t_new.strftime("%H:%M"))
-                            
-                            hora_text = f"{new_times[0]} - {new_times[1]}"
-                        except: pass
-
-                        data_clases.append({
-                            "asignatura": asig,
-                            "titulo": asig,
-                            "aula": aula,
-                            "fecha": fecha_clase,
-                            "hora": hora_text,
-                            "dia_completo": False
-                        })
-                        
-                    except Exception as e_ev: pass
-                
-                try:
-                    btn_next = driver.find_element(By.CLASS_NAME, "fc-next-button")
-                    btn_next.click()
-                    time_lib.sleep(1.0) 
-                except: break 
-                   
-            except Exception as e: break
-
-        if driver_propio:
-            driver.quit()
-        
-        # Guardar en JSON local
-        with open(HORARIO_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data_clases, f, indent=4, ensure_ascii=False)
-            
-        return data_clases
+    def archivar(self, tareas):
+        with self.lock, self.conn:  # Copia y borrado en la misma transacción
+            self.cambios += 1
+            for mes, grupo in agrupar_por_mes(tareas).items():
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO historico_tareas VALUES (?, ?, ?)",
+                    [(mes, t['id'], json.dumps(t, ensure_ascii=False)) for t in grupo],
+                )
+            self.conn.executemany("DELETE FROM tareas WHERE id = ?", [(t['id'],) for t in tareas])
+        if self.replica:
+            self.replica.archivar(tareas)
 
-    except Exception as e:
-        st.error(f"Error actualizando horario: {e}")
-        if driver_propio: driver.quit()
-        return []
+    def leer_archivo(self, mes):
+        with self.lock:
+            filas = self.conn.execute("SELECT datos FROM historico_tareas WHERE mes = ? ORDER BY id", (mes,)).fetchall()
+        return [json.loads(f[0]) for f in filas]
 
-def actualizar_horario_sevilla(driver=None):
-    """Scrapea SOLO partidos en CASA del Sevilla FC (Nervión)."""
-    driver_propio = False
-    if not driver:
-        driver = init_driver()
-        driver_propio = True
-        
-    if not driver: return []
-    
-    data_futbol = []
-    try:
-        url = "https://www.laliga.com/clubes/sevilla-fc/proximos-partidos"
-        driver.get(url)
-        
-        # Cookies: Intentar varios textos
-        try:
-            btns = driver.find_elements(By.TAG_NAME, "button")
-            for b in btns:
-                txt = b.text.lower()
-                if "aceptar" in txt or "accept" in txt or "consentir" in txt:
-                    b.click()
-                    break
-            time_lib.sleep(1)
-        except: pass
-        
-        import re
-        
-        time_lib.sleep(2)  # Esperar carga de la tabla
-        filas = driver.find_elements(By.TAG_NAME, "tr")
-        
-        for fila in filas:
-            if "more-info" in (fila.get_attribute("class") or ""): continue
-            
-            try:
-                texto_fila = fila.text
-                if not texto_fila: continue
-                
-                # 1. Buscar Fecha (DD.MM.YYYY)
-                match_fecha = re.search(r"(\d{2})\.(\d{2})\.(\d{4})", texto_fila)
-                if not match_fecha: continue
-                
-                dia = int(match_fecha.group(1))
-                mes = int(match_fecha.group(2))
-                anio = int(match_fecha.group(3))
-                fecha_obj = date(anio, mes, dia)
-                fecha_iso = fecha_obj.strftime("%Y-%m-%d")
-                
-                # 2. Buscar Hora (HH:MM o -- : --)
-                match_hora = re.search(r"(\d{2}:\d{2})", texto_fila)
-                if match_hora:
-                    hora_txt = match_hora.group(1)
-                    es_dia_completo = False
-                else:
-                    hora_txt = None
-                    es_dia_completo = True
-                
-                # 3. Detectar si es partido en CASA
-                # En la tabla: Local VS Visitante
-                # Si el primer equipo (antes de VS) es Sevilla FC → juega en casa
-                lineas = [l.strip() for l in texto_fila.split('\n') if l.strip()]
-                
-                idx_vs = -1
-                for i, l in enumerate(lineas):
-                    if l.upper() == "VS":
-                        idx_vs = i
-                        break
-                
-                if idx_vs <= 0: continue
-                
-                local_name = lineas[idx_vs - 1].lower()
-                
-                # Solo guardar si Sevilla es LOCAL (juega en casa / Nervión)
-                es_casa = "sevilla" in local_name
-                if not es_casa:
-                    continue
+    def meses_archivados(self):
+        with self.lock:
+            filas = self.conn.execute("SELECT DISTINCT mes FROM historico_tareas ORDER BY mes DESC").fetchall()
+        return [f[0] for f in filas]
 
-                data_futbol.append({
-                    "titulo": "⚽ Partido en Nervión",
-                    "asignatura": "Fútbol",
-                    "aula": "Nervión",
-                    "fecha": fecha_iso,
-                    "hora": hora_txt,
-                    "dia_completo": es_dia_completo,
-                    "es_futbol": True
-                })
-                
-            except Exception:
-                pass
-                
-        if driver_propio: driver.quit()
-        
-        # Guardar
-        with open("horario_futbol.json", 'w', encoding='utf-8') as f:
-            json.dump(data_futbol, f, indent=4, ensure_ascii=False)
-            
-        return data_futbol
+    def leer_marca(self, clave):
+        with self.lock:
+            fila = self.conn.execute("SELECT valor FROM marcas WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else None
 
-    except Exception as e:
-        st.error(f"Error cargando fútbol: {e}")
-        if driver_propio: driver.quit()
-        return []
+    def guardar_marca(self, clave, valor):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO marcas VALUES (?, ?)", (clave, valor))
+        if self.replica:
+            self.replica.guardar_marca(clave, valor)
 
-# --- GESTIÓN DE PERSISTENCIA (GITHUB) ----
+    def estado_sincronizacion(self):
+        return self.replica.estado_sincronizacion() if self.replica else (0, None)
 
-def obtener_conexion_repo():
-    """Conecta con la API de GitHub usando el token almacenado en secrets."""
+    def reintentar(self):
+        if self.replica:
+            self.replica.reintentar()
+
+@st.cache_resource(show_spinner=False)
+def _crear_almacen(backend, ruta_sqlite, replicar_github):
+    if backend == "sqlite":
+        return AlmacenSQLite(ruta_sqlite, replica=AlmacenGitHub() if replicar_github else None)
+    if backend == "github_diario":
+        return AlmacenDiarioGitHub()
+    return AlmacenGitHub()
+
+def obtener_almacen():
+    """
+    Devuelve el backend configurado (STORAGE_BACKEND = 'github' | 'github_diario' | 'sqlite').
+    Con SQLite, SQLITE_PATH indica el archivo y SQLITE_REPLICAR_GITHUB=1 replica los cambios en GitHub.
+    """
+    backend = str(obtener_config("STORAGE_BACKEND", "github")).lower()
+    ruta_sqlite = obtener_config("SQLITE_PATH", "autogestor.db")
+    replicar = str(obtener_config("SQLITE_REPLICAR_GITHUB", "0")).lower() in ("1", "true", "si", "sí")
+    return _crear_almacen(backend, ruta_sqlite, replicar)
+
+def version_almacen():
+    """Versión de tareas y horario en el almacén (None si no se sabe): clave del índice de calendario."""
     try:
-        if "GITHUB_TOKEN" not in st.secrets:
-            st.error("❌ Falta el Token en Secrets (.streamlit/secrets.toml).")
-            return None
-        
-        token = st.secrets["GITHUB_TOKEN"]
-        g = Github(token)
-        return g.get_repo(REPO_NAME)
-    except Exception as e:
-        st.error(f"Error conectando a GitHub: {e}")
+        almacen = obtener_almacen()
+        versiones = (almacen.version('tareas'), almacen.version('horario'))
+    except Exception:
         return None
+    return None if None in versiones else (almacen.nombre, versiones)
+
+@st.cache_resource(show_spinner=False)
+def _limpiezas_hechas():
+    """{backend: fecha} de la última limpieza en este proceso (evita leer la marca en cada rerun)."""
+    return {}
+
+def archivar_tareas_antiguas(hoy):
+    """
+    Pasa al histórico las tareas completadas cuya fecha ya pasó. Se ejecuta como mucho
+    una vez al día (marca MARCA_LIMPIEZA en el almacén). Devuelve los IDs archivados.
+    """
+    almacen = obtener_almacen()
+    hechas = _limpiezas_hechas()
+    if hechas.get(almacen.nombre) == hoy:
+        return set()
+    if almacen.leer_marca(MARCA_LIMPIEZA) != str(hoy):
+        viejas = almacen.consultar_rango('tareas', date.min, hoy - timedelta(days=1), estado='Completada')
+        if viejas:
+            almacen.archivar(viejas)
+        almacen.guardar_marca(MARCA_LIMPIEZA, str(hoy))
+        hechas[almacen.nombre] = hoy
+        return {t['id'] for t in viejas}
+    hechas[almacen.nombre] = hoy
+    return set()
 
 def gestionar_tareas(accion, nueva_tarea=None, id_tarea_eliminar=None, tarea_actualizada=None, lista_completa=None):
     """
-    Gestiona el CRUD de tareas en el archivo JSON de GitHub.
+    Gestiona el CRUD de tareas sobre el almacén configurado (GitHub o SQLite).
     accion: 'leer', 'crear', 'borrar', 'actualizar', 'guardar_todo'
     """
-    repo = obtener_conexion_repo()
-    if not repo:
-        return [] if accion == 'leer' else False
-
     try:
-        # Intentar leer el archivo existente
-        try:
-            contents = repo.get_contents(FILE_PATH)
-            datos = json.loads(contents.decoded_content.decode())
-        except GithubException:
-            # Si no existe, inicializamos lista vacía create_file luego
-            datos = []
-            contents = None
-
+        almacen = obtener_almacen()
         if accion == 'leer':
-            return datos
+            return almacen.leer('tareas')
 
         elif accion == 'crear' and nueva_tarea:
-            datos.append(nueva_tarea)
-            mensaje = f"Nueva tarea: {nueva_tarea['titulo']}"
+            op = {"accion": "crear", "item": nueva_tarea, "mensaje": f"Nueva tarea: {nueva_tarea['titulo']}"}
         
         elif accion == 'borrar' and id_tarea_eliminar is not None:
-            datos = [t for t in datos if t.get('id') != id_tarea_eliminar]
-            mensaje = f"Borrar tarea ID: {id_tarea_eliminar}"
+            op = {"accion": "borrar", "id": id_tarea_eliminar, "mensaje": f"Borrar tarea ID: {id_tarea_eliminar}"}
 
         elif accion == 'actualizar' and tarea_actualizada:
             # Reemplazar la tarea con el mismo ID
-            datos = [t if t.get('id') != tarea_actualizada['id'] else tarea_actualizada for t in datos]
-            mensaje = f"Actualizar tarea: {tarea_actualizada['titulo']}"
+            op = {"accion": "actualizar", "item": tarea_actualizada, "mensaje": f"Actualizar tarea: {tarea_actualizada['titulo']}"}
             
         elif accion == 'guardar_todo' and lista_completa is not None:
-            datos = lista_completa
-            mensaje = "Limpieza automática de tareas antiguas"
+            op = {"accion": "guardar_todo", "lista": lista_completa, "mensaje": "Limpieza automática de tareas antiguas"}
         
         else:
             return False
 
-        # Guardar cambios
-        json_content = json.dumps(datos, indent=4)
-        if contents:
-            repo.update_file(contents.path, mensaje, json_content, contents.sha)
-        else:
-            repo.create_file(FILE_PATH, "Inicializar tareas.json", json_content)
-        
+        almacen.aplicar('tareas', op)
         return True
 
+    except SinConexionError:
+        return [] if accion == 'leer' else False
     except Exception as e:
-        st.error(f"Error operando en GitHub ({accion}): {e}")
-        return False
+        st.error(f"Error operando en el almacén ({accion}): {describir_error_github(e)}")
+        return [] if accion == 'leer' else False
 
 def gestionar_horario(accion, nuevo_item=None, id_eliminar=None, item_actualizado=None):
     """
-    Gestiona el archivo horario.json en GitHub.
+    Gestiona el horario (horario.json en GitHub o tabla 'horario' en SQLite).
     """
-    token = st.secrets["GITHUB_TOKEN"]
-    g = Github(token)
-    repo = g.get_repo(REPO_NAME)
-    file_path = "horario.json"
-    
     try:
-        contents = repo.get_contents(file_path)
-        data = json.loads(contents.decoded_content.decode())
-    except:
-        data = [] 
+        almacen = obtener_almacen()
+        if accion == 'leer':
+            return almacen.leer('horario')
 
-    if accion == 'leer':
-        return data
+        elif accion == 'crear':
+            op = {"accion": "crear", "item": nuevo_item, "mensaje": "Nuevo horario/evento añadido"}
 
-    elif accion == 'crear':
-        data.append(nuevo_item)
-        mensaje = "Nuevo horario/evento añadido"
+        elif accion == 'borrar':
+            op = {"accion": "borrar", "id": id_eliminar, "mensaje": "Elemento eliminado"}
 
-    elif accion == 'borrar':
-        data = [t for t in data if t['id'] != id_eliminar]
-        mensaje = "Elemento eliminado"
+        elif accion == 'actualizar':
+            op = {"accion": "actualizar", "item": item_actualizado, "mensaje": "Horario actualizado"}
 
-    elif accion == 'actualizar':
-        for index, item in enumerate(data):
-            if item['id'] == item_actualizado['id']:
-                data[index] = item_actualizado
-                break
-        mensaje = "Horario actualizado"
-    
-    # GUARDAR
-    try:
-        updated_content = json.dumps(data, indent=4)
-        if 'contents' in locals():
-             repo.update_file(contents.path, mensaje, updated_content, contents.sha)
         else:
-             repo.create_file(file_path, "Init horario", updated_content)
+            return False
+        
+        almacen.aplicar('horario', op)
         return True
+
+    except SinConexionError:
+        return [] if accion == 'leer' else False
     except Exception as e:
-        st.error(f"Error guardando horario: {e}")
-        return False
+        st.error(f"Error operando en el almacén del horario ({accion}): {describir_error_github(e)}")
+        return [] if accion == 'leer' else False
+
+
+# --- MODELO DE EVENTOS ---
+
+def parse_fecha(valor):
+    """Convierte 'YYYY-MM-DD' en date. Devuelve None si no es válida."""
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except (ValueError, TypeError):
+        return None
+
+def parse_minutos(valor):
+    """Convierte 'HH:MM' en minutos desde medianoche. Devuelve None si no es válida."""
+    if not valor:
+        return None
+    try:
+        h, m = valor.strip().split(":")
+        return int(h) * 60 + int(m)
+    except (ValueError, AttributeError):
+        return None
+
+def formato_minutos(minutos):
+    """Convierte minutos desde medianoche en 'HH:MM'."""
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+FIN_DEL_DIA = 23 * 60 + 59
+
+class Evento:
+    """
+    Evento normalizado del calendario (clase, partido, horario o tarea).
+    Fechas y horas se parsean una sola vez al cargar; 'raw' conserva el dict original para persistir cambios.
+    """
+    __slots__ = (
+        "fuente", "id", "titulo", "fecha", "fecha_fin", "inicio", "fin", "dia_completo",
+        "orden", "color", "lugar", "descripcion", "tipo", "estado", "prioridad",
+        "es_rutina", "es_multidia", "dias_semana", "raw", "origen",
+    )
+
+    def __init__(self, fuente, titulo, raw, fecha=None, fecha_fin=None, inicio=None, fin=None,
+                 dia_completo=False, orden=None, color="#808080", lugar="", descripcion="", tipo="",
+                 id=None, estado=None, prioridad=None, es_rutina=False, es_multidia=False, dias_semana=(),
+                 origen=None):
+        self.fuente = fuente
+        self.id = id
+        self.titulo = titulo
+        self.fecha = fecha
+        self.fecha_fin = fecha_fin
+        self.inicio = inicio
+        self.fin = fin
+        self.dia_completo = dia_completo
+        self.orden = orden if orden is not None else (inicio if inicio is not None else 0)
+        self.color = color
+        self.lugar = lugar
+        self.descripcion = descripcion
+        self.tipo = tipo
+        self.estado = estado
+        self.prioridad = prioridad
+        self.es_rutina = es_rutina
+        self.es_multidia = es_multidia
+        self.dias_semana = dias_semana
+        self.raw = raw
+        self.origen = origen  # FuenteScraping de la que viene (None en tareas y horario propio)
+
+    @property
+    def hora_inicio(self):
+        return formato_minutos(self.inicio) if self.inicio is not None else ""
+
+    @property
+    def hora_texto(self):
+        """Texto de hora para mostrar: 'HH:MM - HH:MM', 'HH:MM' o 'Todo el día'."""
+        if self.inicio is None:
+            return "Todo el día"
+        if self.fin is None:
+            return formato_minutos(self.inicio)
+        return f"{formato_minutos(self.inicio)} - {formato_minutos(self.fin)}"
+
+    @property
+    def es_deadline(self):
+        return self.fuente == 'tarea' and self.fecha_fin is not None
+
+    @property
+    def completada(self):
+        return self.estado == 'Completada'
+
+def evento_desde_horario(item):
+    """Adaptador para elementos de horario.json (rutinas, eventos y multi-día)."""
+    inicio = fin = None
+    if not item.get('dia_completo'):
+        inicio = parse_minutos(item.get('hora_inicio'))
+        fin = parse_minutos(item.get('hora_fin')) if inicio is not None else None
+    es_multidia = bool(item.get('es_multidia') and item.get('fecha') and item.get('fecha_fin_evento'))
+    return Evento(
+        'dinamico', item.get('titulo', ''), item,
+        fecha=parse_fecha(item.get('fecha')),
+        fecha_fin=parse_fecha(item.get('fecha_fin_evento')) if es_multidia else None,
+        inicio=inicio, fin=fin,
+        dia_completo=inicio is None,
+        color=item.get('color') or '#1E90FF',
+        lugar=item.get('ubicacion', ''),
+        descripcion=item.get('descripcion', ''),
+        tipo=item.get('tipo', 'Evento'),
+        id=item.get('id'),
+        es_rutina=bool(item.get('es_rutina')),
+        es_multidia=es_multidia,
+        dias_semana=tuple(item.get('dias_semana') or ()),
+    )
+
+def evento_desde_tarea(t):
+    """Adaptador para tareas (fecha de creación, deadline opcional y hora opcional)."""
+    dia_completo = t.get('dia_completo', True)
+    inicio = None if dia_completo else parse_minutos(t.get('hora'))
+    if dia_completo:
+        orden = 0
+    else:
+        orden = inicio if inicio is not None else FIN_DEL_DIA
+    return Evento(
+        'tarea', t.get('titulo', ''), t,
+        fecha=parse_fecha(t.get('fecha')),
+        fecha_fin=parse_fecha(t.get('fecha_fin')),
+        inicio=inicio,
+        dia_completo=inicio is None,
+        orden=orden,
+        color=COLORES_TIPO.get(t.get('tipo', 'Otro'), '#808080'),
+        tipo=t.get('tipo', 'Otro'),
+        id=t.get('id'),
+        estado=t.get('estado'),
+        prioridad=t.get('prioridad', 'Normal'),
+    )
+
+
+# --- MOTOR DE RECURRENCIAS E INTERVALOS ---
+
+class ReglaRecurrencia:
+    """Rutina semanal con vigencia opcional (desde/hasta) y días saltados."""
+    __slots__ = ("evento", "dias", "desde", "hasta", "excepciones")
+
+    def __init__(self, evento, dias, desde=None, hasta=None, excepciones=()):
+        self.evento = evento
+        self.dias = frozenset(dias)
+        self.desde = desde
+        self.hasta = hasta
+        self.excepciones = frozenset(excepciones)
+
+    def ocurre(self, dia):
+        if dia.weekday() not in self.dias or dia in self.excepciones:
+            return False
+        if self.desde and dia < self.desde:
+            return False
+        if self.hasta and dia > self.hasta:
+            return False
+        return True
+
+def regla_desde_horario(item, ev):
+    """Construye la regla de recurrencia de una rutina de horario.json."""
+    excepciones = [f for f in (parse_fecha(x) for x in item.get('excepciones') or []) if f]
+    return ReglaRecurrencia(
+        ev, ev.dias_semana,
+        desde=parse_fecha(item.get('fecha_inicio_rutina')),
+        hasta=parse_fecha(item.get('fecha_fin_rutina')),
+        excepciones=excepciones,
+    )
+
+class MotorRecurrencias:
+    """Agrupa las rutinas por día de la semana y las expande solo sobre la ventana pedida."""
+
+    def __init__(self):
+        self.reglas_por_dia = {i: [] for i in range(7)}
+
+    def agregar(self, regla):
+        for d in regla.dias:
+            self.reglas_por_dia[d].append(regla)
+
+    def expandir(self, inicio, fin):
+        """Genera (fecha, evento) para cada ocurrencia de rutina en [inicio, fin]."""
+        dia = inicio
+        while dia <= fin:
+            for regla in self.reglas_por_dia[dia.weekday()]:
+                if regla.ocurre(dia):
+                    yield dia, regla.evento
+            dia += timedelta(days=1)
+
+class IndiceIntervalos:
+    """
+    Índice de intervalos de fechas (eventos multi-día) por cubos semanales.
+    Cada intervalo se registra en las semanas que cubre, así una consulta de día o semana
+    solo mira los intervalos de esas semanas en vez de recorrer todos.
+    """
+
+    def __init__(self):
+        self.cubos = {}
+
+    @staticmethod
+    def _semana(dia):
+        return (dia.toordinal() - 1) // 7  # El ordinal 1 (01/01/0001) es lunes
+
+    def agregar(self, inicio, fin, valor):
+        if fin < inicio: return
+        entrada = (inicio, fin, valor)
+        for semana in range(self._semana(inicio), self._semana(fin) + 1):
+            self.cubos.setdefault(semana, []).append(entrada)
+
+    def solapan(self, inicio, fin):
+        """Devuelve [(inicio, fin, valor)] de los intervalos que se solapan con [inicio, fin]."""
+        vistos = set()
+        resultado = []
+        for semana in range(self._semana(inicio), self._semana(fin) + 1):
+            for entrada in self.cubos.get(semana, ()):
+                if id(entrada) in vistos: continue
+                vistos.add(id(entrada))
+                if entrada[0] <= fin and entrada[1] >= inicio:
+                    resultado.append(entrada)
+        return resultado
+
+
+# --- ÍNDICE DE CALENDARIO ---
+
+class IndiceCalendario:
+    """
+    Índice fecha -> eventos de todas las fuentes (externas, horario y tareas).
+    Se construye una vez por versión de datos; las vistas consultan rangos con get_items.
+    Rutinas y eventos multi-día no se expanden día a día: van al motor de recurrencias
+    y al índice de intervalos, que solo se evalúan sobre la ventana consultada.
+    """
+
+    def __init__(self, tareas, horario_dinamico, externos):
+        self.por_fecha = {}
+        self.recurrencias = MotorRecurrencias()
+        self.intervalos = IndiceIntervalos()
+        self.tareas = [evento_desde_tarea(t) for t in tareas]
+
+        # Fuentes externas (registros_externos): cada una sabe convertir sus registros
+        for fuente, r in externos:
+            ev = fuente.a_evento(r)
+            self._indexar(ev.fecha, ev)
+
+        for item in horario_dinamico:
+            ev = evento_desde_horario(item)
+            if ev.es_rutina:
+                self.recurrencias.agregar(regla_desde_horario(item, ev))
+            elif ev.es_multidia:
+                if ev.fecha and ev.fecha_fin:
+                    self.intervalos.agregar(ev.fecha, ev.fecha_fin, ev)
+            else:
+                self._indexar(ev.fecha, ev)
+
+        # Las tareas con deadline se pintan el día de entrega, el resto en su fecha
+        for ev in self.tareas:
+            self._indexar(ev.fecha_fin or ev.fecha, ev)
+
+    def _indexar(self, dia, ev):
+        if dia is None: return
+        self.por_fecha.setdefault(dia, []).append(ev)
+
+    def get_items(self, inicio, fin):
+        """Devuelve {fecha: [Evento, ...]} para cada día entre inicio y fin (incluidos)."""
+        resultado = {}
+        dia = inicio
+        while dia <= fin:
+            resultado[dia] = list(self.por_fecha.get(dia, ()))
+            dia += timedelta(days=1)
+
+        for ev_ini, ev_fin, ev in self.intervalos.solapan(inicio, fin):
+            dia = max(ev_ini, inicio)
+            while dia <= min(ev_fin, fin):
+                resultado[dia].append(ev)
+                dia += timedelta(days=1)
+
+        for dia, ev in self.recurrencias.expandir(inicio, fin):
+            resultado[dia].append(ev)
+        return resultado
+
+def obtener_indice_calendario(tareas, horario_dinamico, fuentes, version_datos):
+    """
+    Devuelve el índice de calendario, reconstruyéndolo solo cuando cambia su versión: la del
+    almacén (version_almacen, tomada antes de leer tareas y horario) y la de la caché de cada
+    fuente. Comparar la versión no recorre los datos; las fuentes solo se leen al reconstruir.
+    """
+    version = (version_datos, tuple((fuente.nombre, fuente.version()) for fuente in fuentes))
+
+    cache = st.session_state.get("indice_calendario")
+    if cache and version_datos is not None and cache[0] == version:
+        return cache[1]
+
+    indice = IndiceCalendario(tareas, horario_dinamico, registros_externos(fuentes))
+    st.session_state["indice_calendario"] = (version, indice)
+    return indice
 
 
 # --- IMPLEMENTACIÓN DE VISTAS ---
 
+def render_cambios_horario(cambios):
+    """Resumen de lo que cambió en la última actualización del horario (añadidas, quitadas, movidas)."""
+    if not cambios or not any(cambios.values()):
+        return
+    with st.expander(f"🔔 Cambios: +{len(cambios['añadidas'])} / -{len(cambios['eliminadas'])} / ↔ {len(cambios['movidas'])}"):
+        for c in cambios['añadidas']:
+            st.caption(f"➕ {c['fecha']} {c.get('hora') or ''} {c['asignatura']} ({c['aula']})")
+        for c in cambios['eliminadas']:
+            st.caption(f"➖ ~~{c['fecha']} {c.get('hora') or ''} {c['asignatura']}~~")
+        for antes, despues in cambios['movidas']:
+            st.caption(f"↔ {despues['fecha']} {despues['asignatura']}: {antes.get('hora') or ''} {antes['aula']} → {despues.get('hora') or ''} {despues['aula']}")
+
+def render_panel_diagnostico():
+    """Métricas de la API de GitHub en este proceso: cuota, latencia, bytes y backoff."""
+    metricas = metricas_github()
+    m = metricas.resumen()
+    factor = metricas.factor_backoff()
+    with st.expander("📊 Diagnóstico GitHub"):
+        if m['cuota_limite']:
+            st.progress(max(0.0, m['cuota_restante'] / m['cuota_limite']),
+                        text=f"Cuota API: {m['cuota_restante']}/{m['cuota_limite']}")
+        c1, c2 = st.columns(2)
+        c1.metric("Llamadas", m['llamadas'], delta=f"{m['errores']} errores" if m['errores'] else None, delta_color="inverse")
+        c2.metric("Transferido", f"{(m['bytes_bajada'] + m['bytes_subida']) / 1024:.1f} KB")
+        c1.metric("Latencia p50", f"{m['latencia_p50_ms']:.0f} ms" if m['latencia_p50_ms'] is not None else "-")
+        c2.metric("Latencia p95", f"{m['latencia_p95_ms']:.0f} ms" if m['latencia_p95_ms'] is not None else "-")
+        if factor > 1:
+            st.caption(f"🐢 Poca cuota: caché y ventana de escritura estiradas x{factor:.0f}")
+        if m['ultimas']:
+            df = pd.DataFrame(m['ultimas'], columns=["Hora", "Operación", "ms", "Bytes", "Error"])
+            df["ms"] = df["ms"].round(0)
+            st.dataframe(df.iloc[::-1], hide_index=True, use_container_width=True)
+
 def render_vista_nuevo_horario():
     st.subheader("➕ Añadir Nuevo Evento")
     
@@ -540,6 +3004,9 @@ def render_vista_nuevo_horario():
             fecha_evento = None
             fecha_fin_evento = None
             
+            fecha_inicio_rutina = None
+            fecha_fin_rutina = None
+            
             if "Rutina" in tipo_entrada:
                 st.write("Selecciona los días:")
                 cols_dias = st.columns(7)
@@ -547,6 +3014,9 @@ def render_vista_nuevo_horario():
                 for i, col in enumerate(cols_dias):
                     if col.checkbox(dias_abv[i], key=f"d_{i}"):
                         dias_seleccionados.append(i)
+                cr1, cr2 = st.columns(2)
+                fecha_inicio_rutina = cr1.date_input("📅 Empieza el (opcional)", value=None, key="fecha_inicio_rutina_new")
+                fecha_fin_rutina = cr2.date_input("📅 Repetir hasta (opcional)", value=None, key="fecha_fin_rutina_new")
             elif "Multi-día" in tipo_entrada:
                 cf1, cf2 = st.columns(2)
                 fecha_evento = cf1.date_input("📅 Fecha de inicio", get_madrid_date(), key="fecha_inicio_multi")
@@ -572,6 +3042,10 @@ def render_vista_nuevo_horario():
                 if "Rutina" in tipo_entrada and not dias_seleccionados:
                     st.error("Selecciona al menos un día para la rutina.")
                     return
+
+                if fecha_inicio_rutina and fecha_fin_rutina and fecha_fin_rutina < fecha_inicio_rutina:
+                    st.error("⚠️ La rutina no puede terminar antes de empezar.")
+                    return
                 
                 if "Multi-día" in tipo_entrada and fecha_fin_evento and fecha_fin_evento < fecha_evento:
                     st.error("⚠️ La fecha de fin no puede ser anterior a la de inicio.")
@@ -588,6 +3062,9 @@ def render_vista_nuevo_horario():
                     "es_rutina": "Rutina" in tipo_entrada,
                     "es_multidia": es_multidia,
                     "dias_semana": dias_seleccionados,
+                    "fecha_inicio_rutina": str(fecha_inicio_rutina) if fecha_inicio_rutina else None,
+                    "fecha_fin_rutina": str(fecha_fin_rutina) if fecha_fin_rutina else None,
+                    "excepciones": [],
                     "fecha": str(fecha_evento) if fecha_evento else None,
                     "fecha_fin_evento": str(fecha_fin_evento) if es_multidia and fecha_fin_evento else None,
                     "hora_inicio": str(h_inicio.strftime("%H:%M")) if not dia_completo else None,
@@ -649,7 +3126,7 @@ def render_vista_nueva_tarea():
 def render_vista_gestionar_todas(tareas):
     st.subheader("📋 Gestión Global")
     
-    tab_tareas, tab_horario = st.tabs(["📝 Tareas", "📅 Horarios y Eventos"])
+    tab_tareas, tab_horario, tab_historico = st.tabs(["📝 Tareas", "📅 Horarios y Eventos", "🗄️ Histórico"])
     
     with tab_tareas:
         # --- TAB TAREAS (lo que ya existia) ---
@@ -708,6 +3185,12 @@ def render_vista_gestionar_todas(tareas):
                         dias_map = ["L", "M", "X", "J", "V", "S", "D"]
                         dias_str = ", ".join([dias_map[i] for i in h.get('dias_semana', [])])
                         info_extra = f" | Días: {dias_str}"
+                        if h.get('fecha_inicio_rutina'):
+                            info_extra += f" | Desde: {h['fecha_inicio_rutina']}"
+                        if h.get('fecha_fin_rutina'):
+                            info_extra += f" | Hasta: {h['fecha_fin_rutina']}"
+                        if h.get('excepciones'):
+                            info_extra += f" | {len(h['excepciones'])} día(s) saltado(s)"
                     elif h.get('es_multidia') and h.get('fecha_fin_evento'):
                         info_extra = f" | 📅 {h.get('fecha')} → {h.get('fecha_fin_evento')}"
                     else:
@@ -740,11 +3223,23 @@ def render_vista_gestionar_todas(tareas):
                                 e_dias_sel = []
                                 e_fecha_str = None
                                 
+                                e_inicio_rutina = None
+                                e_fin_rutina = None
+                                e_excepciones = []
+                                e_nueva_excepcion = None
+                                
                                 if e_es_rutina:
                                     dias_map = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
                                     def_dias = [dias_map[i] for i in h.get('dias_semana', [])]
                                     with c_f1: dias_txt = st.multiselect("Días", dias_map, default=def_dias)
                                     e_dias_sel = [dias_map.index(d) for d in dias_txt]
+                                    with c_f1: e_inicio_rutina = st.date_input("Empieza el", parse_fecha(h.get('fecha_inicio_rutina')))
+                                    with c_f1: e_fin_rutina = st.date_input("Repetir hasta", parse_fecha(h.get('fecha_fin_rutina')))
+                                    
+                                    # Días saltados (ej. festivos): se quitan desmarcándolos
+                                    excepciones_actuales = sorted(h.get('excepciones') or [])
+                                    with c_f1: e_excepciones = st.multiselect("Días saltados", excepciones_actuales, default=excepciones_actuales)
+                                    with c_f1: e_nueva_excepcion = st.date_input("Saltar otro día", value=None)
                                 else:
                                     try: def_dt = datetime.strptime(h.get('fecha', get_madrid_date().strftime("%Y-%m-%d")), "%Y-%m-%d").date()
                                     except: def_dt = get_madrid_date()
@@ -761,6 +3256,7 @@ def render_vista_gestionar_todas(tareas):
                                 with c_f2: e_h_fin = st.time_input("Fin", t_f)
                                 
                                 if st.form_submit_button("Guardar Cambios", type="primary"):
+                                    h = dict(h)  # Copia: el original lo comparten el índice y las vistas
                                     h['titulo'] = e_titulo
                                     h['ubicacion'] = e_ubicacion
                                     h['tipo'] = e_tipo
@@ -771,6 +3267,11 @@ def render_vista_gestionar_todas(tareas):
                                     if e_es_rutina:
                                         h['dias_semana'] = e_dias_sel
                                         h['fecha'] = None
+                                        h['fecha_inicio_rutina'] = str(e_inicio_rutina) if e_inicio_rutina else None
+                                        h['fecha_fin_rutina'] = str(e_fin_rutina) if e_fin_rutina else None
+                                        if e_nueva_excepcion and str(e_nueva_excepcion) not in e_excepciones:
+                                            e_excepciones.append(str(e_nueva_excepcion))
+                                        h['excepciones'] = sorted(e_excepciones)
                                     else:
                                         h['dias_semana'] = []
                                         h['fecha'] = e_fecha_str
@@ -785,6 +3286,28 @@ def render_vista_gestionar_todas(tareas):
                             st.session_state["mensaje_global"] = {"tipo": "exito", "texto": "🗑️ Evento/Horario eliminado"}
                             st.rerun()
 
+    with tab_historico:
+        # --- TAB HISTÓRICO (solo se consulta bajo demanda) ---
+        st.caption("Tareas completadas que la limpieza automática ha archivado, agrupadas por mes.")
+        if st.button("📂 Cargar meses archivados", key="cargar_historico"):
+            try:
+                st.session_state["meses_historico"] = obtener_almacen().meses_archivados()
+            except Exception as e:
+                st.error(f"No se pudo consultar el histórico: {e}")
+
+        meses = st.session_state.get("meses_historico")
+        if meses is not None:
+            if not meses:
+                st.info("Todavía no hay tareas archivadas.")
+            else:
+                mes = st.selectbox("Mes", meses, key="mes_historico")
+                archivadas = obtener_almacen().leer_archivo(mes)
+                st.markdown(f"**{len(archivadas)} tarea(s) archivada(s) en {mes}**")
+                for t in sorted(archivadas, key=lambda x: x.get('fecha_fin') or x.get('fecha') or ''):
+                    with st.container(border=True):
+                        fecha_t = t.get('fecha_fin') or t.get('fecha') or '-'
+                        st.markdown(f"✅ **{t['titulo']}** · {t.get('tipo', '')} · 📅 {fecha_t}")
+
 def render_tarjeta_gestion(t):
     """Auxiliar para pintar la tarjeta de una tarea en la lista de gestión"""
     # Icono y Color
@@ -826,13 +3349,11 @@ def render_tarjeta_gestion(t):
             # 1. Completar / Desmarcar
             if t['estado'] != 'Completada':
                 if ca1.button("✅", key=f"ok_main_{t['id']}", help="Marcar como completada"):
-                    t['estado'] = 'Completada'
-                    gestionar_tareas('actualizar', tarea_actualizada=t)
+                    gestionar_tareas('actualizar', tarea_actualizada={**t, 'estado': 'Completada'})
                     st.rerun()
             else:
                 if ca1.button("↩️", key=f"undo_main_{t['id']}", help="Deshacer (Marcar pendiente)"):
-                    t['estado'] = 'Pendiente'
-                    gestionar_tareas('actualizar', tarea_actualizada=t)
+                    gestionar_tareas('actualizar', tarea_actualizada={**t, 'estado': 'Pendiente'})
                     st.rerun()
 
             # 2. Editar
@@ -867,6 +3388,7 @@ def render_tarjeta_gestion(t):
                     e_prioridad = st.selectbox("Prioridad", ["Normal", "Importante", "Urgente"], index=["Normal", "Importante", "Urgente"].index(t.get('prioridad', 'Normal')))
                     
                     if st.form_submit_button("Guardar"):
+                        t = dict(t)  # Copia: el original lo comparten el índice y las vistas
                         t['titulo'] = e_titulo
                         t['estado'] = e_estado
                         t['prioridad'] = e_prioridad
@@ -889,76 +3411,84 @@ def render_tarjeta_gestion(t):
 # --- DIÁLOGO DE DETALLES ---
 
 @st.dialog("Detalles")
-def mostrar_detalle_item(item):
+def mostrar_detalle_item(ev, dia=None):
     # Cabecera con Icono y Título
-    tipo = item.get('tipo', 'Evento')
-    titulo = item.get('titulo', 'Sin título')
-    
     col_icon, col_tit = st.columns([1, 5])
     with col_icon:
-        if item.get('es_universidad'): st.subheader("📖")
-        elif item.get('es_rutina'): st.subheader("🔄")
-        elif tipo == 'tarea': st.subheader("📝")
+        if ev.origen: st.subheader(ev.origen.icono)
+        elif ev.es_rutina: st.subheader("🔄")
+        elif ev.fuente == 'tarea': st.subheader("📝")
         else: st.subheader("📅")
     
     with col_tit:
-        st.subheader(titulo)
-        st.caption(f"Tipo: {tipo}")
+        st.subheader(ev.titulo or 'Sin título')
+        st.caption(f"Tipo: {ev.tipo or 'Evento'}")
         
     st.divider()
     
     # Información General
     c1, c2 = st.columns(2)
     
-    # Lógica para determinar la hora
-    hora_str = item.get('hora')
-    if not hora_str and item.get('hora_inicio') and item.get('hora_fin'):
-         hora_str = f"{item['hora_inicio']} - {item['hora_fin']}"
-    if not hora_str:
-         hora_str = 'Todo el día'
-         
-    c1.markdown(f"**🕒 Hora:** {hora_str}")
-    if item.get('ubicacion'): c1.markdown(f"**📍 Ubicación:** {item['ubicacion']}")
-    # Aula para clases
-    if item.get('aula'): c1.markdown(f"**📍 Aula:** {item['aula']}")
+    c1.markdown(f"**🕒 Hora:** {ev.hora_texto}")
+    if ev.lugar:
+        etiqueta_lugar = ev.origen.etiqueta_lugar if ev.origen else "Ubicación"
+        c1.markdown(f"**📍 {etiqueta_lugar}:** {ev.lugar}")
     
-    if item.get('fecha'): c2.markdown(f"**📅 Fecha:** {item['fecha']}")
+    if ev.es_multidia:
+        c2.markdown(f"**📅 Fechas:** {ev.fecha} → {ev.fecha_fin}")
+    elif ev.es_deadline:
+        c2.markdown(f"**⏰ Deadline:** {ev.fecha_fin}")
+    elif ev.fecha:
+        c2.markdown(f"**📅 Fecha:** {ev.fecha}")
     
-    if item.get('dias_semana'):
+    if ev.dias_semana:
         dias_map_str = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"]
-        s_dias = [dias_map_str[i] for i in item['dias_semana']]
+        s_dias = [dias_map_str[i] for i in ev.dias_semana]
         c2.markdown(f"**🔄 Días:** {', '.join(s_dias)}")
+        if ev.es_rutina and ev.raw.get('fecha_inicio_rutina'):
+            c2.markdown(f"**▶️ Desde:** {ev.raw['fecha_inicio_rutina']}")
+        if ev.es_rutina and ev.raw.get('fecha_fin_rutina'):
+            c2.markdown(f"**⏹️ Hasta:** {ev.raw['fecha_fin_rutina']}")
     
-    if item.get('descripcion'):
-        st.markdown(f"**📝 Descripción:** {item['descripcion']}")
+    if ev.descripcion:
+        st.markdown(f"**📝 Descripción:** {ev.descripcion}")
 
     # Acciones específicas
     st.divider()
     
-    if tipo == 'tarea':
-        st.write(f"**Prioridad:** {item.get('prioridad', 'Normal')}")
-        if item.get('msg'): st.info(item['msg'])
+    if ev.fuente == 'tarea':
+        st.write(f"**Prioridad:** {ev.prioridad}")
         
-        if item.get('estado') != 'Completada':
+        if not ev.completada:
             if st.button("✅ Marcar como Completada", use_container_width=True):
-                item['estado'] = 'Completada'
-                gestionar_tareas('actualizar', tarea_actualizada=item)
+                gestionar_tareas('actualizar', tarea_actualizada={**ev.raw, 'estado': 'Completada'})
                 st.session_state["mensaje_global"] = {"tipo": "exito", "texto": "Tarea completada"}
                 st.rerun()
         else:
             st.success("✅ Tarea ya completada")
             
-    elif item.get('es_rutina') or (not item.get('es_universidad') and item.get('id')):
+    elif ev.fuente == 'dinamico' and ev.id:
+        # Rutina: se puede saltar solo esta ocurrencia (ej. festivo) sin borrarla
+        if ev.es_rutina and dia:
+            if st.button(f"⏭️ Saltar el {dia.strftime('%d/%m')}", use_container_width=True):
+                item = dict(ev.raw)
+                item['excepciones'] = sorted(set(item.get('excepciones') or []) | {str(dia)})
+                if gestionar_horario('actualizar', item_actualizado=item):
+                    st.session_state["mensaje_global"] = {"tipo": "exito", "texto": f"⏭️ Rutina saltada el {dia.strftime('%d/%m')}"}
+                    st.rerun()
+                else:
+                    st.error("Error al actualizar la rutina")
+
         # Es un evento manual (Rutina o Evento unico) -> Se puede borrar
         if st.button("🗑️ Eliminar Evento", type="primary", use_container_width=True):
-            if gestionar_horario('borrar', id_eliminar=item['id']):
+            if gestionar_horario('borrar', id_eliminar=ev.id):
                 st.session_state["mensaje_global"] = {"tipo": "exito", "texto": "Evento eliminado"}
                 st.rerun()
             else:
                  st.error("Error al eliminar")
             
-    elif item.get('es_universidad'):
-        st.info("ℹ️ Este evento pertenece al horario universitario oficial.")
+    elif ev.origen and ev.origen.aviso:
+        st.info(ev.origen.aviso)
 
 # --- UI Y LÓGICA ---
 
@@ -975,56 +3505,37 @@ def main():
             st.error(texto)
         st.session_state["mensaje_global"] = None
         
-    # --- AUTO-UPDATE HORARIO CLASES ---
-    # Comentado para no bloquear al inicio, se usa manual
-    # with st.spinner("Sincronizando horario universitario..."):
-    #     horario_clases_scraped = actualizar_horario_clases()
+    # --- AUTO-UPDATE HORARIOS SCRAPEADOS ---
+    # Sin bloquear: se usa la copia en disco y, si ha caducado, se refresca en segundo plano
+    refresco = refresco_fondo()
+    refresco.revisar()
     
-    # Cargar Horario Clases (Cache)
-    try:
-        with open(HORARIO_FILE, 'r', encoding='utf-8') as f:
-            horario_clases_scraped = json.load(f)
-    except:
-        horario_clases_scraped = []
-        
-    # Cargar Horario Futbol (Cache)
-    try:
-        with open("horario_futbol.json", 'r', encoding='utf-8') as f:
-            horario_futbol_scraped = json.load(f)
-    except:
-        horario_futbol_scraped = []
+    # Cargar Fuentes Externas (Cache): las elegidas en la barra lateral, en un solo flujo
+    fuentes = fuentes_registradas()
+    defecto = [nombre for nombre, fuente in fuentes.items() if fuente.visible_por_defecto]
+    elegidas = [n for n in st.session_state.get("fuentes_elegidas", defecto) if n in fuentes]
+    st.session_state["fuentes_elegidas"] = elegidas
         
     # --- GESTOR DE DATOS (PERSISTENCIA) ---
+    # La versión se toma antes de leer: un cambio a mitad de lectura fuerza reconstruir el índice después
+    version_datos = version_almacen()
     tareas = gestionar_tareas('leer')
     horario_dinamico = gestionar_horario('leer')
     
     # --- LIMPIEZA AUTOMÁTICA ---
+    # Una vez al día, las completadas cuya fecha (o deadline) ya pasó se mueven al histórico mensual
     hoy_real = get_madrid_date()
-    tareas_filtradas = []
-    hubo_cambios_limpieza = False
-    
-    for t in tareas:
-        # Si es completada y vieja, fuera
-        es_vieja = False
-        try:
-            if t.get('fecha'):
-                f_t = datetime.strptime(t['fecha'], "%Y-%m-%d").date()
-                if f_t < hoy_real: es_vieja = True
-            if t.get('fecha_fin'): # Si tiene deadline y ya pasó hace tiempo también
-                f_f = datetime.strptime(t['fecha_fin'], "%Y-%m-%d").date()
-                if f_f < hoy_real: es_vieja = True
-        except: pass
-            
-        if t['estado'] == 'Completada' and es_vieja:
-            # Solo borrar si ya pasó el día
-             hubo_cambios_limpieza = True
-        else:
-            tareas_filtradas.append(t)
-            
-    if hubo_cambios_limpieza:
-        if gestionar_tareas('guardar_todo', lista_completa=tareas_filtradas):
-            st.toast("🧹 Se han eliminado tareas antiguas automáticamente.")
-            tareas = tareas_filtradas
+    try:
+        ids_archivadas = archivar_tareas_antiguas(hoy_real)
+    except SinConexionError:
+        ids_archivadas = set()  # Sin marca: se reintenta en el próximo rerun
+    except Exception as e:
+        ids_archivadas = set()
+        st.warning(f"No se pudieron archivar las tareas antiguas: {describir_error_github(e)}")
+
+    if ids_archivadas:
+        st.toast(f"🗄️ {len(ids_archivadas)} tarea(s) antigua(s) movidas al histórico.")
+        tareas = [t for t in tareas if t.get('id') not in ids_archivadas]
 
     # --- SIDEBAR GLOBAL ---
     with st.sidebar:
@@ -1052,21 +3563,52 @@ def main():
         
         st.info(f"Mirando: **{fecha_seleccionada.strftime('%d %b %Y')}**")
         
+        # --- ESTADO DE SINCRONIZACIÓN ---
+        almacen = obtener_almacen()
+        n_pendientes, error_sincronizacion = almacen.estado_sincronizacion()
+        if error_sincronizacion:
+            st.warning(f"⚠️ {n_pendientes} cambio(s) sin sincronizar: {error_sincronizacion}")
+            if st.button("🔁 Reintentar sincronización", use_container_width=True):
+                almacen.reintentar()
+                st.rerun()
+        elif n_pendientes:
+            st.caption(f"⏳ {n_pendientes} cambio(s) pendiente(s) de sincronizar con GitHub")
+
+        render_panel_diagnostico()
+
+        if len(fuentes) > 1:
+            st.multiselect("🗂️ Calendarios", list(fuentes), key="fuentes_elegidas",
+                           help="Se superponen en el calendario; las clases comunes a varios horarios aparecen una sola vez.")
+        if refresco.en_curso:
+            st.caption(f"🔄 Actualizando {', '.join(refresco.en_curso)} en segundo plano...")
         if st.button("🔄 Actualizar Horario"):
-            with st.spinner("Actualizando Loyola y Sevilla FC..."):
-                driver = init_driver()
-                actualizar_horario_clases(force=True, driver=driver)
-                actualizar_horario_sevilla(driver=driver)
-                if driver: driver.quit()
+            with st.spinner(f"Actualizando {', '.join(fuentes)}..."):
+                refresco.ejecutar_ahora()
             st.rerun()
 
+        # Resultado de la última actualización (tiempo y fallos por fuente), común a todas las sesiones
+        if refresco.ultimo_informe:
+            st.caption(f"🌐 Última actualización de las fuentes ({refresco.hora_informe:%d/%m %H:%M}, "
+                       "compartida por todas las sesiones):")
+        for fuente, informe in refresco.ultimo_informe.items():
+            if informe['error']:
+                st.error(f"{fuente}: {informe['error']}")
+            else:
+                bloqueadas = f", {informe['bloqueadas']} bloqueadas" if informe.get('bloqueadas') else ""
+                st.caption(f"✅ {fuente}: {informe['eventos']} eventos en {informe['segundos']:.1f} s "
+                           f"({informe.get('bytes', 0) / 1024:.0f} KB, {informe.get('peticiones', 0)} peticiones{bloqueadas})")
+                render_cambios_horario(informe.get('cambios'))
+
+    # --- ÍNDICE POR FECHA (compartido por las vistas de calendario) ---
+    indice = obtener_indice_calendario(tareas, horario_dinamico, [fuentes[n] for n in elegidas], version_datos)
+
     # --- ENRUTADOR DE VISTAS ---
     if vista_actual == "Diaria":
-        render_vista_diaria(tareas, fecha_seleccionada, horario_dinamico, horario_clases_scraped, horario_futbol_scraped)
+        render_vista_diaria(fecha_seleccionada, indice)
     elif vista_actual == "Semanal":
-        render_vista_semanal(tareas, fecha_seleccionada, horario_dinamico, horario_clases_scraped, horario_futbol_scraped)
+        render_vista_semanal(fecha_seleccionada, indice)
     elif vista_actual == "Mensual":
-        render_vista_mensual(tareas, fecha_seleccionada, horario_dinamico, horario_clases_scraped, horario_futbol_scraped)
+        render_vista_mensual(fecha_seleccionada, indice)
     elif vista_actual == "➕ Nueva Tarea":
         render_vista_nueva_tarea()
     elif vista_actual == "➕ Nuevo Evento/Horario":
@@ -1076,7 +3618,7 @@ def main():
 
 # --- IMPLEMENTACIÓN DE VISTAS ---
 
-def render_vista_diaria(tareas, fecha_seleccionada, horario_dinamico, horario_clases_scraped, horario_futbol_scraped):
+def render_vista_diaria(fecha_seleccionada, indice):
     # --- NAVEGACIÓN CON FLECHAS ---
     nav_c1, nav_c2, nav_c3 = st.columns([1, 3, 1])
     with nav_c1:
@@ -1102,115 +3644,45 @@ def render_vista_diaria(tareas, fecha_seleccionada, horario_dinamico, horario_cl
     hoy_real = get_madrid_date()
     tareas_atrasadas = []
     
-    for t in tareas:
-        if t.get('estado') == 'Completada': continue
-        
-        fecha_ref = None
-        if t.get('fecha_fin'):
-            try: fecha_ref = datetime.strptime(t['fecha_fin'], "%Y-%m-%d").date()
-            except: pass
-        elif t.get('fecha'):
-            try: fecha_ref = datetime.strptime(t['fecha'], "%Y-%m-%d").date()
-            except: pass
-            
+    for ev in indice.tareas:
+        if ev.completada: continue
+        fecha_ref = ev.fecha_fin or ev.fecha
         if fecha_ref and fecha_ref < hoy_real:
-             tareas_atrasadas.append(t)
+             tareas_atrasadas.append(ev)
             
     if tareas_atrasadas:
         st.error(f"🚨 Tienes {len(tareas_atrasadas)} tareas atrasadas pendientes")
         with st.expander("Ver tareas atrasadas"):
             for atrasada in tareas_atrasadas:
-                f_str = atrasada.get('fecha_fin') or atrasada.get('fecha')
-                st.markdown(f"🔴 **{atrasada['titulo']}** (📅 {f_str})")
+                st.markdown(f"🔴 **{atrasada.titulo}** (📅 {atrasada.fecha_fin or atrasada.fecha})")
 
     col_horario, col_tareas = st.columns([1, 2])
+    items_dia = indice.get_items(fecha_seleccionada, fecha_seleccionada)[fecha_seleccionada]
     
     with col_horario:
         st.subheader("🏫 Horario")
-        dia_semana = fecha_seleccionada.weekday()
-        
-        # Recolectar items del dia
-        clases_hoy = []
-        
-        # 1. Clases Scrapeadas (Fecha exacta)
-        fecha_sel_str = str(fecha_seleccionada)
-        for c in horario_clases_scraped:
-            if c['fecha'] == fecha_sel_str:
-                clases_hoy.append({
-                    "hora": c['hora'],
-                    "asignatura": c['asignatura'],
-                    "aula": c['aula'],
-                    "es_universidad": True
-                })
         
-        # 1.5 Futbol Scrapeado
-        for f in horario_futbol_scraped:
-             if f['fecha'] == fecha_sel_str:
-                 h_txt = f['hora'] if f['hora'] else "Todo el día"
-                 clases_hoy.append({
-                     "hora": h_txt,
-                     "asignatura": f["titulo"],
-                     "aula": f["aula"],
-                     "es_futbol": True
-                 })
-
-        # 2. Horario Dinámico (JSON)
-        for item in horario_dinamico:
-            es_hoy = False
-            if item.get('es_rutina'):
-                if dia_semana in item.get('dias_semana', []):
-                    es_hoy = True
-            elif item.get('es_multidia') and item.get('fecha') and item.get('fecha_fin_evento'):
-                # Evento multi-día: comprobar si fecha_seleccionada está en el rango
-                try:
-                    f_inicio_m = datetime.strptime(item['fecha'], "%Y-%m-%d").date()
-                    f_fin_m = datetime.strptime(item['fecha_fin_evento'], "%Y-%m-%d").date()
-                    if f_inicio_m <= fecha_seleccionada <= f_fin_m:
-                        es_hoy = True
-                except: pass
-            else:
-                if item.get('fecha') == fecha_sel_str:
-                    es_hoy = True
-            
-            if es_hoy:
-                hora_display = "Todo el día"
-                if not item.get('dia_completo') and item.get('hora_inicio') and item.get('hora_fin'):
-                    hora_display = f"{item['hora_inicio']} - {item['hora_fin']}"
-                
-                # Etiqueta multi-día
-                multidia_label = ""
-                if item.get('es_multidia') and item.get('fecha') and item.get('fecha_fin_evento'):
-                    multidia_label = f" (🗓️ {item['fecha']} → {item['fecha_fin_evento']})"
-                
-                clases_hoy.append({
-                    "hora": hora_display,
-                    "asignatura": item['titulo'] + multidia_label,
-                    "aula": item.get('ubicacion', ''),
-                    "descripcion": item.get('descripcion', ''),
-                    "color": item.get('color'),
-                    "es_dinamico": True
-                })
+        # Clases, fútbol y horario dinámico del día (las tareas van en la otra columna)
+        clases_hoy = [ev for ev in items_dia if ev.fuente != 'tarea']
         
-        # Ordenar por hora inicio
-        def sort_hora(x):
-            try:
-                return x['hora'].split('-')[0].strip()
-            except: return "23:59"
+        # Ordenar por hora inicio ("Todo el día" al final)
+        def sort_hora(ev):
+            return ev.inicio if ev.inicio is not None else 24 * 60
             
         clases_hoy.sort(key=sort_hora)
 
         if clases_hoy:
-            for clase in clases_hoy:
-                # Usar color personalizado si existe
-                color_borde = clase.get('color', '#2E8B57')
-                desc_text = f"<br>{clase['descripcion']}" if clase.get('descripcion') else ""
-                aula_text = f"<br><span style='opacity:0.7'>{clase['aula']}</span>" if clase.get('aula') else ""
-                dot = f"<span style='color:{color_borde}; font-size:1.1em;'>●</span>"
+            for ev in clases_hoy:
+                # Etiqueta multi-día
+                multidia_label = f" (🗓️ {ev.fecha} → {ev.fecha_fin})" if ev.es_multidia else ""
+                desc_text = f"<br>{ev.descripcion}" if ev.descripcion else ""
+                aula_text = f"<br><span style='opacity:0.7'>{ev.lugar}</span>" if ev.lugar else ""
+                dot = f"<span style='color:{ev.color}; font-size:1.1em;'>●</span>"
                 
                 st.markdown(f"""
-                <div style='border-left: 4px solid {color_borde}; padding: 8px 12px; margin-bottom: 8px; background: rgba(255,255,255,0.03); border-radius: 0 6px 6px 0;'>
-                    <strong>{clase['hora']}</strong><br>
-                    {dot} {clase['asignatura']}{aula_text}{desc_text}
+                <div style='border-left: 4px solid {ev.color}; padding: 8px 12px; margin-bottom: 8px; background: rgba(255,255,255,0.03); border-radius: 0 6px 6px 0;'>
+                    <strong>{ev.hora_texto}</strong><br>
+                    {dot} {ev.titulo}{multidia_label}{aula_text}{desc_text}
                 </div>""", unsafe_allow_html=True)
         else:
             st.info("No hay clases ni eventos programados.")
@@ -1218,113 +3690,80 @@ def render_vista_diaria(tareas, fecha_seleccionada, horario_dinamico, horario_cl
     with col_tareas:
         st.subheader(f"📝 Tareas: {fecha_seleccionada.strftime('%A %d')}")
         
-        tareas_hoy_list = []
-        tareas_proximas_list = []
-        hoy_real = get_madrid_date()
+        # Tareas con fecha fija: salen directamente del índice del día
+        tareas_hoy_list = [ev for ev in items_dia if ev.fuente == 'tarea' and not ev.es_deadline]
 
-        for t in tareas:
-            if t.get('estado') == 'Completada' and t.get('fecha') != str(fecha_seleccionada) and t.get('fecha_fin') != str(fecha_seleccionada):
+        # Deadlines: solo se listan cuando se mira el día de hoy
+        tareas_proximas_list = []
+        if fecha_seleccionada == hoy_real:
+            for ev in indice.tareas:
+                if not ev.es_deadline: continue
+                if ev.completada and ev.fecha != fecha_seleccionada and ev.fecha_fin != fecha_seleccionada:
                     continue 
-
-            es_task_deadline = t.get('fecha_fin') is not None
-            
-            # Urgencia
-            es_urgente_auto = False
-            dias_restantes_msg = ""
-            if es_task_deadline:
-                try:
-                    d_fin = datetime.strptime(t['fecha_fin'], "%Y-%m-%d").date()
-                    delta_dias = (d_fin - hoy_real).days
-                    if delta_dias < 2 and delta_dias >= 0: es_urgente_auto = True
-                    if delta_dias < 0: dias_restantes_msg = f"🔴 Venció"
-                    elif delta_dias == 0: dias_restantes_msg = "🟠 Vence HOY"
-                    else: dias_restantes_msg = f"⏳ {delta_dias}d"
-                except: pass
-            
-            t_visual = t.copy()
-            t_visual['msg'] = dias_restantes_msg
-            t_visual['urgente'] = es_urgente_auto
-            
-            if not es_task_deadline and t.get('fecha') == str(fecha_seleccionada):
-                tareas_hoy_list.append(t_visual)
-            elif es_task_deadline and fecha_seleccionada == hoy_real:
-                tareas_proximas_list.append(t_visual)
+                tareas_proximas_list.append(ev)
 
         if not tareas_hoy_list and not tareas_proximas_list:
             st.info("✅ Nada pendiente para hoy.")
 
         if tareas_hoy_list:
-            # Ordenar por hora si no es día completo
-            def sort_key_daily(x):
-                # 1. Dia completo primero (o ultimo? mejor primero como "todo el dia") -> False (0) vs True (1)
-                # 2. Hora
-                is_all_day = x.get('dia_completo', True)
-                hora = x.get('hora', "23:59")
-                return (0 if is_all_day else 1, hora)
+            # Ordenar: primero las de todo el día, después por hora
+            def sort_key_daily(ev):
+                return (0 if ev.dia_completo else 1, ev.orden)
             
             tareas_hoy_list.sort(key=sort_key_daily)
 
             st.markdown("### Tareas del Día")
-            for t in tareas_hoy_list:
-                color = COLORES_TIPO.get(t['tipo'], "gray")
-                estilo_completada = "opacity: 0.5;" if t['estado'] == 'Completada' else ""
-                dot = f"<span style='color:{color}; font-size:1.1em;'>●</span>"
+            for ev in tareas_hoy_list:
+                estilo_completada = "opacity: 0.5;" if ev.completada else ""
+                dot = f"<span style='color:{ev.color}; font-size:1.1em;'>●</span>"
                 
                 hora_badge = ""
-                if not t.get('dia_completo', True) and t.get('hora'):
-                    hora_badge = f"<span style='background-color:#444; color:white; padding: 2px 6px; border-radius: 4px; font-size: 0.8em; margin-right: 5px'>{t['hora']}</span>"
+                if not ev.dia_completo:
+                    hora_badge = f"<span style='background-color:#444; color:white; padding: 2px 6px; border-radius: 4px; font-size: 0.8em; margin-right: 5px'>{ev.hora_inicio}</span>"
                 
                 st.markdown(f"""
-                <div style='border-left: 4px solid {color}; padding: 8px 12px; margin-bottom: 6px; background: rgba(255,255,255,0.03); border-radius: 0 6px 6px 0; {estilo_completada}'>
-                    {hora_badge}{dot} <strong>{t['titulo']}</strong> <span style='background-color:{color}; padding: 2px 6px; border-radius: 4px; color: white; font-size: 0.8em'>{t['tipo']}</span>
+                <div style='border-left: 4px solid {ev.color}; padding: 8px 12px; margin-bottom: 6px; background: rgba(255,255,255,0.03); border-radius: 0 6px 6px 0; {estilo_completada}'>
+                    {hora_badge}{dot} <strong>{ev.titulo}</strong> <span style='background-color:{ev.color}; padding: 2px 6px; border-radius: 4px; color: white; font-size: 0.8em'>{ev.tipo}</span>
                 </div>""", unsafe_allow_html=True)
-                if t['estado'] != 'Completada':
-                    if st.button("Completar", key=f"d_{t['id']}", use_container_width=False):
-                        t['estado'] = 'Completada'
-                        gestionar_tareas('actualizar', tarea_actualizada=t)
+                if not ev.completada:
+                    if st.button("Completar", key=f"d_{ev.id}", use_container_width=False):
+                        gestionar_tareas('actualizar', tarea_actualizada={**ev.raw, 'estado': 'Completada'})
                         st.rerun()
 
         # Ordenar Deadlines: 1. Importancia, 2. Dias que quedan
-        def sort_deadlines(x):
+        def sort_deadlines(ev):
             # 1. Prioridad: Urgente(0) > Importante(1) > Normal(2) > Baja(3) > Otro(4)
             prio_map = {"Urgente": 0, "Importante": 1, "Normal": 2, "Baja": 3}
-            p_val = prio_map.get(x.get('prioridad'), 4)
-            
-            # 2. Dias Restantes
-            d_val = 9999
-            if x.get('fecha_fin'):
-                try:
-                    d_fin = datetime.strptime(x['fecha_fin'], "%Y-%m-%d").date()
-                    d_val = (d_fin - hoy_real).days
-                except: pass
-            
-            return (p_val, d_val)
+            return (prio_map.get(ev.prioridad, 4), (ev.fecha_fin - hoy_real).days)
         
         tareas_proximas_list.sort(key=sort_deadlines)
 
-        if tareas_proximas_list and fecha_seleccionada == hoy_real:
+        if tareas_proximas_list:
             st.markdown("### Entregas y Deadlines")
-            for t in tareas_proximas_list:
-                color = COLORES_TIPO.get(t['tipo'], "gray")
-                dot = f"<span style='color:{color}; font-size:1.1em;'>●</span>"
-                estilo_completada = "opacity: 0.5;" if t['estado'] == 'Completada' else ""
+            for ev in tareas_proximas_list:
+                delta_dias = (ev.fecha_fin - hoy_real).days
+                if delta_dias < 0: dias_restantes_msg = "🔴 Venció"
+                elif delta_dias == 0: dias_restantes_msg = "🟠 Vence HOY"
+                else: dias_restantes_msg = f"⏳ {delta_dias}d"
+
+                dot = f"<span style='color:{ev.color}; font-size:1.1em;'>●</span>"
+                estilo_completada = "opacity: 0.5;" if ev.completada else ""
                 
                 hora_badge = ""
-                if not t.get('dia_completo', True) and t.get('hora'):
-                    hora_badge = f"<span style='background-color:#444; color:white; padding: 2px 6px; border-radius: 4px; font-size: 0.8em; margin-left: 5px'>{t['hora']}</span>"
+                if not ev.dia_completo:
+                    hora_badge = f"<span style='background-color:#444; color:white; padding: 2px 6px; border-radius: 4px; font-size: 0.8em; margin-left: 5px'>{ev.hora_inicio}</span>"
                 
                 st.markdown(f"""
-                <div style='border-left: 4px solid {color}; padding: 8px 12px; margin-bottom: 6px; background: rgba(255,255,255,0.03); border-radius: 0 6px 6px 0; {estilo_completada}'>
-                    {dot} <strong>{t['titulo']}</strong> {hora_badge} | {t['msg']}<br>
-                    <span style='font-size:0.85em; opacity:0.7'>Tipo: {t['tipo']}</span>
+                <div style='border-left: 4px solid {ev.color}; padding: 8px 12px; margin-bottom: 6px; background: rgba(255,255,255,0.03); border-radius: 0 6px 6px 0; {estilo_completada}'>
+                    {dot} <strong>{ev.titulo}</strong> {hora_badge} | {dias_restantes_msg}<br>
+                    <span style='font-size:0.85em; opacity:0.7'>Tipo: {ev.tipo}</span>
                 </div>""", unsafe_allow_html=True)
-                if t['estado'] != 'Completada':
-                    if st.button("Completar", key=f"d_p_{t['id']}", use_container_width=False):
-                        t['estado'] = 'Completada'
-                        gestionar_tareas('actualizar', tarea_actualizada=t)
+                if not ev.completada:
+                    if st.button("Completar", key=f"d_p_{ev.id}", use_container_width=False):
+                        gestionar_tareas('actualizar', tarea_actualizada={**ev.raw, 'estado': 'Completada'})
                         st.rerun()
 
-def render_vista_semanal(tareas, fecha_base, horario_dinamico, horario_clases_scraped, horario_futbol_scraped):
+def render_vista_semanal(fecha_base, indice):
     # CSS HACK: Forzar layout horizontal en móvil con escalado automático
     st.markdown("""
         <style>
@@ -1449,6 +3888,7 @@ def render_vista_semanal(tareas, fecha_base, horario_dinamico, horario_clases_sc
     
     cols = st.columns(7)
     dias_semana_lbl = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"]
+    items_semana = indice.get_items(start_of_week, end_of_week)
     
     for i, col in enumerate(cols):
         dia_actual = start_of_week + timedelta(days=i)
@@ -1481,132 +3921,27 @@ def render_vista_semanal(tareas, fecha_base, horario_dinamico, horario_clases_sc
             </div>""", unsafe_allow_html=True)
             
             # --- RECOLECCIÓN DE ITEMS ---
-            items_visuales = []
-            
-            # 1. Horario Universitario Scrapeado
-            dia_str = str(dia_actual)
-            for c in horario_clases_scraped:
-                if c['fecha'] == dia_str:
-                     items_visuales.append({
-                         "tipo": "Clase",
-                         "titulo": c['asignatura'],
-                         "hora_sort": c['hora'].split('-')[0].strip(),
-                         "hora": c['hora'],
-                         "aula": c['aula'],
-                         "color": "#2E8B57",
-                         "es_universidad": True,
-                         "fecha": c['fecha'],
-                         "raw": c 
-                     })
-             
-            # 1.5 Futbol
-            for f in horario_futbol_scraped:
-                if f['fecha'] == dia_str:
-                    items_visuales.append({
-                        "tipo": "Futbol",
-                        "titulo": f['titulo'],
-                        "hora_sort": f['hora'] if f['hora'] else "00:00",
-                        "hora": f['hora'] if f['hora'] else "TBD",
-                        "aula": f['aula'],
-                        "color": "#FF4B4B",
-                        "es_futbol": True,
-                        "raw": f
-                    })
-
-            # 2. Horario Dinamico
-            for item in horario_dinamico:
-                es_este_dia = False
-                if item.get('es_rutina'):
-                     if i in item.get('dias_semana', []): es_este_dia = True
-                elif item.get('es_multidia') and item.get('fecha') and item.get('fecha_fin_evento'):
-                     try:
-                         f_ini_w = datetime.strptime(item['fecha'], "%Y-%m-%d").date()
-                         f_fin_w = datetime.strptime(item['fecha_fin_evento'], "%Y-%m-%d").date()
-                         if f_ini_w <= dia_actual <= f_fin_w: es_este_dia = True
-                     except: pass
-                else:
-                     if item.get('fecha') == dia_str: es_este_dia = True
-                
-                if es_este_dia:
-                    hora_sort_val = item.get('hora_inicio', '00:00') or '00:00'
-                    hora_display_w = "Todo el día"
-                    if not item.get('dia_completo') and item.get('hora_inicio') and item.get('hora_fin'):
-                        hora_display_w = f"{item['hora_inicio']} - {item['hora_fin']}"
-                    
-                    titulo_w = item['titulo']
-                    
-                    items_visuales.append({
-                        "tipo": "Evento",
-                        "titulo": titulo_w,
-                        "hora_sort": hora_sort_val,
-                        "hora": hora_display_w,
-                        "ubicacion": item.get('ubicacion'),
-                        "color": item.get('color', '#1E90FF'),
-                        "es_rutina": item.get('es_rutina'),
-                        "es_multidia": item.get('es_multidia'),
-                        "id": item.get('id'),
-                        "dias_semana": item.get('dias_semana'),
-                        "raw": item
-                    })
-            
-            # 3. Tareas
-            for t in tareas:
-                if t.get('estado') == 'Completada': continue
-                
-                fecha_t = t.get('fecha')
-                fecha_f = t.get('fecha_fin')
-                
-                hora_str = t.get('hora', "23:59")
-                if t.get('dia_completo'): hora_str = "00:00"
-                if not hora_str: hora_str = "23:59"
-                
-                es_deadline = False
-                
-                if fecha_t == str(dia_actual) and not fecha_f:
-                    pass
-                elif fecha_f == str(dia_actual):
-                    es_deadline = True
-                else:
-                   continue
-                
-                items_visuales.append({
-                     "tipo": "tarea",
-                     "titulo": t['titulo'],
-                     "hora_sort": hora_str,
-                     "hora": t.get('hora'),
-                     "dia_completo": t.get('dia_completo'),
-                     "color": COLORES_TIPO.get(t.get('tipo', 'Otro'), '#808080'),
-                     "es_deadline": es_deadline,
-                     "prioridad": t.get('prioridad'),
-                     "estado": t.get('estado'),
-                     "id": t['id'],
-                     "raw": t
-                })
+            # Las tareas completadas no se pintan en el calendario
+            items_visuales = [ev for ev in items_semana[dia_actual] if not (ev.fuente == 'tarea' and ev.completada)]
 
             # Ordenar
-            def get_sort_key(x):
-                try: return x['hora_sort'].replace(":", "")
-                except: return "9999"
+            def get_sort_key(ev):
+                return ev.orden
             
             items_visuales.sort(key=get_sort_key)
             
             # PINTAR ITEMS
-            for item in items_visuales:
-                item_color = item.get('color', '#808080')
-                hora_inicio = item.get('hora_sort', '')
-                trunc_title = (item['titulo'][:10] + '..') if len(item['titulo']) > 10 else item['titulo']
+            for ev in items_visuales:
+                hora_inicio = formato_minutos(ev.orden)
+                trunc_title = (ev.titulo[:10] + '..') if len(ev.titulo) > 10 else ev.titulo
                 label = f"● {hora_inicio} {trunc_title}"
                 
                 # Key unica
-                try:
-                    safe_id = str(item.get('id', item['titulo'])).replace(" ", "_")
-                except: safe_id = "uniq"
-
-                key_btn = f"btn_w_{i}_{safe_id}_{item['hora_sort']}"
+                safe_id = str(ev.id if ev.id is not None else ev.titulo).replace(" ", "_")
+                key_btn = f"btn_w_{i}_{safe_id}_{ev.orden}"
                 
                 if st.button(label, key=key_btn, use_container_width=True):
-                    if 'titulo' not in item['raw']: item['raw']['titulo'] = item['titulo']
-                    mostrar_detalle_item(item['raw'])
+                    mostrar_detalle_item(ev, dia_actual)
 
 
 # --- CONSTANTES DE FECHA (ESPAÑOL) ---
@@ -1616,7 +3951,7 @@ NOMBRES_MESES = {
 }
 DIAS_SEMANA_ABR = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"]
 
-def render_vista_mensual(tareas, fecha_base, horario_dinamico, horario_clases_scraped, horario_futbol_scraped):
+def render_vista_mensual(fecha_base, indice):
     # CSS HACK force horizontal
     st.markdown("""
         <style>
@@ -1707,6 +4042,9 @@ def render_vista_mensual(tareas, fecha_base, horario_dinamico, horario_clases_sc
     
     calendar.setfirstweekday(calendar.MONDAY)
     cal = calendar.monthcalendar(fecha_base.year, fecha_base.month)
+    primer_dia = date(fecha_base.year, fecha_base.month, 1)
+    ultimo_dia = date(fecha_base.year, fecha_base.month, calendar.monthrange(fecha_base.year, fecha_base.month)[1])
+    items_mes = indice.get_items(primer_dia, ultimo_dia)
     
     # Cabecera (ELIMINADO A PETICIÓN DE USUARIO)
     # cols_header = st.columns(7)
@@ -1740,122 +4078,27 @@ def render_vista_mensual(tareas, fecha_base, horario_dinamico, horario_clases_sc
                 st.markdown(f"<div style='text-align: right; font-weight: bold; border-bottom: {border_style}; margin-bottom: 4px; color: {num_color};'>{day_num} <span style='font-size:0.75em; opacity:0.7; font-weight:normal'>{DIAS_SEMANA_ABR[i]}</span></div>", unsafe_allow_html=True)
                 
                 # --- RECOLECCIÓN DE ITEMS ---
-                items_visuales = []
-                dia_str = str(dia_actual)
-                
-                # 1. Clases Scrapeadas
-                for c in horario_clases_scraped:
-                     if c['fecha'] == dia_str:
-                        items_visuales.append({
-                            "tipo": "Clase",
-                            "titulo": c['asignatura'],
-                            "hora_sort": c['hora'].split('-')[0].strip(),
-                            "hora": c['hora'],
-                            "aula": c['aula'],
-                            "color": "#2E8B57",
-                            "es_universidad": True,
-                            "fecha": c['fecha'],
-                            "raw": c
-                        })
-
-                # 1.5 Futbol
-                for f in horario_futbol_scraped:
-                    if f['fecha'] == dia_str:
-                         items_visuales.append({
-                            "tipo": "Futbol",
-                            "titulo": f['titulo'],
-                            "hora_sort": f['hora'] if f['hora'] else "00:00",
-                            "hora": f['hora'] if f['hora'] else "TBD",
-                            "aula": f['aula'],
-                            "color": "#FF4B4B",
-                            "es_futbol": True,
-                            "raw": f
-                         })
-
-                # 2. Horario Dinamico
-                for item in horario_dinamico:
-                    es_este_dia_m = False
-                    if item.get('es_rutina'):
-                         if i in item.get('dias_semana', []): es_este_dia_m = True
-                    elif item.get('es_multidia') and item.get('fecha') and item.get('fecha_fin_evento'):
-                         try:
-                             f_ini_m2 = datetime.strptime(item['fecha'], "%Y-%m-%d").date()
-                             f_fin_m2 = datetime.strptime(item['fecha_fin_evento'], "%Y-%m-%d").date()
-                             if f_ini_m2 <= dia_actual <= f_fin_m2: es_este_dia_m = True
-                         except: pass
-                    else:
-                         if item.get('fecha') == dia_str: es_este_dia_m = True
-                    
-                    if es_este_dia_m:
-                        hora_sort_m = item.get('hora_inicio', '00:00') or '00:00'
-                        hora_display_m = "Todo el día"
-                        if not item.get('dia_completo') and item.get('hora_inicio') and item.get('hora_fin'):
-                            hora_display_m = f"{item['hora_inicio']} - {item['hora_fin']}"
-                        
-                        titulo_m = item['titulo']
-                        
-                        items_visuales.append({
-                            "tipo": "Evento",
-                            "titulo": titulo_m,
-                            "hora_sort": hora_sort_m,
-                            "hora": hora_display_m,
-                            "ubicacion": item.get('ubicacion'),
-                            "color": item.get('color', '#1E90FF'),
-                            "es_rutina": item.get('es_rutina'),
-                            "es_multidia": item.get('es_multidia'),
-                            "id": item.get('id'),
-                            "dias_semana": item.get('dias_semana'),
-                            "raw": item
-                        })
-                
-                # 3. Tareas
-                for t in tareas:
-                    if t.get('estado') == 'Completada': continue
-                    fecha_t = t.get('fecha')
-                    fecha_f = t.get('fecha_fin')
-                    
-                    if fecha_t == dia_str and not fecha_f:
-                        pass
-                    elif fecha_f == dia_str:
-                        pass
-                    else:
-                        continue 
-
-                    items_visuales.append({
-                         "tipo": "tarea",
-                         "titulo": t['titulo'],
-                         "hora_sort": t.get('hora', "23:59"),
-                         "hora": t.get('hora'),
-                         "color": COLORES_TIPO.get(t.get('tipo', 'Otro'), '#808080'),
-                         "msg": t.get('msg'),
-                         "prioridad": t.get('prioridad'),
-                         "estado": t.get('estado'),
-                         "id": t['id'],
-                         "raw": t
-                    })
-
-                items_visuales.sort(key=lambda x: x['hora_sort'].replace(":", "") if x['hora_sort'] else "9999")
+                items_visuales = [ev for ev in items_mes[dia_actual] if not (ev.fuente == 'tarea' and ev.completada)]
+                # Las tareas sin hora (también las de todo el día) van al final del día
+                items_visuales.sort(key=lambda ev: FIN_DEL_DIA + 1 if ev.fuente == 'tarea' and ev.inicio is None else ev.orden)
                 
                 # RENDER DE BOTONES
-                for item in items_visuales:
-                    title_full = item['titulo']
-                    hora_inicio_m = item.get('hora_sort', '')
+                for ev in items_visuales:
+                    title_full = ev.titulo
+                    hora_inicio_m = formato_minutos(ev.orden)
                     trunc_m = (title_full[:6] + '..') if len(title_full) > 6 else title_full
                     
-                    if item['tipo'] == 'Clase':
+                    if ev.origen and ev.origen.hora_en_mes:
                         label_m = f"● {hora_inicio_m} {trunc_m}"
                     else:
                         label_m = f"● {trunc_m}"
                     
                     # Key única mensual
-                    try: 
-                        s_id = str(item.get('id', item['titulo'])).replace(" ", "")
-                    except: s_id = "u"
-                    key_m = f"btn_m_{day_num}_{s_id}_{item['hora_sort']}"
+                    s_id = str(ev.id if ev.id is not None else ev.titulo).replace(" ", "")
+                    key_m = f"btn_m_{day_num}_{s_id}_{ev.orden}"
                     
-                    if st.button(label_m, key=key_m, help=f"{item['hora_sort']} - {title_full}", use_container_width=True):
-                        if 'titulo' not in item['raw']: item['raw']['titulo'] = item['titulo']
-                        mostrar_detalle_item(item['raw'])
+                    if st.button(label_m, key=key_m, help=f"{hora_inicio_m} - {title_full}", use_container_width=True):
+                        mostrar_detalle_item(ev, dia_actual)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+"""
+Benchmark de la capa de persistencia contra la API de GitHub falsa (sin red ni token).
+
+Para cada tamaño de tareas.json y cada latencia simulada (RTT) mide:
+  - lectura en frío (sin caché), lectura con caché y revalidación (304)
+  - escritura de un cambio (un archivo) y de un lote (tareas + horario, un commit)
+  - escritura con conflicto de SHA (otro cliente escribió antes)
+  - limpieza diaria (archivar las completadas antiguas)
+
+Uso:
+    python herramientas/benchmark_persistencia.py --tamanos 50,500,5000 --rtt 0,0.05,0.15
+    python herramientas/benchmark_persistencia.py --backend github_diario
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+os.environ.setdefault("GITHUB_TOKEN", "falso")
+
+from github_falso import EstadoRepo, arrancar_servidor  # noqa: E402
+import app  # noqa: E402
+
+
+def generar_tareas(n, hoy, semilla=0):
+    """n tareas repartidas en ±120 días; ~30% completadas (las pasadas son las que archiva la limpieza)."""
+    azar = random.Random(semilla)
+    tareas = []
+    for i in range(n):
+        fecha = hoy + timedelta(days=azar.randint(-120, 120))
+        tareas.append({
+            "id": i + 1,
+            "titulo": f"Tarea {i + 1}",
+            "fecha": str(fecha),
+            "fecha_fin": str(fecha + timedelta(days=azar.randint(0, 7))) if azar.random() < 0.3 else None,
+            "hora": None,
+            "dia_completo": True,
+            "prioridad": azar.choice(["Normal", "Importante", "Urgente"]),
+            "tipo": azar.choice(["Tarea", "Entrega", "Examen"]),
+            "estado": "Completada" if azar.random() < 0.3 else "Pendiente",
+        })
+    return tareas
+
+
+def medir(estado, funcion):
+    """(milisegundos, peticiones HTTP) que cuesta llamar a funcion()."""
+    n0 = len(estado.peticiones)
+    t0 = time.perf_counter()
+    funcion()
+    return (time.perf_counter() - t0) * 1000, len(estado.peticiones) - n0
+
+
+def escenario(n, rtt, repeticiones):
+    hoy = app.get_madrid_date()
+    tareas = generar_tareas(n, hoy)
+    contenido = json.dumps(tareas, indent=4)
+    estado = EstadoRepo(latencia=rtt, archivos={app.FILE_PATH: contenido, app.HORARIO_DINAMICO_FILE: "[]"})
+    servidor, url, _ = arrancar_servidor(estado)
+    os.environ["GITHUB_API_URL"] = url
+    app._cache_archivos_github().clear()
+    app._limpiezas_hechas().clear()
+    cola = app.cola_escritura()
+    siguiente_id = [n + 1]
+
+    def nueva_tarea():
+        siguiente_id[0] += 1
+        return {"id": siguiente_id[0], "titulo": "Nueva", "fecha": str(hoy), "fecha_fin": None, "hora": None,
+                "dia_completo": True, "prioridad": "Normal", "tipo": "Tarea", "estado": "Pendiente"}
+
+    def lectura_fria():
+        app._cache_archivos_github().clear()
+        app.gestionar_tareas('leer')
+
+    def revalidacion():
+        app.invalidar_cache_github(app.FILE_PATH)
+        app.gestionar_tareas('leer')
+
+    def escritura():
+        app.gestionar_tareas('crear', nueva_tarea=nueva_tarea())
+        cola.vaciar()
+
+    def escritura_lote():
+        app.gestionar_tareas('crear', nueva_tarea=nueva_tarea())
+        app.gestionar_horario('crear', nuevo_item={"id": siguiente_id[0], "titulo": "Evento", "fecha": str(hoy)})
+        cola.vaciar()
+
+    def escritura_conflicto():
+        estado.escribir_directo(app.HORARIO_DINAMICO_FILE, json.dumps([{"id": -siguiente_id[0], "titulo": "Externo"}]))
+        app.gestionar_horario('crear', nuevo_item={"id": siguiente_id[0] + 1, "titulo": "Evento"})
+        cola.vaciar()
+
+    operaciones = [
+        ("lectura en frío", lectura_fria),
+        ("lectura con caché", lambda: app.gestionar_tareas('leer')),
+        ("revalidación (304)", revalidacion),
+        ("escritura", escritura),
+        ("escritura lote (2 archivos)", escritura_lote),
+        ("escritura con conflicto", escritura_conflicto),
+    ]
+    resultados = []
+    for nombre, funcion in operaciones:
+        medidas = [medir(estado, funcion) for _ in range(repeticiones)]
+        resultados.append((nombre, statistics.median(m[0] for m in medidas), statistics.median(m[1] for m in medidas)))
+
+    # La limpieza solo tiene trabajo la primera vez del día
+    ms, peticiones = medir(estado, lambda: (app.archivar_tareas_antiguas(hoy), cola.vaciar()))
+    resultados.append(("limpieza diaria", ms, peticiones))
+
+    if cola.ultimo_error:
+        resultados.append((f"ERROR: {cola.ultimo_error}", 0, 0))
+        cola.reintentar()
+    servidor.shutdown()
+    return len(contenido), resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de persistencia contra la API de GitHub falsa")
+    parser.add_argument("--tamanos", default="50,500,5000", help="Número de tareas en tareas.json (separados por comas)")
+    parser.add_argument("--rtt", default="0,0.05,0.15", help="Latencia simulada por petición en segundos")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--backend", default="github", choices=["github", "github_diario"])
+    args = parser.parse_args()
+
+    os.environ["STORAGE_BACKEND"] = args.backend
+    # Respaldo local (snapshot + WAL) en un directorio temporal para no mezclar con el de la app
+    directorio = tempfile.mkdtemp(prefix="benchmark_autogestor_")
+    app.RESPALDO_SNAPSHOT_FILE = os.path.join(directorio, "snapshot.json")
+    app.RESPALDO_WAL_FILE = os.path.join(directorio, "wal.jsonl")
+    print(f"{'tareas':>7} {'KB':>7} {'RTT ms':>7}  {'operación':<28} {'ms':>9} {'peticiones':>10}")
+    for n in (int(x) for x in args.tamanos.split(",")):
+        for rtt in (float(x) for x in args.rtt.split(",")):
+            tamano, resultados = escenario(n, rtt, args.repeticiones)
+            for nombre, ms, peticiones in resultados:
+                print(f"{n:>7} {tamano / 1024:>7.1f} {rtt * 1000:>7.0f}  {nombre:<28} {ms:>9.1f} {peticiones:>10g}")
+            print()
+    m = app.metricas_github().resumen()
+    print(f"Total: {m['llamadas']} llamadas, {m['errores']} errores, p50 {m['latencia_p50_ms']:.0f} ms, "
+          f"p95 {m['latencia_p95_ms']:.0f} ms, {m['bytes_bajada'] / 1024:.0f} KB bajados, {m['bytes_subida'] / 1024:.0f} KB subidos")
+
+
+if __name__ == "__main__":
+    main()
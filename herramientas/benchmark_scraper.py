@@ -0,0 +1,71 @@
+"""
+Benchmark del scraper con navegador: perfil ligero (imágenes, fuentes y rastreadores bloqueados)
+frente al perfil completo, contra las webs reales. Necesita red y Chrome/chromedriver.
+
+Un recurso bloqueado no llega a pedirse, así que su tamaño solo se conoce comparando
+las dos pasadas: el ahorro es la diferencia de bytes y de tiempo entre ambas.
+
+Uso:
+    python herramientas/benchmark_scraper.py --repeticiones 3
+"""
+import argparse
+import os
+import statistics
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+
+import app  # noqa: E402
+
+
+def pasada(bloquear, repeticiones):
+    """Mediana de segundos, KB y peticiones por fuente con el bloqueo activado o no."""
+    os.environ["BLOQUEAR_RECURSOS"] = "1" if bloquear else "0"
+    # Las opciones de Chrome se fijan al arrancarlo: pool nuevo para cada perfil
+    app.pool_navegadores().cerrar()
+    app.pool_navegadores.clear()
+
+    url = app.url_horario(app.horarios_loyola()[0])
+    fuentes = {
+        "Loyola (navegador)": lambda: app._scrape_clases_navegador(url),
+        "Sevilla FC": app.FuenteSevillaFC().actualizar,
+    }
+    medidas = {nombre: [] for nombre in fuentes}
+    for _ in range(repeticiones):
+        _, informe = app.actualizar_fuentes(fuentes, max_paralelo=1)  # Una a una: sin competir por CPU ni red
+        for nombre, datos in informe.items():
+            if datos["error"]:
+                print(f"  {nombre}: ERROR {datos['error']}")
+            medidas[nombre].append(datos)
+    return {
+        nombre: (statistics.median(d["segundos"] for d in lista),
+                 statistics.median(d["bytes"] for d in lista) / 1024,
+                 statistics.median(d["peticiones"] for d in lista),
+                 statistics.median(d["bloqueadas"] for d in lista))
+        for nombre, lista in medidas.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ahorro del perfil ligero del navegador del scraper")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    completo = pasada(False, args.repeticiones)
+    ligero = pasada(True, args.repeticiones)
+    app.pool_navegadores().cerrar()
+
+    print(f"{'fuente':<20} {'perfil':<9} {'s':>7} {'KB':>9} {'peticiones':>10} {'bloqueadas':>10}")
+    for nombre in completo:
+        for perfil, medida in (("completo", completo[nombre]), ("ligero", ligero[nombre])):
+            print(f"{nombre:<20} {perfil:<9} {medida[0]:>7.2f} {medida[1]:>9.0f} {medida[2]:>10g} {medida[3]:>10g}")
+        ahorro_s = completo[nombre][0] - ligero[nombre][0]
+        ahorro_kb = completo[nombre][1] - ligero[nombre][1]
+        print(f"{nombre:<20} {'ahorro':<9} {ahorro_s:>7.2f} {ahorro_kb:>9.0f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Servidor HTTP local que imita la parte de la API de GitHub que usa AutoGestor
+(Contents API y Git Data API), para medir y probar la persistencia sin red.
+
+Uso:
+    python herramientas/github_falso.py --puerto 8765 --latencia 0.05
+
+Y en la app: GITHUB_API_URL=http://127.0.0.1:8765 GITHUB_TOKEN=falso streamlit run app.py
+"""
+import argparse
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, unquote
+
+
+def sha_blob(contenido):
+    """SHA de blob al estilo git (el mismo que devuelve GitHub en Contents API)."""
+    return hashlib.sha1(b"blob %d\0" % len(contenido) + contenido).hexdigest()
+
+
+class EstadoRepo:
+    """Repositorio en memoria: blobs, árboles planos, commits y una rama."""
+
+    def __init__(self, owner="carlosmolina55", nombre="Proyecto-Horario", rama="main",
+                 latencia=0.0, cuota=5000, archivos=None):
+        self.owner = owner
+        self.nombre = nombre
+        self.rama = rama
+        self.latencia = latencia
+        self.cuota = cuota
+        self.restantes = cuota
+        self.lock = threading.RLock()
+        self.blobs = {}
+        self.arboles = {}
+        self.commits = {}
+        self.conflictos_forzados = 0
+        self.peticiones = []  # (metodo, ruta, estado)
+
+        arbol = {}
+        for path, contenido in (archivos or {}).items():
+            arbol[path] = self._guardar_blob(contenido.encode() if isinstance(contenido, str) else contenido)
+        self.head = self._crear_commit("Inicial", self._guardar_arbol(arbol), [])
+
+    # --- Objetos git ---
+
+    def _guardar_blob(self, contenido):
+        sha = sha_blob(contenido)
+        self.blobs[sha] = contenido
+        return sha
+
+    def _guardar_arbol(self, arbol):
+        sha = hashlib.sha1(json.dumps(sorted(arbol.items())).encode()).hexdigest()
+        self.arboles[sha] = dict(arbol)
+        return sha
+
+    def _crear_commit(self, mensaje, arbol_sha, padres):
+        sha = hashlib.sha1(f"{mensaje}{arbol_sha}{padres}{time.time_ns()}".encode()).hexdigest()
+        self.commits[sha] = {"mensaje": mensaje, "arbol": arbol_sha, "padres": list(padres)}
+        return sha
+
+    def arbol_head(self):
+        return self.arboles[self.commits[self.head]["arbol"]]
+
+    def leer(self, path):
+        """Contenido actual de un archivo en la rama (None si no existe)."""
+        with self.lock:
+            sha = self.arbol_head().get(path)
+            return self.blobs[sha] if sha else None
+
+    def escribir_directo(self, path, contenido, mensaje="Escritura externa"):
+        """Simula un commit de otro cliente (para provocar conflictos)."""
+        with self.lock:
+            arbol = dict(self.arbol_head())
+            arbol[path] = self._guardar_blob(contenido.encode() if isinstance(contenido, str) else contenido)
+            self.head = self._crear_commit(mensaje, self._guardar_arbol(arbol), [self.head])
+
+
+class ManejadorGithub(BaseHTTPRequestHandler):
+    estado = None  # EstadoRepo, se asigna al crear el servidor
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    # --- Utilidades ---
+
+    @property
+    def base(self):
+        return f"http://{self.headers.get('Host')}"
+
+    @property
+    def url_repo(self):
+        e = self.estado
+        return f"{self.base}/repos/{e.owner}/{e.nombre}"
+
+    def _responder(self, estado_http, datos=None, cabeceras=None, cuenta=True):
+        e = self.estado
+        if cuenta and estado_http != 304:
+            e.restantes = max(0, e.restantes - 1)
+        cuerpo = b"" if datos is None else json.dumps(datos).encode()
+        self.send_response(estado_http)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.send_header("X-RateLimit-Limit", str(e.cuota))
+        self.send_header("X-RateLimit-Remaining", str(e.restantes))
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        for k, v in (cabeceras or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if cuerpo:
+            self.wfile.write(cuerpo)
+        e.peticiones.append((self.command, urlparse(self.path).path, estado_http))
+
+    def _leer_cuerpo(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(n) or b"{}") if n else {}
+
+    def _ruta_repo(self):
+        """Devuelve la parte de la ruta tras /repos/{owner}/{repo} (o None si es otro repo)."""
+        e = self.estado
+        ruta = urlparse(self.path).path
+        prefijo = f"/repos/{e.owner}/{e.nombre}"
+        if ruta == prefijo:
+            return ""
+        if ruta.startswith(prefijo + "/"):
+            return ruta[len(prefijo):]
+        return None
+
+    def _json_contenido(self, path, sha):
+        contenido = self.estado.blobs[sha]
+        return {
+            "type": "file", "encoding": "base64", "name": path.rsplit("/", 1)[-1], "path": path,
+            "sha": sha, "size": len(contenido),
+            "content": base64.b64encode(contenido).decode(),
+            "url": f"{self.url_repo}/contents/{path}?ref={self.estado.rama}",
+        }
+
+    def _json_commit(self, sha):
+        c = self.estado.commits[sha]
+        return {
+            "sha": sha, "url": f"{self.url_repo}/git/commits/{sha}", "message": c["mensaje"],
+            "tree": {"sha": c["arbol"], "url": f"{self.url_repo}/git/trees/{c['arbol']}"},
+            "parents": [{"sha": p, "url": f"{self.url_repo}/git/commits/{p}"} for p in c["padres"]],
+            "author": {"name": "falso", "email": "falso@example.com", "date": "2026-01-01T00:00:00Z"},
+            "committer": {"name": "falso", "email": "falso@example.com", "date": "2026-01-01T00:00:00Z"},
+        }
+
+    def _json_ref(self):
+        e = self.estado
+        return {
+            "ref": f"refs/heads/{e.rama}", "url": f"{self.url_repo}/git/refs/heads/{e.rama}",
+            "object": {"sha": e.head, "type": "commit", "url": f"{self.url_repo}/git/commits/{e.head}"},
+        }
+
+    def _commit_archivo(self, path, contenido, mensaje):
+        e = self.estado
+        arbol = dict(e.arbol_head())
+        if contenido is None:
+            arbol.pop(path, None)
+        else:
+            arbol[path] = e._guardar_blob(contenido)
+        e.head = e._crear_commit(mensaje, e._guardar_arbol(arbol), [e.head])
+        return arbol.get(path)
+
+    def _antes(self):
+        """Latencia simulada y control de cuota. Devuelve False si ya se respondió."""
+        e = self.estado
+        if e.latencia:
+            time.sleep(e.latencia)
+        if e.restantes <= 0 and not self.headers.get("If-None-Match"):
+            self._leer_cuerpo()  # Consumir el cuerpo para no romper la conexión keep-alive
+            self._responder(403, {"message": "API rate limit exceeded"}, cuenta=False)
+            return False
+        return True
+
+    # --- Verbos ---
+
+    def do_GET(self):
+        if not self._antes():
+            return
+        e = self.estado
+        ruta = self._ruta_repo()
+        with e.lock:
+            if urlparse(self.path).path == "/rate_limit":
+                rate = {"limit": e.cuota, "remaining": e.restantes, "reset": int(time.time()) + 3600, "used": e.cuota - e.restantes}
+                return self._responder(200, {"resources": {"core": rate}, "rate": rate}, cuenta=False)
+            if ruta is None:
+                return self._responder(404, {"message": "Not Found"})
+            if ruta == "":
+                return self._responder(200, {
+                    "id": 1, "name": e.nombre, "full_name": f"{e.owner}/{e.nombre}",
+                    "owner": {"login": e.owner}, "url": self.url_repo, "default_branch": e.rama,
+                })
+            if ruta.startswith("/contents/"):
+                path = unquote(ruta[len("/contents/"):])
+                sha = e.arbol_head().get(path)
+                if not sha:
+                    hijos = [p for p in e.arbol_head() if p.startswith(path.rstrip("/") + "/")]
+                    if hijos:  # Directorio: lista de sus archivos
+                        return self._responder(200, [self._json_contenido(p, e.arbol_head()[p]) for p in sorted(hijos)])
+                    return self._responder(404, {"message": "Not Found"})
+                etag = f'"{sha}"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self._responder(304, cabeceras={"ETag": etag})
+                return self._responder(200, self._json_contenido(path, sha), cabeceras={"ETag": etag})
+            m = re.fullmatch(r"/git/refs?/heads/(.+)", ruta)
+            if m:
+                if m.group(1) != e.rama:
+                    return self._responder(404, {"message": "Not Found"})
+                return self._responder(200, self._json_ref())
+            m = re.fullmatch(r"/git/commits/([0-9a-f]+)", ruta)
+            if m and m.group(1) in e.commits:
+                return self._responder(200, self._json_commit(m.group(1)))
+            m = re.fullmatch(r"/git/trees/([0-9a-f]+)", ruta)
+            if m and m.group(1) in e.arboles:
+                arbol = e.arboles[m.group(1)]
+                return self._responder(200, {
+                    "sha": m.group(1), "url": f"{self.url_repo}/git/trees/{m.group(1)}", "truncated": False,
+                    "tree": [{"path": p, "mode": "100644", "type": "blob", "sha": s} for p, s in sorted(arbol.items())],
+                })
+            m = re.fullmatch(r"/git/blobs/([0-9a-f]+)", ruta)
+            if m and m.group(1) in e.blobs:
+                return self._responder(200, {
+                    "sha": m.group(1), "encoding": "base64", "size": len(e.blobs[m.group(1)]),
+                    "content": base64.b64encode(e.blobs[m.group(1)]).decode(),
+                })
+            return self._responder(404, {"message": "Not Found"})
+
+    def do_PUT(self):
+        if not self._antes():
+            return
+        e = self.estado
+        ruta = self._ruta_repo()
+        cuerpo = self._leer_cuerpo()
+        with e.lock:
+            if not ruta or not ruta.startswith("/contents/"):
+                return self._responder(404, {"message": "Not Found"})
+            path = unquote(ruta[len("/contents/"):])
+            actual = e.arbol_head().get(path)
+            if e.conflictos_forzados > 0:
+                e.conflictos_forzados -= 1
+                return self._responder(409, {"message": f"{path} does not match {cuerpo.get('sha')}"})
+            if actual and not cuerpo.get("sha"):
+                return self._responder(422, {"message": "Invalid request.\n\n\"sha\" wasn't supplied."})
+            if actual and cuerpo.get("sha") != actual:
+                return self._responder(409, {"message": f"{path} does not match {cuerpo.get('sha')}"})
+            nuevo = self._commit_archivo(path, base64.b64decode(cuerpo.get("content", "")), cuerpo.get("message", ""))
+            return self._responder(200 if actual else 201, {
+                "content": self._json_contenido(path, nuevo),
+                "commit": self._json_commit(e.head),
+            })
+
+    def do_POST(self):
+        if not self._antes():
+            return
+        e = self.estado
+        ruta = self._ruta_repo()
+        cuerpo = self._leer_cuerpo()
+        with e.lock:
+            if ruta == "/git/blobs":
+                contenido = cuerpo.get("content", "")
+                datos = base64.b64decode(contenido) if cuerpo.get("encoding") == "base64" else contenido.encode()
+                sha = e._guardar_blob(datos)
+                return self._responder(201, {"sha": sha, "url": f"{self.url_repo}/git/blobs/{sha}"})
+            if ruta == "/git/trees":
+                arbol = dict(e.arboles.get(cuerpo.get("base_tree"), {}))
+                for el in cuerpo.get("tree", []):
+                    if "content" in el:
+                        arbol[el["path"]] = e._guardar_blob(el["content"].encode())
+                    elif el.get("sha") is None:
+                        arbol.pop(el["path"], None)
+                    else:
+                        arbol[el["path"]] = el["sha"]
+                sha = e._guardar_arbol(arbol)
+                return self._responder(201, {
+                    "sha": sha, "url": f"{self.url_repo}/git/trees/{sha}",
+                    "tree": [{"path": p, "mode": "100644", "type": "blob", "sha": s} for p, s in arbol.items()],
+                })
+            if ruta == "/git/commits":
+                if cuerpo.get("tree") not in e.arboles:
+                    return self._responder(422, {"message": "Tree SHA does not exist"})
+                sha = e._crear_commit(cuerpo.get("message", ""), cuerpo["tree"], cuerpo.get("parents", []))
+                return self._responder(201, self._json_commit(sha))
+            return self._responder(404, {"message": "Not Found"})
+
+    def do_PATCH(self):
+        if not self._antes():
+            return
+        e = self.estado
+        ruta = self._ruta_repo()
+        cuerpo = self._leer_cuerpo()
+        with e.lock:
+            if ruta != f"/git/refs/heads/{e.rama}":
+                return self._responder(404, {"message": "Not Found"})
+            nuevo = cuerpo.get("sha")
+            if nuevo not in e.commits:
+                return self._responder(422, {"message": "Object does not exist"})
+            if e.conflictos_forzados > 0:
+                e.conflictos_forzados -= 1
+                return self._responder(422, {"message": "Update is not a fast forward"})
+            if not cuerpo.get("force") and e.head not in e.commits[nuevo]["padres"]:
+                return self._responder(422, {"message": "Update is not a fast forward"})
+            e.head = nuevo
+            return self._responder(200, self._json_ref())
+
+
+def arrancar_servidor(estado=None, puerto=0):
+    """Arranca el servidor en un hilo. Devuelve (servidor, url_base, estado)."""
+    estado = estado or EstadoRepo()
+    manejador = type("Manejador", (ManejadorGithub,), {"estado": estado})
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}", estado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API de GitHub falsa para pruebas locales")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Segundos añadidos a cada petición")
+    parser.add_argument("--cuota", type=int, default=5000, help="Peticiones antes de devolver 403 (rate limit)")
+    args = parser.parse_args()
+
+    archivos = {"tareas.json": "[]", "horario.json": "[]"}
+    servidor, url, _ = arrancar_servidor(EstadoRepo(latencia=args.latencia, cuota=args.cuota, archivos=archivos), args.puerto)
+    print(f"API de GitHub falsa en {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
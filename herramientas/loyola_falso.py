@@ -0,0 +1,166 @@
+"""
+Servidor HTTP local que imita el portal de horarios de la Universidad Loyola (JSF/PrimeFaces),
+para probar y medir la descarga del horario sin red.
+
+  - GET  horario.xhtml -> la página con el calendario (fixtures/loyola_horario.xhtml)
+  - POST horario.xhtml -> respuesta AJAX parcial con los eventos del rango pedido; las clases de
+    fixtures/loyola_eventos.json (una semana tipo) se repiten en cada semana del rango. Las que
+    llevan "grupos" solo salen para esos grupos (parámetro grupo de la URL); el resto, para todos.
+    Con --sin-zona las horas van sin zona y una hora por detrás, como las sirve el portal real
+
+Uso:
+    python herramientas/loyola_falso.py --puerto 8766 --latencia 0.1 [--sin-zona]
+
+Y en la app: LOYOLA_URL="http://127.0.0.1:8766/LoyolaHorario/horario.xhtml?grupo=A" streamlit run app.py
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+import pytz
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+ZONA = pytz.timezone("Europe/Madrid")
+ID_SCHEDULE = "formHorario:horario"
+CAMPO_VIEWSTATE = "javax.faces.ViewState"
+
+
+class EstadoPortal:
+    """Página y semana tipo del portal, más contadores para las mediciones."""
+
+    def __init__(self, latencia=0.0, pagina=None, semana_tipo=None, sin_zona=False, respuesta_ajax=None):
+        self.latencia = latencia
+        self.sin_zona = sin_zona
+        self.respuesta_ajax = respuesta_ajax  # Si se da, es la respuesta a todo POST (capturas, errores)
+        with open(os.path.join(FIXTURES, "loyola_horario.xhtml"), encoding="utf-8") as f:
+            self.pagina = pagina or f.read()
+        with open(os.path.join(FIXTURES, "loyola_eventos.json"), encoding="utf-8") as f:
+            self.semana_tipo = semana_tipo or json.load(f)
+        self.lock = threading.Lock()
+        self.peticiones = []
+        self.bytes_enviados = 0
+
+    def eventos(self, desde, hasta, grupo=None):
+        """Eventos FullCalendar (ISO con zona de Madrid) de la semana tipo entre desde y hasta."""
+        eventos = []
+        dia = desde - timedelta(days=desde.weekday())
+        while dia < hasta:
+            for clase in self.semana_tipo:
+                fecha = dia + timedelta(days=clase["dia"])
+                if not desde <= fecha < hasta or grupo not in clase.get("grupos", [grupo]):
+                    continue
+                inicio = ZONA.localize(datetime.combine(fecha, datetime.strptime(clase["inicio"], "%H:%M").time()))
+                fin = ZONA.localize(datetime.combine(fecha, datetime.strptime(clase["fin"], "%H:%M").time()))
+                if self.sin_zona:
+                    inicio, fin = (m.replace(tzinfo=None) - timedelta(hours=1) for m in (inicio, fin))
+                eventos.append({
+                    "id": f"{fecha}-{clase['inicio']}",
+                    "title": clase["title"],
+                    "start": inicio.isoformat(),
+                    "end": fin.isoformat(),
+                    "allDay": False,
+                    "editable": False,
+                })
+            dia += timedelta(weeks=1)
+        return eventos
+
+
+def _fecha_parametro(valor):
+    """Fecha de inicio/fin tal como la manda PrimeFaces: ISO (v10+) o milisegundos epoch."""
+    if valor.isdigit():
+        return datetime.fromtimestamp(int(valor) / 1000, ZONA).date()
+    return date.fromisoformat(valor[:10])
+
+
+class ManejadorLoyola(BaseHTTPRequestHandler):
+    estado = None  # Se fija en arrancar_servidor
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, codigo, cuerpo, tipo):
+        datos = cuerpo.encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(datos)))
+        if codigo == 200 and self.command == "GET":
+            self.send_header("Set-Cookie", "JSESSIONID=falso; Path=/LoyolaHorario; HttpOnly")
+        self.end_headers()
+        self.wfile.write(datos)
+        with self.estado.lock:
+            self.estado.bytes_enviados += len(datos)
+
+    def _registrar(self):
+        with self.estado.lock:
+            self.estado.peticiones.append((self.command, urlparse(self.path).path))
+        if self.estado.latencia:
+            time.sleep(self.estado.latencia)
+
+    def do_GET(self):
+        self._registrar()
+        if not urlparse(self.path).path.endswith("horario.xhtml"):
+            return self._responder(404, "No encontrado", "text/plain; charset=utf-8")
+        # Como JSF, el action del formulario repite los parámetros de la URL pedida
+        consulta = urlparse(self.path).query.replace("&", "&amp;")
+        pagina = re.sub(r'(action="[^"?]*)\?[^"]*"', lambda m: f'{m.group(1)}?{consulta}"', self.estado.pagina, count=1)
+        self._responder(200, pagina, "text/html; charset=utf-8")
+
+    def do_POST(self):
+        self._registrar()
+        longitud = int(self.headers.get("Content-Length") or 0)
+        campos = {k: v[0] for k, v in parse_qs(self.rfile.read(longitud).decode("utf-8")).items()}
+
+        # Sin ViewState o sin cookie de sesión, JSF responde con un error de vista caducada
+        if CAMPO_VIEWSTATE not in campos or "JSESSIONID" not in (self.headers.get("Cookie") or ""):
+            cuerpo = ('<?xml version="1.0" encoding="UTF-8"?><partial-response><error>'
+                      '<error-name>javax.faces.application.ViewExpiredException</error-name>'
+                      '<error-message><![CDATA[La vista ha caducado]]></error-message></error></partial-response>')
+            return self._responder(200, cuerpo, "text/xml; charset=utf-8")
+        if self.estado.respuesta_ajax is not None:
+            return self._responder(200, self.estado.respuesta_ajax, "text/xml; charset=utf-8")
+        try:
+            desde = _fecha_parametro(campos[f"{ID_SCHEDULE}_start"])
+            hasta = _fecha_parametro(campos[f"{ID_SCHEDULE}_end"])
+        except (KeyError, ValueError):
+            return self._responder(400, "Rango de fechas no válido", "text/plain; charset=utf-8")
+
+        grupo = parse_qs(urlparse(self.path).query).get("grupo", [None])[0]
+        eventos = json.dumps({"events": self.estado.eventos(desde, hasta, grupo)}, ensure_ascii=False)
+        cuerpo = ('<?xml version="1.0" encoding="UTF-8"?><partial-response id="j_id1"><changes>'
+                  f'<update id="{escape(ID_SCHEDULE)}"><![CDATA[{eventos}]]></update>'
+                  f'<update id="j_id1:{CAMPO_VIEWSTATE}:0"><![CDATA[-4518322318851227351:7206403185513932210]]></update>'
+                  '</changes></partial-response>')
+        self._responder(200, cuerpo, "text/xml; charset=utf-8")
+
+
+def arrancar_servidor(estado=None, puerto=0):
+    """Arranca el servidor en un hilo. Devuelve (servidor, url_horario, estado)."""
+    estado = estado or EstadoPortal()
+    manejador = type("Manejador", (ManejadorLoyola,), {"estado": estado})
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{servidor.server_address[1]}/LoyolaHorario/horario.xhtml?curso=2025%2F26&tipo=M&titu=2175&campus=2&ncurso=1&grupo=A"
+    return servidor, url, estado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Portal de horarios de Loyola falso para pruebas locales")
+    parser.add_argument("--puerto", type=int, default=8766)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Segundos añadidos a cada petición")
+    parser.add_argument("--sin-zona", action="store_true", help="Horas sin zona y una hora por detrás, como el portal real")
+    args = parser.parse_args()
+
+    servidor, url, _ = arrancar_servidor(EstadoPortal(latencia=args.latencia, sin_zona=args.sin_zona), args.puerto)
+    print(f"Portal de Loyola falso en {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,75 @@
+"""
+Re-parsea capturas del horario sin navegador ni red, y mide cuánto tarda el parseo.
+
+Acepta cualquier formato que entienda app.parsear_horario: HTML renderizado por FullCalendar
+(page_source o "Guardar página"), respuestas AJAX de JSF (.xml), JSON de eventos de FullCalendar
+o el JSON por semana que extrae el navegador. Las capturas se guardan configurando
+CAPTURAS_HORARIO=<carpeta> en la app.
+
+Uso:
+    python herramientas/parsear_horario.py                      # fixtures/ de este directorio
+    python herramientas/parsear_horario.py capturas/ --repeticiones 200
+    python herramientas/parsear_horario.py capturas/ --salida horario_clases.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+
+import app  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+EXTENSIONES = (".html", ".htm", ".xhtml", ".xml", ".json")
+NO_CAPTURAS = ("loyola_horario.xhtml", "loyola_eventos.json")  # Página sin eventos y semana tipo del portal falso
+
+
+def archivos(rutas):
+    """Archivos de captura de las rutas dadas (las carpetas se recorren sin recursión)."""
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            for nombre in sorted(os.listdir(ruta)):
+                if nombre.endswith(EXTENSIONES) and nombre not in NO_CAPTURAS:
+                    yield os.path.join(ruta, nombre)
+        else:
+            yield ruta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-parsea capturas del horario y mide el parseo")
+    parser.add_argument("rutas", nargs="*", default=[FIXTURES], help="Archivos o carpetas de capturas")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--salida", help="Escribe aquí las clases de todas las capturas (formato horario_clases.json)")
+    args = parser.parse_args()
+
+    todas = []
+    print(f"{'captura':<48} {'KB':>7} {'clases':>7} {'ms (mediana)':>13} {'MB/s':>7}")
+    for ruta in archivos(args.rutas):
+        with open(ruta, encoding="utf-8") as f:
+            contenido = f.read()
+        tiempos = []
+        for _ in range(args.repeticiones):
+            inicio = time.perf_counter()
+            clases = app.parsear_horario(contenido)
+            tiempos.append(time.perf_counter() - inicio)
+        mediana = statistics.median(tiempos)
+        mb_s = len(contenido.encode("utf-8")) / 1e6 / mediana if mediana else float("inf")
+        print(f"{os.path.basename(ruta):<48} {len(contenido) / 1024:>7.1f} {len(clases):>7} {mediana * 1000:>13.3f} {mb_s:>7.1f}")
+        todas.extend(clases)
+
+    if args.salida:
+        # Una clase capturada dos veces (capturas solapadas) se guarda una sola vez
+        unicas = {json.dumps(c, sort_keys=True, ensure_ascii=False): c for c in todas}
+        clases = sorted(unicas.values(), key=lambda c: (c["fecha"], c.get("hora") or ""))
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(clases, f, indent=4, ensure_ascii=False)
+        print(f"{len(clases)} clases escritas en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import json
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [RAIZ, os.path.join(RAIZ, "herramientas")]
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+
+import app  # noqa: E402
+import github_falso  # noqa: E402
+import loyola_falso  # noqa: E402
+
+
+@pytest.fixture
+def github():
+    """Repo de la API de GitHub falsa con tareas.json y horario.json vacíos, y la caché de lectura limpia."""
+    estado = github_falso.EstadoRepo(archivos={app.FILE_PATH: "[]", app.HORARIO_DINAMICO_FILE: "[]"})
+    servidor, url, _ = github_falso.arrancar_servidor(estado)
+    app._cache_archivos_github().clear()
+    yield app._repo_github("falso", url), estado
+    servidor.shutdown()
+    app._cache_archivos_github().clear()
+
+
+@pytest.fixture
+def portal_loyola():
+    """Arranca portales de Loyola falsos: portal_loyola(**opciones de EstadoPortal) -> (url del grupo A, estado)."""
+    servidores = []
+
+    def arrancar(**opciones):
+        servidor, url, estado = loyola_falso.arrancar_servidor(loyola_falso.EstadoPortal(**opciones))
+        servidores.append(servidor)
+        return url, estado
+
+    yield arrancar
+    for servidor in servidores:
+        servidor.shutdown()
+
+
+def leer_remoto(estado, path):
+    """Registros de un archivo tal como está en la rama del repo falso."""
+    return json.loads(estado.leer(path) or "[]")
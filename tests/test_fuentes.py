@@ -0,0 +1,91 @@
+"""Fuentes de eventos (plugins de FuenteScraping): registro, y descarga/parseo/fusión de FuenteLoyola."""
+import json
+from datetime import date, timedelta
+
+import pytest
+
+import app
+
+HOY = date(2026, 10, 14)
+
+
+@pytest.fixture
+def loyola(portal_loyola, tmp_path, monkeypatch):
+    """FuenteLoyola del horario por defecto contra el portal falso, con sus archivos en un directorio temporal."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app, "get_madrid_date", lambda: HOY)
+    url, estado = portal_loyola()
+    monkeypatch.setenv("LOYOLA_URL", url)
+    fuente = app.FuenteLoyola(app.HORARIO_LOYOLA_DEFECTO)
+    fuente.portal = estado
+    return fuente
+
+
+def test_fuente_a_medias_falla_al_registrarse():
+    tipos = list(app._TIPOS_FUENTE)
+
+    with pytest.raises(TypeError, match="parsear"):
+        @app.registrar_fuente
+        class SoloDescarga(app.FuenteScraping):
+            nombre = "A medias"
+
+            def descargar(self):
+                return []
+
+    assert app._TIPOS_FUENTE == tipos
+
+
+def test_fuentes_registradas_implementan_la_interfaz():
+    assert {app.FuenteLoyola, app.FuenteSevillaFC} <= set(app._TIPOS_FUENTE)
+    assert not any(getattr(cls, "__abstractmethods__", None) for cls in app._TIPOS_FUENTE)
+
+
+def test_loyola_descarga_solo_las_semanas_pendientes(loyola):
+    todas = loyola.parsear(loyola.descargar())
+    assert len(todas) == app.SEMANAS_HORARIO
+    loyola.actualizar()
+
+    bruto = loyola.descargar()
+
+    # Con todo recién descargado solo quedan las volátiles, pedidas en un único POST
+    assert bruto["semanas"] == [date(2026, 10, 12), date(2026, 10, 19)]
+    assert len(bruto["respuestas"]) == 1
+    assert loyola.parsear(bruto) == {lunes: todas[lunes] for lunes in bruto["semanas"]}
+
+
+def test_loyola_actualizar_usa_el_navegador_si_falla_el_http(loyola, monkeypatch):
+    previas = loyola.actualizar()
+    huellas = {k: v["hash"] for k, v in loyola.leer_estado()["semanas"].items()}
+    loyola.portal.respuesta_ajax = '<?xml version="1.0"?><partial-response><error/></partial-response>'
+    columnas = [{"x": 100 + 150 * i, "ancho": 150, "fecha": str(date(2026, 10, 12) + timedelta(days=i))} for i in range(5)]
+    semana = {"columnas": columnas,
+              "eventos": [{"x": 102, "ancho": 146, "hora": "8:00 - 9:30", "titulo": "Cálculo II / Aula: 2.11", "texto": ""}]}
+    # El navegador se corta tras la primera semana
+    monkeypatch.setattr(app, "descargar_semanas_navegador", lambda url, driver=None: [json.dumps(semana)])
+
+    clases = loyola.actualizar()
+
+    calculo = {"asignatura": "Cálculo II", "titulo": "Cálculo II", "aula": "2.11", "fecha": "2026-10-12",
+               "hora": "09:00 - 10:30", "dia_completo": False}
+    assert [c for c in clases if c["fecha"] < "2026-10-19"] == [calculo]
+    # Las semanas que no se capturaron conservan sus clases y sus huellas
+    assert [c for c in clases if c["fecha"] >= "2026-10-19"] == [c for c in previas if c["fecha"] >= "2026-10-19"]
+    estado = {k: v["hash"] for k, v in loyola.leer_estado()["semanas"].items()}
+    assert estado.pop("2026-10-12") != huellas.pop("2026-10-12")
+    assert estado == huellas
+
+
+def test_sevilla_solo_partidos_en_casa():
+    filas = [
+        "Jornada 9\n18.10.2026\n21:00\nSevilla FC\nVS\nReal Betis",
+        "Jornada 10\n25.10.2026\n-- : --\nVillarreal CF\nVS\nSevilla FC",
+        "Jornada 11\n01.11.2026\n-- : --\nSevilla FC\nVS\nGirona FC",
+        "Cabecera sin fecha",
+    ]
+
+    partidos = app.FuenteSevillaFC().parsear(filas)
+
+    assert [(p["fecha"], p["hora"], p["dia_completo"]) for p in partidos] == [
+        ("2026-10-18", "21:00", False),
+        ("2026-11-01", None, True),
+    ]
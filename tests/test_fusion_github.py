@@ -0,0 +1,111 @@
+"""Escritores concurrentes contra la API de GitHub falsa: nadie pierde sus cambios."""
+import json
+
+import app
+from conftest import leer_remoto
+
+TAREAS = app.FILE_PATH
+HORARIO = app.HORARIO_DINAMICO_FILE
+
+
+def tarea(id_, **campos):
+    return {"id": id_, "titulo": f"Tarea {id_}", "estado": "Pendiente", **campos}
+
+
+def volcar(repo, path, *ops):
+    """Sube las operaciones con la cola de escritura, sin su hilo ni su ventana."""
+    cola = app.ColaEscritura(debounce=0)
+    cola.repo = repo
+    cola.pendientes = {path: [dict(op, mensaje="prueba") for op in ops]}
+    cola.vaciar()
+    assert cola.ultimo_error is None
+    assert cola.num_pendientes() == 0
+    return cola
+
+
+def test_escritor_entre_lectura_y_escritura_conserva_ambas_altas(github):
+    repo, estado = github
+    estado.escribir_directo(TAREAS, json.dumps([tarea(1)]))
+    app.leer_json_github(repo, TAREAS)  # Nuestra lectura (queda en caché con el SHA viejo)
+    estado.escribir_directo(TAREAS, json.dumps([tarea(1), tarea(3)]))  # Otro cliente escribe después
+
+    volcar(repo, TAREAS, {"accion": "crear", "item": tarea(2)})
+
+    assert [t["id"] for t in leer_remoto(estado, TAREAS)] == [1, 3, 2]
+    assert [p[2] for p in estado.peticiones if p[0] == "PUT"] == [409, 200]
+
+
+def test_conflicto_en_ref_edit_fusiona_el_lote(github):
+    repo, estado = github
+    estado.escribir_directo(TAREAS, json.dumps([tarea(1)]))
+
+    def nuestras_tareas(actuales):
+        # Otro cliente hace commit después de leer la rama y antes de nuestro ref.edit (solo la primera vez)
+        if not any(t["id"] == 3 for t in leer_remoto(estado, TAREAS)):
+            estado.escribir_directo(TAREAS, json.dumps([tarea(1), tarea(3)]))
+            estado.escribir_directo(HORARIO, json.dumps([{"id": 30, "titulo": "Suyo"}]))
+        return actuales + [tarea(2)]
+
+    escritos = app.escribir_lote_github(repo, {
+        TAREAS: nuestras_tareas,
+        HORARIO: lambda actuales: actuales + [{"id": 20, "titulo": "Nuestro"}],
+    }, "lote")
+
+    assert [t["id"] for t in leer_remoto(estado, TAREAS)] == [1, 3, 2]
+    assert [h["id"] for h in leer_remoto(estado, HORARIO)] == [30, 20]
+    assert escritos[TAREAS] == leer_remoto(estado, TAREAS)
+    assert ("PATCH", "/repos/carlosmolina55/Proyecto-Horario/git/refs/heads/main", 422) in estado.peticiones
+
+
+def test_borrado_frente_a_edicion_conserva_la_edicion(github):
+    repo, estado = github
+    estado.escribir_directo(TAREAS, json.dumps([tarea(1), tarea(2)]))
+    app.leer_json_github(repo, TAREAS)
+    estado.escribir_directo(TAREAS, json.dumps([tarea(1, titulo="Editada por otro"), tarea(2)]))
+
+    volcar(repo, TAREAS, {"accion": "borrar", "id": 1})
+
+    assert leer_remoto(estado, TAREAS) == [tarea(1, titulo="Editada por otro"), tarea(2)]
+
+
+def test_edicion_frente_a_borrado_conserva_la_edicion(github):
+    repo, estado = github
+    estado.escribir_directo(TAREAS, json.dumps([tarea(1), tarea(2)]))
+    app.leer_json_github(repo, TAREAS)
+    estado.escribir_directo(TAREAS, json.dumps([tarea(2)]))
+
+    volcar(repo, TAREAS, {"accion": "actualizar", "item": tarea(1, estado="Completada")})
+
+    assert leer_remoto(estado, TAREAS) == [tarea(2), tarea(1, estado="Completada")]
+
+
+def test_borrado_de_lo_que_nadie_toco_se_aplica(github):
+    repo, estado = github
+    estado.escribir_directo(TAREAS, json.dumps([tarea(1), tarea(2)]))
+    app.leer_json_github(repo, TAREAS)
+    estado.escribir_directo(TAREAS, json.dumps([tarea(1), tarea(2), tarea(3)]))
+
+    volcar(repo, TAREAS, {"accion": "borrar", "id": 1})
+
+    assert [t["id"] for t in leer_remoto(estado, TAREAS)] == [2, 3]
+
+
+def test_ediciones_de_campos_distintos_se_fusionan_campo_a_campo(github):
+    repo, estado = github
+    estado.escribir_directo(TAREAS, json.dumps([tarea(1)]))
+    app.leer_json_github(repo, TAREAS)
+    estado.escribir_directo(TAREAS, json.dumps([tarea(1, prioridad="Urgente")]))
+
+    volcar(repo, TAREAS, {"accion": "actualizar", "item": tarea(1, estado="Completada")})
+
+    assert leer_remoto(estado, TAREAS) == [tarea(1, estado="Completada", prioridad="Urgente")]
+
+
+def test_conflictos_forzados_se_reintentan_sin_duplicar(github):
+    repo, estado = github
+    estado.conflictos_forzados = 2
+
+    volcar(repo, TAREAS, {"accion": "crear", "item": tarea(1)})
+
+    assert leer_remoto(estado, TAREAS) == [tarea(1)]
+    assert [p[2] for p in estado.peticiones if p[0] == "PUT"] == [409, 409, 200]
@@ -0,0 +1,116 @@
+"""Descarga del horario de Loyola por HTTP contra el portal falso (herramientas/loyola_falso.py)."""
+import http.cookiejar
+import os
+from datetime import date
+
+import pytest
+import requests
+
+import app
+from loyola_falso import FIXTURES
+
+LUNES = date(2026, 10, 12)
+
+
+def clase(fecha, hora, asignatura, aula):
+    return {"asignatura": asignatura, "titulo": asignatura, "aula": aula, "fecha": fecha, "hora": hora, "dia_completo": False}
+
+
+# La semana tipo de fixtures/loyola_eventos.json vista por el grupo A
+SEMANA_GRUPO_A = [
+    clase("2026-10-12", "09:00 - 10:30", "Inteligencia Artificial", "1.04"),
+    clase("2026-10-12", "10:30 - 12:00", "Bases de Datos", "1.04"),
+    clase("2026-10-12", "12:30 - 14:00", "Cálculo II", "2.11"),
+    clase("2026-10-13", "09:00 - 10:30", "Redes de Computadores", "Lab 3"),
+    clase("2026-10-13", "10:30 - 12:00", "Inteligencia Artificial", "Lab 1"),
+    clase("2026-10-13", "15:00 - 16:30", "Ética y Sociedad", "0.02"),
+    clase("2026-10-14", "09:00 - 10:30", "Bases de Datos", "Lab 2"),
+    clase("2026-10-14", "10:30 - 12:00", "Cálculo II", "2.11"),
+    clase("2026-10-15", "09:00 - 10:30", "Redes de Computadores", "1.07"),
+    clase("2026-10-15", "12:30 - 14:00", "Inteligencia Artificial", "1.04"),
+    clase("2026-10-16", "09:00 - 11:00", "Tutoría de grupo", "Desconocido"),
+    clase("2026-10-16", "11:30 - 13:30", "Prácticas de Bases de Datos", "Lab 2"),
+]
+
+
+def posts(estado):
+    return [p for p in estado.peticiones if p[0] == "POST"]
+
+
+def test_semana_con_zona_horaria(portal_loyola):
+    url, estado = portal_loyola()
+    assert app.obtener_clases_http(url, desde=LUNES, semanas=1) == SEMANA_GRUPO_A
+    assert len(posts(estado)) == 1
+
+
+def test_respuesta_guardada_servida_en_local(portal_loyola):
+    # Respuesta AJAX grabada (horas sin zona, como las da el portal real) para la semana del 12/10/2026
+    with open(os.path.join(FIXTURES, "loyola_respuesta.xml"), encoding="utf-8") as f:
+        url, _ = portal_loyola(respuesta_ajax=f.read())
+    assert app.obtener_clases_http(url, desde=LUNES, semanas=1) == SEMANA_GRUPO_A
+
+
+def test_horas_sin_zona_llevan_el_desfase_de_una_hora(portal_loyola):
+    url, _ = portal_loyola(sin_zona=True)
+    assert app.obtener_clases_http(url, desde=LUNES, semanas=1) == SEMANA_GRUPO_A
+
+
+def test_primefaces_antiguo_pide_el_rango_en_milisegundos(portal_loyola):
+    url, estado = portal_loyola()
+    estado.pagina = estado.pagina.replace("v=12.0.0", "v=8.0")
+    assert app.obtener_clases_http(url, desde=LUNES, semanas=1) == SEMANA_GRUPO_A
+
+
+def test_semanas_seguidas_en_un_solo_post_y_huecos_en_otro(portal_loyola):
+    url, estado = portal_loyola()
+    semanas = [LUNES, date(2026, 10, 19), date(2026, 11, 2)]
+
+    por_semana = app.obtener_semanas_http(url, semanas)
+
+    assert sorted(por_semana) == semanas
+    assert all(len(clases) == len(SEMANA_GRUPO_A) for clases in por_semana.values())
+    assert por_semana[date(2026, 11, 2)][0] == clase("2026-11-02", "09:00 - 10:30", "Inteligencia Artificial", "1.04")
+    assert len(posts(estado)) == 2
+
+
+def test_eventos_en_utc_y_cambio_de_hora():
+    eventos = [
+        {"title": "Verano / Aula: 1.01", "start": "2026-10-23T07:00:00Z", "end": "2026-10-23T08:30:00Z"},
+        {"title": "Invierno / Aula: 1.01", "start": "2026-10-26T08:00:00Z", "end": "2026-10-26T09:30:00Z"},
+        {"title": "Festivo", "start": "2026-10-27T00:00:00+01:00", "allDay": True},
+        {"title": "Roto", "start": "ayer"},
+    ]
+    assert app.clases_desde_eventos(eventos) == [
+        clase("2026-10-23", "09:00 - 10:30", "Verano", "1.01"),
+        clase("2026-10-26", "09:00 - 10:30", "Invierno", "1.01"),
+        {"asignatura": "Festivo", "titulo": "Festivo", "aula": "Desconocido", "fecha": "2026-10-27", "hora": None, "dia_completo": True},
+    ]
+
+
+def test_vista_caducada_sin_cookie_de_sesion(portal_loyola):
+    url, _ = portal_loyola()
+    sesion = requests.Session()
+    sesion.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))  # Sin JSESSIONID
+    with pytest.raises(app.HorarioHttpError, match="<error>"):
+        app.obtener_clases_http(url, desde=LUNES, semanas=1, sesion=sesion)
+
+
+@pytest.mark.parametrize("respuesta, mensaje", [
+    ('<?xml version="1.0" encoding="UTF-8"?><partial-response><redirect url="/LoyolaHorario/login.xhtml"/></partial-response>', "<redirect>"),
+    ('<?xml version="1.0" encoding="UTF-8"?><partial-response><error><error-name>java.lang.NullPointerException</error-name>'
+     '<error-message><![CDATA[]]></error-message></error></partial-response>', "<error>"),
+    ('<?xml version="1.0" encoding="UTF-8"?><partial-response><changes><update id="otro"><![CDATA[<div/>]]></update></changes></partial-response>',
+     "no incluye los eventos"),
+    ("<html><body>Error 500</body></html", "no válida"),
+])
+def test_respuestas_ajax_inesperadas(portal_loyola, respuesta, mensaje):
+    url, _ = portal_loyola(respuesta_ajax=respuesta)
+    with pytest.raises(app.HorarioHttpError, match=mensaje):
+        app.obtener_clases_http(url, desde=LUNES, semanas=1)
+
+
+def test_pagina_sin_calendario(portal_loyola):
+    url, estado = portal_loyola(pagina="<html><body><form id='login' action='/login'></form></body></html>")
+    with pytest.raises(app.HorarioHttpError, match="No se encontró el calendario"):
+        app.obtener_clases_http(url, desde=LUNES, semanas=1)
+    assert posts(estado) == []
@@ -0,0 +1,66 @@
+"""Actualización incremental del horario por semanas (actualizar_horario_clases) contra el portal falso."""
+import json
+import os
+from datetime import date
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def actualizar(portal_loyola, tmp_path, monkeypatch):
+    """actualizar(hoy) -> (clases, cambios), con los archivos del horario en un directorio temporal."""
+    monkeypatch.chdir(tmp_path)
+    url, estado = portal_loyola()
+    monkeypatch.setenv("LOYOLA_URL", url)
+
+    def correr(hoy):
+        monkeypatch.setattr(app, "get_madrid_date", lambda: hoy)
+        clases = app.actualizar_horario_clases(force=True)
+        return clases, app.metricas_scraper()["cambios"]
+
+    correr.portal = estado
+    return correr
+
+
+def semanas(clases):
+    return sorted({app.lunes_de(date.fromisoformat(c["fecha"])) for c in clases})
+
+
+def test_cambio_de_semana_no_da_cambios_falsos(actualizar):
+    actualizar(date(2026, 10, 14))
+
+    clases, cambios = actualizar(date(2026, 10, 21))
+
+    # Sale la semana del 12/10 y entra la del 4/1: ninguna de las dos es un cambio del horario
+    assert cambios == {"añadidas": [], "eliminadas": [], "movidas": []}
+    assert semanas(clases)[0] == date(2026, 10, 19)
+    assert semanas(clases)[-1] == date(2027, 1, 4)
+    with open(app.HORARIO_FILE, encoding="utf-8") as f:
+        assert json.load(f) == clases
+
+
+def test_semanas_sin_cambios_no_reescriben_el_archivo(actualizar):
+    primeras, _ = actualizar(date(2026, 10, 14))
+    os.utime(app.HORARIO_FILE, ns=(0, 0))
+
+    clases, cambios = actualizar(date(2026, 10, 15))
+
+    assert clases == primeras
+    assert cambios == {"añadidas": [], "eliminadas": [], "movidas": []}
+    assert os.stat(app.HORARIO_FILE).st_mtime_ns == 0
+
+
+def test_clase_movida_en_semanas_volatiles(actualizar):
+    actualizar(date(2026, 10, 14))
+    primera = dict(actualizar.portal.semana_tipo[0], inicio="16:00", fin="17:30")
+    actualizar.portal.semana_tipo[0] = primera
+
+    clases, cambios = actualizar(date(2026, 10, 15))
+
+    # Solo se vuelven a pedir las semanas volátiles: la clase se mueve en esas dos y no en las demás
+    assert [despues["fecha"] for _, despues in cambios["movidas"]] == ["2026-10-12", "2026-10-19"]
+    assert all(antes["hora"] != despues["hora"] for antes, despues in cambios["movidas"])
+    assert cambios["añadidas"] == cambios["eliminadas"] == []
+    assert len(clases) == 12 * 12
@@ -0,0 +1,41 @@
+"""Cada petición a la API de GitHub queda registrada como una llamada en metricas_github()."""
+import json
+
+import app
+from conftest import leer_remoto
+
+
+def llamadas_registradas():
+    return app.metricas_github().resumen()["llamadas"]
+
+
+def test_una_medida_por_peticion_en_lecturas_y_lotes(github):
+    repo, estado = github
+    estado.escribir_directo(app.FILE_PATH, json.dumps([{"id": 1}]))
+    antes_metricas, antes_peticiones = llamadas_registradas(), len(estado.peticiones)
+
+    app.leer_json_github(repo, app.FILE_PATH)  # Contents API
+    app._cache_archivos_github().clear()  # El lote tendrá que bajar los blobs
+    app.escribir_lote_github(repo, {
+        app.FILE_PATH: lambda d: d + [{"id": 2}],
+        app.HORARIO_DINAMICO_FILE: lambda d: d + [{"id": 3}],
+    }, "lote")
+    estado.conflictos_forzados = 1  # ref.edit rechazado una vez: el lote se repite entero
+    app.escribir_lote_github(repo, {app.FILE_PATH: lambda d: d + [{"id": 4}]}, "lote con conflicto")
+
+    assert [t["id"] for t in leer_remoto(estado, app.FILE_PATH)] == [1, 2, 4]
+    peticiones = len(estado.peticiones) - antes_peticiones
+    assert peticiones >= 20
+    assert llamadas_registradas() - antes_metricas == peticiones
+
+
+def test_errores_por_llamada(github):
+    repo, estado = github
+    antes = app.metricas_github().resumen()["errores"]
+    estado.conflictos_forzados = 1
+
+    app.escribir_lote_github(repo, {app.FILE_PATH: lambda d: d + [{"id": 1}]}, "lote")
+
+    resumen = app.metricas_github().resumen()
+    assert resumen["errores"] - antes == 1
+    assert [op for _, op, _, _, error in resumen["ultimas"] if error] == ["avanzar la rama"]
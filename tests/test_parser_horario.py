@@ -0,0 +1,77 @@
+"""Parseo de capturas del horario (parsear_horario) en cada uno de sus formatos, sin red."""
+import json
+import os
+from datetime import date, timedelta
+
+import app
+from loyola_falso import FIXTURES
+from test_horario_http import SEMANA_GRUPO_A, clase
+
+
+def fixture(nombre):
+    with open(os.path.join(FIXTURES, nombre), encoding="utf-8") as f:
+        return f.read()
+
+
+def en_semana(clases, lunes):
+    """Las clases de SEMANA_GRUPO_A (semana del 12/10/2026) llevadas a la semana de lunes."""
+    salto = lunes - date(2026, 10, 12)
+    return [dict(c, fecha=str(date.fromisoformat(c["fecha"]) + salto)) for c in clases]
+
+
+def test_html_renderizado_guardado():
+    # Horas pintadas una hora antes (8:00 - 9:30): el parser aplica DESFASE_HORARIO_LOYOLA
+    assert app.parsear_horario(fixture("loyola_semana.html")) == en_semana(SEMANA_GRUPO_A, date(2026, 10, 19))
+
+
+def test_html_sin_hora_ni_titulo_usa_el_texto_del_evento():
+    html = """
+    <table><tr><td data-date="2026-10-14"><div class="fc-timegrid-col-events">
+      <a class="fc-event"><div>8:00 - 9:30</div><div>Cálculo II / Aula: 2.11</div></a>
+      <a class="fc-event"><div class="fc-event-time">10:00 - 11:30<br></div><div class="fc-event-title">Redes</div></a>
+    </div></td></tr></table>
+    """
+    assert app.parsear_horario(html) == [
+        clase("2026-10-14", "09:00 - 10:30", "Cálculo II", "2.11"),
+        clase("2026-10-14", "11:00 - 12:30", "Redes", "Desconocido"),
+    ]
+
+
+def test_html_sin_eventos():
+    assert app.parsear_horario("<html><body><div class='fc-view-harness'></div></body></html>") == []
+
+
+def test_respuesta_ajax_de_jsf():
+    assert app.parsear_horario(fixture("loyola_respuesta.xml")) == SEMANA_GRUPO_A
+
+
+def test_json_de_fullcalendar_como_objeto_y_como_lista():
+    eventos = [
+        {"title": "Bases de Datos / Aula: Lab 2", "start": "2026-10-14T09:00:00+02:00", "end": "2026-10-14T10:30:00+02:00"},
+        {"title": "Cálculo II / Aula: 2.11", "start": "2026-10-14T09:30:00", "end": "2026-10-14T11:00:00"},
+        {"title": "Festivo", "start": "2026-10-12", "allDay": True},
+        {"title": "Sin inicio"},
+    ]
+    esperadas = [
+        {"asignatura": "Festivo", "titulo": "Festivo", "aula": "Desconocido", "fecha": "2026-10-12", "hora": None, "dia_completo": True},
+        clase("2026-10-14", "09:00 - 10:30", "Bases de Datos", "Lab 2"),
+        clase("2026-10-14", "10:30 - 12:00", "Cálculo II", "2.11"),
+    ]
+    assert app.parsear_horario(json.dumps({"events": eventos})) == esperadas
+    assert app.parsear_horario(json.dumps(eventos)) == esperadas
+
+
+def test_json_del_dom_del_navegador():
+    # Forma de lo que devuelve _JS_EXTRAER_SEMANA: la fecha sale de la columna bajo el centro del evento
+    semana = {
+        "columnas": [{"x": 100 + 150 * i, "ancho": 150, "fecha": str(date(2026, 10, 12) + timedelta(days=i))} for i in range(5)],
+        "eventos": [
+            {"x": 102, "ancho": 146, "hora": "8:00 - 9:30", "titulo": "Inteligencia Artificial / Aula: 1.04", "texto": ""},
+            {"x": 402, "ancho": 146, "hora": None, "titulo": None, "texto": "8:00 - 9:30\nBases de Datos / Aula: Lab 2"},
+            {"x": 900, "ancho": 146, "hora": "8:00 - 9:30", "titulo": "Fuera de la semana", "texto": ""},
+        ],
+    }
+    assert app.parsear_horario(json.dumps(semana)) == [
+        clase("2026-10-12", "09:00 - 10:30", "Inteligencia Artificial", "1.04"),
+        clase("2026-10-14", "09:00 - 10:30", "Bases de Datos", "Lab 2"),
+    ]
@@ -0,0 +1,67 @@
+"""El WAL local cubre también el histórico y las marcas: un cierre brusco no pierde tareas archivadas."""
+import json
+import math
+
+import pytest
+
+import app
+from conftest import leer_remoto
+
+
+@pytest.fixture
+def conectado(github, tmp_path, monkeypatch):
+    """(estado del repo falso, fábrica de AlmacenGitHub con el respaldo en tmp_path)."""
+    repo, estado = github
+    monkeypatch.setenv("GITHUB_TOKEN", "falso")
+    monkeypatch.setenv("GITHUB_API_URL", repo.requester.base_url)
+    rutas = (str(tmp_path / "snapshot.json"), str(tmp_path / "wal.jsonl"))
+
+    def almacen(sin_red=False):
+        # Un almacén nuevo con el respaldo releído de disco es lo que ve el proceso tras reiniciar
+        a = app.AlmacenGitHub(respaldo=app.RespaldoLocal(*rutas))
+        if sin_red:
+            a.sin_red_hasta = math.inf
+        return a
+
+    yield estado, almacen
+    app.cola_escritura().vaciar()
+
+
+def tarea(id_, fecha):
+    return {"id": id_, "titulo": f"Tarea {id_}", "fecha": fecha, "fecha_fin": None, "estado": "Completada"}
+
+
+def test_archivar_sin_red_se_reenvia_completo_tras_reiniciar(conectado):
+    estado, almacen = conectado
+    tareas = [tarea(1, "2026-08-03"), tarea(2, "2026-09-10"), tarea(3, "2026-10-20")]
+    estado.escribir_directo(app.FILE_PATH, json.dumps(tareas))
+
+    # Se archiva y el proceso muere antes de llegar a GitHub: solo queda el WAL
+    sin_red = almacen(sin_red=True)
+    sin_red.archivar(tareas[:2])
+    sin_red.guardar_marca(app.MARCA_LIMPIEZA, "2026-10-17")
+    assert [t["id"] for t in sin_red.leer("tareas")] == []  # Sin snapshot aún: solo lo del WAL
+    assert leer_remoto(estado, app.FILE_PATH) == tareas
+
+    reiniciado = almacen()
+    assert [t["id"] for t in reiniciado.leer("tareas")] == [3]  # La lectura reenvía el WAL
+    app.cola_escritura().vaciar()
+
+    assert leer_remoto(estado, app.FILE_PATH) == [tareas[2]]
+    assert leer_remoto(estado, app.ruta_historico("2026-08")) == [tareas[0]]
+    assert leer_remoto(estado, app.ruta_historico("2026-09")) == [tareas[1]]
+    assert leer_remoto(estado, app.MARCAS_FILE) == [{"id": app.MARCA_LIMPIEZA, "valor": "2026-10-17"}]
+    assert almacen().respaldo.entradas == []  # Confirmado: el WAL queda vacío
+
+
+def test_altas_del_historico_van_antes_que_los_borrados_en_el_wal(conectado):
+    _, almacen = conectado
+    sin_red = almacen(sin_red=True)
+
+    sin_red.archivar([tarea(1, "2026-08-03")])
+
+    entradas = almacen(sin_red=True).respaldo.entradas
+    assert [(e["coleccion"], e.get("ruta"), e["op"]["accion"]) for e in entradas] == [
+        (None, app.ruta_historico("2026-08"), "crear"),
+        ("tareas", None, "borrar"),
+    ]